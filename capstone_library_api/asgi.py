@@ -8,8 +8,27 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
 import os
+from channels.routing import ProtocolTypeRouter, URLRouter
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from django.core.asgi import get_asgi_application
+from django.core.exceptions import ImproperlyConfigured
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'capstone_library_api.settings')
+os.environ.setdefault('SERVE_ASGI', 'true')
 
-application = get_asgi_application()
+# Set up Django before importing anything that touches models
+django_application = get_asgi_application()
+
+from library.checks import check_shared_backends  # noqa: E402
+from library.routing import websocket_urlpatterns  # noqa: E402
+
+# Several workers on local-memory backends would each see their own state
+errors = check_shared_backends()
+if errors:
+    raise ImproperlyConfigured('\n'.join(f'{error.msg} {error.hint}' for error in errors))
+
+application = ProtocolTypeRouter({
+    # Static files are served here because WhiteNoise is dropped under ASGI
+    'http': ASGIStaticFilesHandler(django_application),
+    'websocket': URLRouter(websocket_urlpatterns),
+})
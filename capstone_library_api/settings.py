@@ -1,6 +1,6 @@
 from pathlib import Path
 import os
-from decouple import config
+from decouple import Csv, config
 import dj_database_url
 from dotenv import load_dotenv
 
@@ -31,12 +31,15 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework.authtoken',
     'django_filters',
+    'channels',
 
     # Local
     'library',
 ]
 
 MIDDLEWARE = [
+    'library.metrics.MetricsMiddleware',
+    'library.db_routers.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -47,6 +50,12 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Set by asgi.py. WhiteNoise is sync-only and would push every async request
+# through a thread, so under ASGI static files are served by asgi.py instead.
+SERVE_ASGI = config('SERVE_ASGI', default=False, cast=bool)
+if SERVE_ASGI:
+    MIDDLEWARE.remove('whitenoise.middleware.WhiteNoiseMiddleware')
+
 ROOT_URLCONF = 'capstone_library_api.urls'
 
 TEMPLATES = [
@@ -67,6 +76,37 @@ TEMPLATES = [
 WSGI_APPLICATION = 'capstone_library_api.wsgi.application'
 ASGI_APPLICATION = 'capstone_library_api.asgi.application'
 
+# WebSocket availability updates. The in-memory layer only reaches
+# subscribers in the same process; point CHANNEL_LAYERS at a shared
+# backend when running several ASGI workers.
+CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+# Worker processes the Procfile starts. More than one needs a shared cache
+# and channel layer; asgi.py refuses to start otherwise (library.E001).
+WEB_CONCURRENCY = config('WEB_CONCURRENCY', default=1, cast=int)
+LIBRARY_AVAILABILITY_TICK = config('LIBRARY_AVAILABILITY_TICK', default=0.1, cast=float)
+
+# Seconds a copy freed for the next hold in line is kept for that user
+# before `expire_holds` passes it on.
+LIBRARY_HOLD_TTL = config('LIBRARY_HOLD_TTL', default=48 * 3600, cast=int)
+
+# Days a loan may stay open before `sweep_loans` flags it overdue.
+LIBRARY_LOAN_PERIOD_DAYS = config('LIBRARY_LOAN_PERIOD_DAYS', default=14, cast=int)
+
+# Seconds of changes a /api/books/changes/ sync repeats, to catch
+# transactions that committed late (and replica lag, with replicas).
+LIBRARY_SYNC_OVERLAP = config('LIBRARY_SYNC_OVERLAP', default=60, cast=int)
+
+# Seconds the staff top-books ranking may be served from cache.
+LIBRARY_ANALYTICS_CACHE_TTL = config('LIBRARY_ANALYTICS_CACHE_TTL', default=60, cast=int)
+
+# Idempotency-Key: seconds a stored response is replayed for, seconds a
+# first request may hold its key before a duplicate may run again, and the
+# largest response body (bytes) kept for replay.
+LIBRARY_IDEMPOTENCY_TTL = config('LIBRARY_IDEMPOTENCY_TTL', default=24 * 3600, cast=int)
+LIBRARY_IDEMPOTENCY_LOCK_TIMEOUT = config('LIBRARY_IDEMPOTENCY_LOCK_TIMEOUT', default=60, cast=int)
+LIBRARY_IDEMPOTENCY_MAX_BYTES = config('LIBRARY_IDEMPOTENCY_MAX_BYTES', default=64 * 1024, cast=int)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
@@ -79,9 +119,119 @@ if DATABASE_URL:
     DATABASES['default'] = dj_database_url.config(
         default=DATABASE_URL,
         conn_max_age=600,
-        ssl_require=True
+        ssl_require=DATABASE_URL.startswith('postgres'),
     )
 
+# Read replicas, as comma-separated database URLs. Safe-method requests
+# read from one of them unless the caller wrote in the last
+# LIBRARY_REPLICA_PIN_SECONDS; see library/db_routers.py.
+DATABASE_REPLICA_URLS = config('DATABASE_REPLICA_URLS', default='', cast=Csv())
+DATABASE_REPLICAS = []
+for index, url in enumerate(DATABASE_REPLICA_URLS, start=1):
+    DATABASES[f'replica{index}'] = {
+        **dj_database_url.parse(url, conn_max_age=600, ssl_require=url.startswith('postgres')),
+        # Tests read the replicas' data from the test primary
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{index}')
+DATABASE_ROUTERS = ['library.db_routers.ReplicaRouter']
+LIBRARY_REPLICA_PIN_SECONDS = config('LIBRARY_REPLICA_PIN_SECONDS', default=5, cast=int)
+
+# SQLite set up for several workers: a writer waits up to
+# LIBRARY_SQLITE_BUSY_TIMEOUT ms for the lock, and transactions take the
+# write lock when they begin (IMMEDIATE), so none fails half-way upgrading
+# a read lock. LIBRARY_SQLITE_TUNED=False keeps SQLite's defaults.
+# LIBRARY_SQLITE_WAL=True also lets reads run alongside the writer; it is
+# opt-in because WAL mode is written into the database file itself, which
+# would rewrite the committed development database.
+LIBRARY_SQLITE_TUNED = config('LIBRARY_SQLITE_TUNED', default=True, cast=bool)
+LIBRARY_SQLITE_WAL = config('LIBRARY_SQLITE_WAL', default=False, cast=bool)
+LIBRARY_SQLITE_BUSY_TIMEOUT = config('LIBRARY_SQLITE_BUSY_TIMEOUT', default=5000, cast=int)
+LIBRARY_SQLITE_MMAP_SIZE = config('LIBRARY_SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int)
+# Times a borrow, return or hold transaction that still lost the lock is
+# re-run (see library/db_retry.py); 0 turns retries off.
+LIBRARY_DB_LOCK_RETRIES = config('LIBRARY_DB_LOCK_RETRIES', default=3, cast=int)
+
+# PostgreSQL: DATABASE_POOL=True swaps per-worker persistent connections for
+# Django's psycopg 3 connection pool, checked before each checkout.
+DATABASE_POOL = config('DATABASE_POOL', default=False, cast=bool)
+DATABASE_POOL_MIN_SIZE = config('DATABASE_POOL_MIN_SIZE', default=2, cast=int)
+DATABASE_POOL_MAX_SIZE = config('DATABASE_POOL_MAX_SIZE', default=10, cast=int)
+# Seconds a request waits for a free pooled connection before failing
+DATABASE_POOL_TIMEOUT = config('DATABASE_POOL_TIMEOUT', default=10, cast=int)
+
+for database in DATABASES.values():
+    if database['ENGINE'] == 'django.db.backends.sqlite3' and LIBRARY_SQLITE_TUNED:
+        database.setdefault('OPTIONS', {}).update({
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                ('PRAGMA journal_mode=WAL;PRAGMA synchronous=NORMAL;' if LIBRARY_SQLITE_WAL else '')
+                + f'PRAGMA busy_timeout={LIBRARY_SQLITE_BUSY_TIMEOUT};'
+                f'PRAGMA mmap_size={LIBRARY_SQLITE_MMAP_SIZE};'
+            ),
+        })
+    elif database['ENGINE'] == 'django.db.backends.postgresql':
+        if DATABASE_POOL:
+            from psycopg_pool import ConnectionPool
+
+            # Pooled connections are returned after every request instead
+            database['CONN_MAX_AGE'] = 0
+            database.setdefault('OPTIONS', {})['pool'] = {
+                'min_size': DATABASE_POOL_MIN_SIZE,
+                'max_size': DATABASE_POOL_MAX_SIZE,
+                'timeout': DATABASE_POOL_TIMEOUT,
+                'check': ConnectionPool.check_connection,
+            }
+        else:
+            # A persistent connection that died while idle is replaced, not used
+            database['CONN_HEALTH_CHECKS'] = True
+
+# Local memory by default; set CACHE_FILE_PATH to share the cache (and the
+# catalog version it holds) between gunicorn workers on one host.
+# CACHE_MAX_ENTRIES is well above Django's default of 300, which one bulk
+# availability lookup (an entry per ISBN) would otherwise churn through.
+CACHE_MAX_ENTRIES = config('CACHE_MAX_ENTRIES', default=50_000, cast=int)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': CACHE_MAX_ENTRIES},
+    }
+}
+CACHE_FILE_PATH = config('CACHE_FILE_PATH', default=None)
+if CACHE_FILE_PATH:
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_FILE_PATH,
+        'OPTIONS': {'MAX_ENTRIES': CACHE_MAX_ENTRIES},
+    }
+
+# Seconds a cached catalog response may live; entries are invalidated
+# earlier by the catalog version bump on any write.
+LIBRARY_RESPONSE_CACHE_TTL = config('LIBRARY_RESPONSE_CACHE_TTL', default=300, cast=int)
+
+# Seconds an ISBN's availability may be served from the cache by the bulk
+# lookup (0 disables it); borrows and returns invalidate it earlier via the
+# catalog version. LIBRARY_AVAILABILITY_MAX_ISBNS caps ISBNs per request.
+LIBRARY_AVAILABILITY_CACHE_TTL = config('LIBRARY_AVAILABILITY_CACHE_TTL', default=30, cast=int)
+LIBRARY_AVAILABILITY_MAX_ISBNS = config('LIBRARY_AVAILABILITY_MAX_ISBNS', default=1000, cast=int)
+
+# In-process cache of authenticated tokens. Turn on LIBRARY_AUTH_CACHE_SHARED
+# (with a shared cache backend) so revocations reach every worker at once.
+LIBRARY_AUTH_CACHE_SIZE = config('LIBRARY_AUTH_CACHE_SIZE', default=1024, cast=int)
+LIBRARY_AUTH_CACHE_TTL = config('LIBRARY_AUTH_CACHE_TTL', default=60, cast=int)
+LIBRARY_AUTH_CACHE_SHARED = config('LIBRARY_AUTH_CACHE_SHARED', default=False, cast=bool)
+
+# Request metrics: /metrics is served to scrapers sending
+# "Authorization: Bearer <LIBRARY_METRICS_TOKEN>", to the addresses in
+# LIBRARY_METRICS_ALLOWED_IPS and to staff sessions. Requests slower
+# than LIBRARY_SLOW_REQUEST_MS are logged with their SQL (off when unset).
+# LIBRARY_BEHIND_PROXY (set by the Procfile) says the client address comes
+# from X-Forwarded-For, which can be forged, so the address list is ignored.
+LIBRARY_METRICS_TOKEN = config('LIBRARY_METRICS_TOKEN', default='')
+LIBRARY_METRICS_ALLOWED_IPS = config('LIBRARY_METRICS_ALLOWED_IPS', default='127.0.0.1,::1', cast=Csv())
+LIBRARY_BEHIND_PROXY = config('LIBRARY_BEHIND_PROXY', default=False, cast=bool)
+LIBRARY_SLOW_REQUEST_MS = config('LIBRARY_SLOW_REQUEST_MS', default=None, cast=lambda v: float(v) if v else None)
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -105,7 +255,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'library.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -115,6 +265,17 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'library.pagination.CustomPagination',
     'PAGE_SIZE': 10,
+    # orjson-backed JSON, only for clients that ask for it (see library/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': [
+        'library.renderers.ORJSONRenderer',
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'library.renderers.OptInContentNegotiation',
 }
+
+# Catalog search: 'auto' uses FTS5 on SQLite and tsvector on PostgreSQL,
+# 'icontains' falls back to DRF's SearchFilter.
+LIBRARY_SEARCH_BACKEND = config('LIBRARY_SEARCH_BACKEND', default='auto')
@@ -1,18 +1,26 @@
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from library import views as library_views
+from library import async_views, views as library_views
+from library.metrics import metrics_view
 
 # Create DRF router and register viewsets
 router = DefaultRouter()
 router.register(r'books', library_views.BookViewSet, basename='book')
 router.register(r'users', library_views.UserViewSet, basename='user')
 router.register(r'loans', library_views.LoanViewSet, basename='loan')
+router.register(r'holds', library_views.HoldViewSet, basename='hold')
+router.register(r'analytics', library_views.AnalyticsViewSet, basename='analytics')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include(router.urls)),  # All API endpoints
     path('api-auth/', include('rest_framework.urls')),  # DRF browsable API login/logout
+    path('metrics', metrics_view, name='metrics'),  # Prometheus scrape target
+    # Async read endpoints, for ASGI workers (see capstone_library_api/asgi.py)
+    path('api/async/books/', async_views.book_list, name='async-book-list'),
+    path('api/async/books/<int:pk>/', async_views.book_detail, name='async-book-detail'),
+    path('api/async/loans/', async_views.loan_list, name='async-loan-list'),
 ]
 
 # Optional: Add a simple root page
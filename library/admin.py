@@ -1,20 +1,124 @@
 from django.contrib import admin
-from .models import Book, User, BorrowRecord
+from django.contrib.admin.views.main import PAGE_VAR
+from django.db.models import Q
+
+from .models import ArchivedLoan, Book, Hold, Loan, User, BorrowRecord
+from .pagination import ChangelistPaginator
+from .search import matching_book_ids
+
+
+def prefix_match(field, text):
+    """Case-sensitive prefix match written as a range, which a plain B-tree index serves."""
+    return Q(**{f'{field}__gte': text, f'{field}__lt': text + '\U0010ffff'})
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """
+    Changelists for tables too large for the stock admin. Counts come
+    from ChangelistPaginator, told the page asked for so it can link the
+    next one, and the unfiltered total is never counted.
+    Searches only use indexes: `prefix_search_fields` match the start
+    of an indexed column, `user_search_field` the start of a username
+    and `book_search_field` the catalog search backend, instead of
+    `icontains` scans over every search field.
+    """
+    paginator = ChangelistPaginator
+    show_full_result_count = False
+    prefix_search_fields = ()
+    user_search_field = None
+    book_search_field = None
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        try:
+            page_number = int(request.GET.get(PAGE_VAR, 1))
+        except ValueError:
+            page_number = 1
+        return self.paginator(queryset, per_page, orphans, allow_empty_first_page, page_number=page_number)
+
+    def get_search_results(self, request, queryset, search_term):
+        text = search_term.strip()
+        if not text:
+            return queryset, False
+        match = Q()
+        for field in self.prefix_search_fields:
+            match |= prefix_match(field, text)
+        if self.user_search_field:
+            users = User.objects.filter(prefix_match('username', text)).values('pk')
+            match |= Q(**{f'{self.user_search_field}__in': users})
+        if self.book_search_field:
+            match |= Q(**{f'{self.book_search_field}__in': matching_book_ids(text)})
+        return queryset.filter(match), False
+
 
 @admin.register(Book)
-class BookAdmin(admin.ModelAdmin):
+class BookAdmin(ScalableAdmin):
     list_display = ('title', 'author', 'isbn', 'published_date', 'number_of_copies_available')
     search_fields = ('title', 'author', 'isbn')
+    search_help_text = "Words from the title or author, or the start of an ISBN."
+    book_search_field = 'pk'
+    prefix_search_fields = ('isbn',)
     list_filter = ('published_date',)
 
 @admin.register(User)
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(ScalableAdmin):
     list_display = ('username', 'email', 'date_of_membership', 'is_active')
     search_fields = ('username', 'email')
+    search_help_text = "The start of a username or email address (case-sensitive)."
+    prefix_search_fields = ('username', 'email')
     list_filter = ('is_active', 'date_of_membership')
 
 @admin.register(BorrowRecord)
-class BorrowRecordAdmin(admin.ModelAdmin):
+class BorrowRecordAdmin(ScalableAdmin):
     list_display = ('user', 'book', 'borrow_date', 'return_date')
+    list_select_related = ('user', 'book')
     search_fields = ('user__username', 'book__title')
+    search_help_text = "The start of a username, or words from a book's title or author."
+    user_search_field = 'user'
+    book_search_field = 'book'
     list_filter = ('borrow_date', 'return_date')
+    # Newest first along borrow_record_date_idx
+    ordering = ('-borrow_date', '-id')
+    # Forms would otherwise render every user and book as a <select> option
+    raw_id_fields = ('user', 'book')
+
+@admin.register(Loan)
+class LoanAdmin(ScalableAdmin):
+    list_display = ('id', 'user', 'book', 'loan_date', 'returned', 'overdue', 'return_date')
+    list_select_related = ('user', 'book')
+    search_fields = ('user__username', 'book__title')
+    search_help_text = "The start of a username, or words from a book's title or author."
+    user_search_field = 'user'
+    book_search_field = 'book'
+    list_filter = ('returned', 'overdue', 'loan_date')
+    # Newest first along loan_date_id_idx
+    ordering = ('-loan_date', '-id')
+    raw_id_fields = ('user', 'book')
+
+@admin.register(Hold)
+class HoldAdmin(ScalableAdmin):
+    list_display = ('user', 'book', 'status', 'created_at', 'expires_at')
+    list_select_related = ('user', 'book')
+    search_fields = ('user__username', 'book__title')
+    user_search_field = 'user'
+    book_search_field = 'book'
+    list_filter = ('status',)
+    raw_id_fields = ('user', 'book')
+
+@admin.register(ArchivedLoan)
+class ArchivedLoanAdmin(ScalableAdmin):
+    list_display = ('source_id', 'source', 'user', 'book', 'loan_date', 'return_date', 'overdue')
+    list_select_related = ('user', 'book')
+    search_fields = ('user__username', 'book__title')
+    search_help_text = "The start of a username, or words from a book's title or author."
+    user_search_field = 'user'
+    book_search_field = 'book'
+    list_filter = ('source', 'loan_date')
+    ordering = ('-loan_date', '-id')
+    raw_id_fields = ('user', 'book')
+
+    # Append-only history, written by sweep_loans
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,219 @@
+"""
+Pre-aggregated circulation statistics.
+
+Every borrow and return bumps two rollups inside its own transaction:
+per book per day and per user. Daily totals are summed from the per-book
+rows rather than kept in a row per day, which every borrow in the
+library would otherwise update. The staff analytics endpoints read only
+these small tables, so a top-N or a time series never aggregates the
+loan table. `rebuild()` recomputes them from loan history,
+live and archived, one primary-key chunk at a time.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ArchivedLoan, BookDailyStats, Loan, UserStats
+
+COUNTERS = ('borrows', 'returns')
+
+
+def _increment(model, keys, counters, **fields):
+    """Add `counters` to the row identified by `keys`, creating it if needed."""
+    changes = {name: F(name) + value for name, value in counters.items()}
+    if model.objects.filter(**keys).update(**changes, **fields):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **counters, **fields)
+    except IntegrityError:
+        # Another transaction created the row since our UPDATE
+        model.objects.filter(**keys).update(**changes, **fields)
+
+
+def record_borrow(user_id, book_id, when):
+    day = timezone.localdate(when)
+    _increment(BookDailyStats, {'book_id': book_id, 'day': day}, {'borrows': 1})
+    _increment(UserStats, {'user_id': user_id}, {'borrows': 1}, last_borrowed_at=when)
+
+
+def record_return(user_id, book_id, when):
+    day = timezone.localdate(when)
+    _increment(BookDailyStats, {'book_id': book_id, 'day': day}, {'returns': 1})
+    _increment(UserStats, {'user_id': user_id}, {'returns': 1})
+
+
+def _increment_books(book_ids, day, field):
+    """Add 1 to `field` of each book's row for `day`."""
+    keys = BookDailyStats.objects.filter(book_id__in=book_ids, day=day)
+    existing = set(keys.values_list('book_id', flat=True))
+    keys.update(**{field: F(field) + 1})
+    try:
+        with transaction.atomic():
+            BookDailyStats.objects.bulk_create(
+                BookDailyStats(book_id=book_id, day=day, **{field: 1})
+                for book_id in book_ids if book_id not in existing
+            )
+    except IntegrityError:
+        # Rows created concurrently; fall back to one at a time
+        for book_id in book_ids:
+            if book_id not in existing:
+                _increment(BookDailyStats, {'book_id': book_id, 'day': day}, {field: 1})
+
+
+def record_borrows(user_id, book_ids, when):
+    """`record_borrow` for several books borrowed together."""
+    if not book_ids:
+        return
+    day = timezone.localdate(when)
+    _increment_books(book_ids, day, 'borrows')
+    _increment(UserStats, {'user_id': user_id}, {'borrows': len(book_ids)}, last_borrowed_at=when)
+
+
+def record_returns(user_id, book_ids, when):
+    if not book_ids:
+        return
+    day = timezone.localdate(when)
+    _increment_books(book_ids, day, 'returns')
+    _increment(UserStats, {'user_id': user_id}, {'returns': len(book_ids)})
+
+
+def _merge(model, key_fields, rows):
+    """
+    Add `rows` ({key tuple: {field: value}}) into `model`: counters are
+    summed, `last_borrowed_at` keeps the latest value.
+    """
+    if not rows:
+        return
+    lookup = {f'{field}__in': {key[i] for key in rows} for i, field in enumerate(key_fields)}
+    existing = {tuple(getattr(obj, field) for field in key_fields): obj for obj in model.objects.filter(**lookup)}
+    created, updated, fields = [], [], set()
+    for key, values in rows.items():
+        fields.update(values)
+        obj = existing.get(key)
+        if obj is None:
+            created.append(model(**dict(zip(key_fields, key)), **values))
+            continue
+        for name, value in values.items():
+            current = getattr(obj, name)
+            if name in COUNTERS:
+                value += current
+            elif current is not None and (value is None or current > value):
+                value = current
+            setattr(obj, name, value)
+        updated.append(obj)
+    model.objects.bulk_create(created, batch_size=1000)
+    model.objects.bulk_update(updated, sorted(fields), batch_size=1000)
+
+
+def _merge_chunk(loans, until, returned):
+    book_days = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    for field, date_field, queryset in (
+        ('borrows', 'loan_date', loans),
+        ('returns', 'return_date', loans.filter(returned)),
+    ):
+        rows = queryset.annotate(day=TruncDate(date_field)).values('book_id', 'day').annotate(n=Count('id'))
+        for row in rows:
+            book_days[row['book_id'], row['day']][field] += row['n']
+
+    users = {
+        (row['user_id'],): {
+            'borrows': row['borrows'], 'returns': row['returns'], 'last_borrowed_at': row['last_borrowed_at'],
+        }
+        for row in loans.values('user_id').annotate(
+            borrows=Count('id'), returns=Count('id', filter=returned), last_borrowed_at=Max('loan_date'),
+        )
+    }
+
+    _merge(BookDailyStats, ('book_id', 'day'), book_days)
+    _merge(UserStats, ('user_id',), users)
+
+
+def rebuild(chunk_size=20_000):
+    """
+    Recompute every rollup from loan history, one transaction per chunk
+    of live, then archived, loans; yields (last_pk, loans) after each.
+    Loans and returns from after the start are left to the live counters,
+    so traffic can go on, but anything committed while the rollups are
+    being cleared, or archived during the rebuild, may be counted twice;
+    run it in a quiet moment if that matters.
+    """
+    with transaction.atomic():
+        for model in (BookDailyStats, UserStats):
+            model.objects.all().delete()
+    until = timezone.now()
+    history = (
+        (Loan.objects.filter(loan_date__lte=until), Q(returned=True, return_date__lte=until)),
+        # Archived loans are all returned; legacy borrow records never fed the rollups
+        (ArchivedLoan.objects.filter(source=ArchivedLoan.Source.LOAN, loan_date__lte=until),
+         Q(return_date__lte=until)),
+    )
+    for loans, returned in history:
+        after = 0
+        while True:
+            pks = list(loans.filter(pk__gt=after).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                break
+            with transaction.atomic():
+                _merge_chunk(loans.filter(pk__gt=after, pk__lte=pks[-1]), until, returned)
+            after = pks[-1]
+            yield after, len(pks)
+
+
+def top_books(days=30, limit=10):
+    """
+    The most borrowed books over the last `days` days. A window still
+    sums one row per active book and day, so results are cached for
+    LIBRARY_ANALYTICS_CACHE_TTL seconds.
+    """
+    today = timezone.localdate()
+    key = f'library:analytics:top-books:{today}:{days}:{limit}'
+    result = cache.get(key)
+    if result is None:
+        result = list(
+            BookDailyStats.objects.filter(day__gte=today - timedelta(days=days - 1))
+            .values('book_id', 'book__title', 'book__author')
+            .annotate(borrows=Sum('borrows'), returns=Sum('returns'))
+            .order_by('-borrows', 'book_id')[:limit]
+        )
+        cache.set(key, result, timeout=settings.LIBRARY_ANALYTICS_CACHE_TTL)
+    return result
+
+
+def daily_series(since, until, book_id=None):
+    """
+    Borrows and returns per day from `since` to `until`, zero-filled.
+    Library-wide totals sum every active book's row per day from the
+    (day, book, borrows, returns) index, and are cached like `top_books`.
+    """
+    key = f'library:analytics:daily:{since}:{until}'
+    found = cache.get(key) if book_id is None else None
+    if found is None:
+        stats = BookDailyStats.objects.filter(day__gte=since, day__lte=until)
+        if book_id is not None:
+            stats = stats.filter(book_id=book_id)
+        found = {
+            row['day']: row
+            for row in stats.values('day').annotate(borrows=Sum('borrows'), returns=Sum('returns')).order_by()
+        }
+        if book_id is None:
+            cache.set(key, found, timeout=settings.LIBRARY_ANALYTICS_CACHE_TTL)
+    series = []
+    day = since
+    while day <= until:
+        series.append(found.get(day) or {'day': day, 'borrows': 0, 'returns': 0})
+        day += timedelta(days=1)
+    return series
+
+
+def top_users(limit=10):
+    return list(
+        UserStats.objects.order_by('-borrows', 'user_id')
+        .values('user_id', 'user__username', 'borrows', 'returns', 'last_borrowed_at')[:limit]
+    )
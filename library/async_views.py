@@ -0,0 +1,121 @@
+"""
+Native async versions of the read-heavy endpoints, for ASGI workers.
+
+These are plain Django async views rather than DRF viewsets (DRF has no
+async request cycle): they authenticate with `aauthenticate`, query with
+the async ORM and reuse the DRF serializers, which only do CPU work on
+already-loaded rows. Payloads match their sync counterparts.
+"""
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .authentication import aauthenticate
+from .models import Book, Loan
+from .pagination import CustomPagination
+from .search import get_search_backend
+from .serializers import BookSerializer, LoanSerializer
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False)
+
+
+async def authenticate(request):
+    """
+    Return (user, error_response). Only token auth is used, as in the DRF
+    settings; request.user is avoided because its lazy session lookup
+    would hit the database synchronously.
+    """
+    try:
+        return await aauthenticate(request), None
+    except AuthenticationFailed as exc:
+        return None, json_response({"detail": str(exc.detail)}, status=401)
+
+
+def page_params(request):
+    """(page, page_size) from the query string, following CustomPagination."""
+    try:
+        page_size = min(int(request.GET['page_size']), CustomPagination.max_page_size)
+    except (KeyError, ValueError):
+        page_size = api_settings.PAGE_SIZE
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    return page, max(page_size, 1)
+
+
+async def paginated(request, queryset, serializer_class):
+    page, page_size = page_params(request)
+    count = await queryset.acount()
+    offset = (page - 1) * page_size
+    if offset and offset >= count:
+        return json_response({"detail": "Invalid page."}, status=404)
+    rows = [row async for row in queryset[offset:offset + page_size]]
+
+    url = request.build_absolute_uri()
+    next_url = replace_query_param(url, 'page', page + 1) if offset + page_size < count else None
+    if page == 1:
+        previous_url = None
+    elif page == 2:
+        previous_url = remove_query_param(url, 'page')
+    else:
+        previous_url = replace_query_param(url, 'page', page - 1)
+    return json_response({
+        'count': count,
+        'next': next_url,
+        'previous': previous_url,
+        'results': serializer_class(rows, many=True).data,
+    })
+
+
+class _SearchView:
+    search_fields = ['title', 'author', 'isbn']
+
+
+@require_GET
+async def book_list(request):
+    _, error = await authenticate(request)
+    if error:
+        return error
+
+    queryset = Book.objects.all()
+    for field in ('author', 'isbn'):
+        if request.GET.get(field):
+            queryset = queryset.filter(**{field: request.GET[field]})
+    text = request.GET.get(api_settings.SEARCH_PARAM, '')
+    if text.strip():
+        queryset = get_search_backend().search(queryset, text, _SearchView(), Request(request))
+    return await paginated(request, queryset, BookSerializer)
+
+
+@require_GET
+async def book_detail(request, pk):
+    _, error = await authenticate(request)
+    if error:
+        return error
+
+    try:
+        book = await Book.objects.aget(pk=pk)
+    except Book.DoesNotExist:
+        return json_response({"detail": "No Book matches the given query."}, status=404)
+    return json_response(BookSerializer(book).data)
+
+
+@require_GET
+async def loan_list(request):
+    user, error = await authenticate(request)
+    if error:
+        return error
+    if user is None:
+        return json_response({"detail": "Authentication credentials were not provided."}, status=401)
+
+    loans = Loan.objects.select_related('user', 'book').order_by('-loan_date', '-id')
+    if not user.is_staff:
+        loans = loans.filter(user=user)
+    return await paginated(request, loans, LoanSerializer)
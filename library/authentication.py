@@ -0,0 +1,156 @@
+"""
+Token authentication with an in-process LRU in front of the Token/User
+lookup, and optionally the shared Django cache behind it.
+
+Entries are dropped when a token is deleted or when a user's
+`is_active`, `active_status` or `is_staff` changes (see signals.py).
+With LIBRARY_AUTH_CACHE_SHARED on, those invalidations also bump an
+epoch in the shared cache that every worker checks on a local hit, so
+revocation is seen by all workers on their next request; without it,
+other workers may serve a revoked token until LIBRARY_AUTH_CACHE_TTL.
+
+The invalidations hang off model signals, which queryset `.update()` and
+`bulk_update()` do not send: after e.g.
+`User.objects.filter(...).update(is_active=False)` the users keep access
+until their entries expire, unless the caller follows up with
+`invalidate_tokens(Token.objects.filter(user__in=...).values_list('key', flat=True))`.
+"""
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+EPOCH_KEY = 'library:auth:epoch'
+INVALIDATING_FIELDS = {'is_active', 'active_status', 'is_staff', 'password'}
+
+
+def shared_key(token_key):
+    return f'library:auth:token:{token_key}'
+
+
+class TokenLRU:
+    """Bounded, thread-safe LRU of token key -> (user, token) with a TTL."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, epoch=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, entry_epoch, value = entry
+            if expires < time.monotonic() or entry_epoch != epoch:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, epoch=None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, epoch, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def discard_user(self, user_id):
+        with self._lock:
+            for key in [k for k, (_, _, (user, _)) in self._entries.items() if user.pk == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenLRU(settings.LIBRARY_AUTH_CACHE_SIZE, settings.LIBRARY_AUTH_CACHE_TTL)
+
+
+def invalidate_tokens(token_keys, user_id=None):
+    """Forget cached credentials in this worker and, if shared, in every worker."""
+    token_keys = list(token_keys)
+    for key in token_keys:
+        token_cache.discard(key)
+    if user_id is not None:
+        token_cache.discard_user(user_id)
+    if settings.LIBRARY_AUTH_CACHE_SHARED:
+        cache.delete_many([shared_key(key) for key in token_keys])
+        try:
+            cache.incr(EPOCH_KEY)
+        except ValueError:
+            cache.add(EPOCH_KEY, 1, timeout=None)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Drop-in replacement for TokenAuthentication that skips the
+    Token + User query for recently seen tokens.
+    """
+
+    def authenticate_credentials(self, key):
+        shared = settings.LIBRARY_AUTH_CACHE_SHARED
+        epoch = cache.get(EPOCH_KEY, 0) if shared else None
+
+        credentials = token_cache.get(key, epoch)
+        if credentials is None and shared:
+            credentials = cache.get(shared_key(key))
+        if credentials is None:
+            credentials = super().authenticate_credentials(key)
+            if shared:
+                cache.set(shared_key(key), credentials, timeout=settings.LIBRARY_AUTH_CACHE_TTL)
+        token_cache.set(key, credentials, epoch)
+
+        user, token = credentials
+        if not user.is_active:
+            # A stale shared entry can still carry an inactive user
+            raise AuthenticationFailed('User inactive or deleted.')
+        return credentials
+
+
+async def aauthenticate(request):
+    """
+    Async counterpart of CachedTokenAuthentication for plain Django async
+    views. Returns the user, or None when no token was sent; raises
+    AuthenticationFailed for a bad or inactive token.
+    """
+    auth = get_authorization_header(request).split()
+    if not auth or auth[0].lower() != b'token':
+        return None
+    if len(auth) != 2:
+        raise AuthenticationFailed('Invalid token header.')
+    return await aauthenticate_credentials(auth[1].decode(errors='replace'))
+
+
+async def aauthenticate_credentials(key):
+    """Return the active user owning token `key`, through the same caches."""
+    shared = settings.LIBRARY_AUTH_CACHE_SHARED
+    epoch = await cache.aget(EPOCH_KEY, 0) if shared else None
+    credentials = token_cache.get(key, epoch)
+    if credentials is None and shared:
+        credentials = await cache.aget(shared_key(key))
+    if credentials is None:
+        try:
+            token = await Token.objects.select_related('user').aget(key=key)
+        except Token.DoesNotExist:
+            raise AuthenticationFailed('Invalid token.')
+        credentials = (token.user, token)
+        if shared:
+            await cache.aset(shared_key(key), credentials, timeout=settings.LIBRARY_AUTH_CACHE_TTL)
+    token_cache.set(key, credentials, epoch)
+
+    user = credentials[0]
+    if not user.is_active:
+        raise AuthenticationFailed('User inactive or deleted.')
+    return user
@@ -0,0 +1,156 @@
+"""
+Push book availability changes to WebSocket subscribers.
+
+Borrows, returns and book saves call `availability_changed()`, which
+records the book once the transaction commits. Changes are coalesced
+for LIBRARY_AVAILABILITY_TICK seconds and then sent with one channel
+layer message per subscribed group (`book.<id>` and `author.<hash>`),
+so a burst of borrows on one book reaches its subscribers as a single
+update carrying the net change. Holds that a returned copy was set
+aside for are announced on the holder's `user.<id>` group in the same
+flush, so queued members need not poll.
+
+The hub lives in the ASGI process that holds the WebSocket connections.
+It does nothing until a consumer has attached an event loop, so WSGI
+workers pay only for the on_commit hook. Use a shared channel layer
+(e.g. channels_redis) when several processes serve subscribers.
+"""
+import asyncio
+import contextvars
+import hashlib
+import logging
+from collections import defaultdict
+from threading import Lock
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from .models import Book, Hold
+
+logger = logging.getLogger('library.availability')
+
+
+def book_group(book_id):
+    return f'book.{book_id}'
+
+
+def author_group(author):
+    # Group names are limited to ASCII, so authors are hashed
+    return 'author.' + hashlib.md5(author.casefold().encode()).hexdigest()
+
+
+def user_group(user_id):
+    return f'user.{user_id}'
+
+
+class AvailabilityHub:
+    def __init__(self):
+        self._lock = Lock()
+        self._pending = {}
+        self._ready_holds = set()
+        self._scheduled = False
+        self._loop = None
+        self.subscribers = 0
+
+    def attach(self, loop):
+        with self._lock:
+            self._loop = loop
+            self.subscribers += 1
+
+    def detach(self):
+        with self._lock:
+            self.subscribers -= 1
+
+    def record(self, book_id, delta=None):
+        """
+        Note a change to `book_id`'s copy count. `delta` is the known
+        change (-1 for a borrow); None means the count was set outright.
+        Safe to call from any thread.
+        """
+        with self._lock:
+            if not self._listening():
+                return
+            previous = self._pending.get(book_id, 0)
+            self._pending[book_id] = None if previous is None or delta is None else previous + delta
+            schedule = self._claim_flush()
+        if schedule:
+            self._schedule()
+
+    def record_ready_holds(self, hold_ids):
+        """Note holds that just had a copy set aside. Safe to call from any thread."""
+        with self._lock:
+            if not self._listening():
+                return
+            self._ready_holds.update(hold_ids)
+            schedule = self._claim_flush()
+        if schedule:
+            self._schedule()
+
+    def _listening(self):
+        # Caller holds the lock
+        return self.subscribers > 0 and self._loop is not None and not self._loop.is_closed()
+
+    def _claim_flush(self):
+        # Caller holds the lock
+        if self._scheduled:
+            return False
+        self._scheduled = True
+        return True
+
+    def _schedule(self):
+        # A fresh context: the caller's (its request metrics, asgiref's
+        # executor state) must not leak into the flush task.
+        self._loop.call_soon_threadsafe(
+            self._loop.call_later, settings.LIBRARY_AVAILABILITY_TICK, self._start_flush,
+            context=contextvars.Context(),
+        )
+
+    def _start_flush(self):
+        asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            ready_holds, self._ready_holds = self._ready_holds, set()
+            self._scheduled = False
+        try:
+            groups = defaultdict(list)
+            rows = Book.objects.filter(pk__in=list(pending)).values('id', 'author', 'number_of_copies_available')
+            async for row in rows:
+                update = {
+                    'id': row['id'],
+                    'available': row['number_of_copies_available'],
+                    'delta': pending[row['id']],
+                }
+                groups[book_group(row['id'])].append(update)
+                groups[author_group(row['author'])].append(update)
+            layer = get_channel_layer()
+            for group, books in groups.items():
+                await layer.group_send(group, {'type': 'availability.update', 'books': books})
+
+            # Still ready: a hold cancelled since the allocation is not announced
+            holds = Hold.objects.filter(pk__in=list(ready_holds), status=Hold.Status.READY)
+            async for hold in holds.values('id', 'user_id', 'book_id', 'expires_at'):
+                await layer.group_send(user_group(hold['user_id']), {
+                    'type': 'hold.ready',
+                    'hold': hold['id'],
+                    'book': hold['book_id'],
+                    'expires_at': hold['expires_at'].isoformat(),
+                })
+        except Exception:
+            logger.exception("Could not publish availability for books %s", sorted(pending))
+
+
+hub = AvailabilityHub()
+
+
+def availability_changed(book_id, delta=None):
+    """Publish `book_id`'s copy count to subscribers once the current transaction commits."""
+    transaction.on_commit(lambda: hub.record(book_id, delta))
+
+
+def holds_ready(hold_ids):
+    """Tell the holders once the current transaction commits that a copy is set aside."""
+    hold_ids = list(hold_ids)
+    transaction.on_commit(lambda: hub.record_ready_holds(hold_ids))
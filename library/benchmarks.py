@@ -0,0 +1,168 @@
+"""
+Helpers shared by the `bench_*` management commands: reproducible bulk
+seeding of users, books and loans, latency percentiles, server memory
+sampling and an in-process WebSocket client.
+"""
+import json
+import random
+import socket
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+from asgiref.testing import ApplicationCommunicator
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from .models import Book, Loan
+
+WORDS = (
+    "river night garden empire shadow winter silver letters ocean history "
+    "machine forest stone city glass storm memory kingdom journey secret"
+).split()
+SURNAMES = "adams baker chen diaz evans fischer garcia hughes ito jones kowalski lopez".split()
+BATCH_SIZE = 5000
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not samples:
+        return 0.0
+    index = max(0, int(round(pct / 100 * len(samples))) - 1)
+    return samples[index]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def tree_rss_kb(root_pid, field='VmRSS'):
+    """
+    Resident memory of a process and all of its descendants (Linux /proc).
+    `field='RssAnon'` leaves out file pages, such as SQLite's memory map.
+    """
+    children = {}
+    for entry in Path('/proc').iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            # The command name may contain spaces; fields after it are fixed
+            fields = (entry / 'stat').read_text().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry.name))
+
+    total, pending = 0, [root_pid]
+    while pending:
+        pid = pending.pop()
+        pending.extend(children.get(pid, []))
+        try:
+            for line in Path(f'/proc/{pid}/status').read_text().splitlines():
+                if line.startswith(f'{field}:'):
+                    total += int(line.split()[1])
+        except OSError:
+            pass
+    return total
+
+
+def _bulk_create(model, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            model.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+
+
+def seed_users(target, prefix='bench-user'):
+    """Top the users named `<prefix>-<n>` up to `target` rows."""
+    User = get_user_model()
+    existing = User.objects.filter(username__startswith=f"{prefix}-").count()
+    _bulk_create(User, (User(username=f"{prefix}-{n}") for n in range(existing, target)))
+    return list(User.objects.filter(username__startswith=f"{prefix}-").values_list('pk', flat=True))
+
+
+def seed_books(target, seed=42):
+    """Top the catalog up to `target` books with deterministic titles."""
+    existing = Book.objects.count()
+    rng = random.Random(seed + existing)
+    _bulk_create(Book, (
+        Book(
+            title=' '.join(rng.sample(WORDS, 3)).title(),
+            author=f"{rng.choice(SURNAMES).title()} {rng.choice(WORDS).title()}",
+            isbn=f"978{n:010d}",
+        )
+        for n in range(existing, target)
+    ))
+    return list(Book.objects.values_list('pk', flat=True))
+
+
+@contextmanager
+def explicit_loan_dates():
+    """Let bulk_create keep the loan_date we set instead of auto_now_add."""
+    field = Loan._meta.get_field('loan_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def seed_loans(target, user_ids, book_ids, seed=42, open_ratio=0.0):
+    """
+    Top the loan table up to `target` rows spread over the last few years.
+    Only `open_ratio` of new loans stay open, one per user/book pair at most.
+    """
+    existing = Loan.objects.count()
+    rng = random.Random(seed + existing)
+    now = timezone.now()
+    open_pairs = set(Loan.objects.filter(returned=False).values_list('user_id', 'book_id'))
+
+    def rows():
+        for n in range(existing, target):
+            user_id, book_id = rng.choice(user_ids), rng.choice(book_ids)
+            loan_date = now - timedelta(seconds=(target - n) * 60)
+            is_open = rng.random() < open_ratio and (user_id, book_id) not in open_pairs
+            if is_open:
+                open_pairs.add((user_id, book_id))
+            yield Loan(
+                user_id=user_id,
+                book_id=book_id,
+                loan_date=loan_date,
+                returned=not is_open,
+                return_date=None if is_open else loan_date + timedelta(days=14),
+            )
+
+    with explicit_loan_dates():
+        _bulk_create(Loan, rows())
+
+
+class WebsocketClient(ApplicationCommunicator):
+    """
+    Drive a WebSocket ASGI app in-process. channels.testing offers the
+    same but cannot be imported without daphne installed.
+    """
+
+    def __init__(self, application, path, query_string=''):
+        super().__init__(application, {
+            'type': 'websocket', 'path': path, 'query_string': query_string.encode(), 'headers': [],
+            'subprotocols': [],
+        })
+
+    async def connect(self, timeout=1):
+        await self.send_input({'type': 'websocket.connect'})
+        return (await self.receive_output(timeout))['type'] == 'websocket.accept'
+
+    async def send_json_to(self, data):
+        await self.send_input({'type': 'websocket.receive', 'text': json.dumps(data)})
+
+    async def receive_json_from(self, timeout=1):
+        return json.loads((await self.receive_output(timeout))['text'])
+
+    async def disconnect(self, code=1000, timeout=1):
+        await self.send_input({'type': 'websocket.disconnect', 'code': code})
+        await self.wait(timeout)
@@ -0,0 +1,170 @@
+"""
+Versioned response cache for the book catalog.
+
+Every cached catalog response is keyed on a catalog version number kept
+in the Django cache. Any write that can change what the catalog shows
+(book edits, borrows, returns, imports) bumps the version once the
+transaction commits, so stale entries are simply never looked up again
+and age out with their TTL. The version also backs the ETag and
+Last-Modified headers, which lets conditional requests be answered
+with 304 before the database is touched. Bulk availability lookups by
+ISBN are cached per ISBN under the same version.
+
+Only reads from the primary are stored: a replica may still lag behind
+the write that bumped the version, and its answer would then be served
+from the cache, even to the writer pinned to the primary, until the TTL.
+
+With the local-memory backend the version lives in each worker, so
+use the file (or any shared) backend when running several workers.
+"""
+import hashlib
+import time
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, router, transaction
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Book
+
+VERSION_KEY = 'library:catalog:version'
+MODIFIED_KEY = 'library:catalog:modified'
+# ISBNs per IN query, well under SQLite's oldest 999-parameter limit
+ISBN_CHUNK = 500
+
+
+def get_catalog_version():
+    """Return (version, last_modified_timestamp), initialising both if missing."""
+    values = cache.get_many([VERSION_KEY, MODIFIED_KEY])
+    if VERSION_KEY in values and MODIFIED_KEY in values:
+        return values[VERSION_KEY], values[MODIFIED_KEY]
+    now = time.time()
+    # Seed from the clock so a cache restart never reuses an old version
+    cache.add(VERSION_KEY, int(now * 1000), timeout=None)
+    cache.add(MODIFIED_KEY, int(now), timeout=None)
+    return cache.get(VERSION_KEY), cache.get(MODIFIED_KEY)
+
+
+def read_from_primary():
+    """Whether catalog reads in this context go to the primary, so may be cached."""
+    return router.db_for_read(Book) == DEFAULT_DB_ALIAS
+
+
+def _bump():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+    # HTTP dates have one-second resolution; always move forward so a
+    # second write within the same second still fails If-Modified-Since.
+    modified = max(int(time.time()), (cache.get(MODIFIED_KEY) or 0) + 1)
+    cache.set(MODIFIED_KEY, modified, timeout=None)
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog response once the current transaction commits."""
+    transaction.on_commit(_bump)
+
+
+class CacheStats:
+    """In-process counters for the catalog response cache."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.hits = self.misses = self.not_modified = 0
+
+    def record(self, outcome):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def as_dict(self):
+        served = self.hits + self.misses + self.not_modified
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'not_modified': self.not_modified,
+            'hit_rate': (self.hits + self.not_modified) / served if served else 0.0,
+        }
+
+
+stats = CacheStats()
+
+
+class CatalogCacheMixin:
+    """
+    Serve `list` and `retrieve` from the versioned cache, with ETag and
+    Last-Modified validators. Only the serialized data is cached, so
+    every renderer (JSON, browsable API) shares an entry.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        version, modified = get_catalog_version()
+        digest = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        etag = quote_etag(f"{version}-{digest}")
+        headers = {'ETag': etag, 'Last-Modified': http_date(modified), 'Vary': 'Accept'}
+
+        if self.not_modified(request, etag, modified):
+            stats.record('not_modified')
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        key = f"library:catalog:response:{version}:{digest}"
+        data = cache.get(key)
+        if data is not None:
+            stats.record('hits')
+            response = Response(data, headers=headers)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        stats.record('misses')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            if read_from_primary():
+                cache.set(key, response.data, timeout=settings.LIBRARY_RESPONSE_CACHE_TTL)
+            for name, value in headers.items():
+                response[name] = value
+        response['X-Cache'] = 'MISS'
+        return response
+
+    @staticmethod
+    def not_modified(request, etag, modified):
+        # If-None-Match takes precedence over If-Modified-Since (RFC 9110)
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return etag in {tag.strip() for tag in if_none_match.split(',')} or if_none_match.strip() == '*'
+        since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return since is not None and modified <= since
+
+
+def availability_by_isbn(isbns):
+    """
+    Copies available for each ISBN, or None for ISBNs not in the catalog,
+    in the order given. Misses in the versioned cache are loaded with one
+    indexed `isbn IN (...)` query per ISBN_CHUNK ISBNs.
+    """
+    ttl = settings.LIBRARY_AVAILABILITY_CACHE_TTL
+    keys = {}
+    found = {}
+    if ttl:
+        version, _ = get_catalog_version()
+        keys = {isbn: f"library:availability:{version}:{isbn}" for isbn in isbns}
+        cached = cache.get_many(keys.values())
+        found = {isbn: cached[key] for isbn, key in keys.items() if key in cached}
+
+    missing = [isbn for isbn in isbns if isbn not in found]
+    loaded = dict.fromkeys(missing)
+    for start in range(0, len(missing), ISBN_CHUNK):
+        loaded.update(Book.objects.filter(isbn__in=missing[start:start + ISBN_CHUNK])
+                      .values_list('isbn', 'number_of_copies_available'))
+    if ttl and loaded and read_from_primary():
+        cache.set_many({keys[isbn]: copies for isbn, copies in loaded.items()}, timeout=ttl)
+    found.update(loaded)
+    return {isbn: found[isbn] for isbn in isbns}
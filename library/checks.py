@@ -0,0 +1,34 @@
+"""
+System check for backends that keep their state inside one process.
+
+The catalog cache version, idempotency claims, replica pins and WebSocket
+pushes all live in the default cache and channel layer. With local-memory
+backends each worker has its own copy, so several workers disagree.
+"""
+from django.conf import settings
+from django.core import checks
+
+PROCESS_LOCAL_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'channels.layers.InMemoryChannelLayer',
+}
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_backends(app_configs=None, **kwargs):
+    if settings.WEB_CONCURRENCY <= 1:
+        return []
+    configured = [
+        *((f"CACHES[{alias!r}]", conf) for alias, conf in settings.CACHES.items()),
+        *((f"CHANNEL_LAYERS[{alias!r}]", conf) for alias, conf in settings.CHANNEL_LAYERS.items()),
+    ]
+    return [
+        checks.Error(
+            f"{name} uses {conf['BACKEND']}, which is not shared between the "
+            f"WEB_CONCURRENCY={settings.WEB_CONCURRENCY} workers.",
+            hint="Configure a shared backend such as Redis, or run one worker.",
+            id='library.E001',
+        )
+        for name, conf in configured
+        if conf['BACKEND'] in PROCESS_LOCAL_BACKENDS
+    ]
@@ -0,0 +1,95 @@
+import asyncio
+from urllib.parse import parse_qs
+
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import aauthenticate_credentials
+from .availability import author_group, book_group, hub, user_group
+from .models import Book
+
+MAX_SUBSCRIPTIONS = 200
+
+
+class AvailabilityConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Stream copy-count changes for chosen books or authors.
+
+    Clients send {"action": "subscribe", "books": [1, 2]} or
+    {"action": "subscribe", "author": "Ursula K. Le Guin"} (and
+    "unsubscribe" likewise). Book subscriptions are answered with the
+    current counts; after that the server sends
+    {"type": "availability", "books": [{"id", "available", "delta"}]}
+    whenever counts change, where `delta` is the net change since the
+    previous message, or null after an admin edit.
+
+    Connecting with `?token=<api token>` also delivers
+    {"type": "hold_ready", "hold", "book", "expires_at"} when a copy is
+    set aside for one of the user's holds.
+    """
+
+    async def connect(self):
+        self.groups_joined = set()
+        self.attached = False
+        token = parse_qs(self.scope.get('query_string', b'').decode()).get('token')
+        if token:
+            try:
+                user = await aauthenticate_credentials(token[0])
+            except AuthenticationFailed:
+                await self.close(code=4001)
+                return
+            self.groups_joined.add(user_group(user.pk))
+            await self.channel_layer.group_add(user_group(user.pk), self.channel_name)
+        hub.attach(asyncio.get_running_loop())
+        self.attached = True
+        await self.accept()
+
+    async def disconnect(self, code):
+        if self.attached:
+            hub.detach()
+        for group in self.groups_joined:
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        action = content.get('action') if isinstance(content, dict) else None
+        if action not in ('subscribe', 'unsubscribe'):
+            await self.send_json({'type': 'error', 'detail': 'action must be "subscribe" or "unsubscribe".'})
+            return
+
+        books = content.get('books', [])
+        author = content.get('author')
+        if not isinstance(books, list) or not all(isinstance(pk, int) for pk in books):
+            await self.send_json({'type': 'error', 'detail': 'books must be a list of ids.'})
+            return
+        if author is not None and not isinstance(author, str):
+            await self.send_json({'type': 'error', 'detail': 'author must be a string.'})
+            return
+        groups = {book_group(pk) for pk in books} | ({author_group(author)} if author else set())
+
+        if action == 'unsubscribe':
+            for group in groups & self.groups_joined:
+                await self.channel_layer.group_discard(group, self.channel_name)
+            self.groups_joined -= groups
+            return
+
+        if len(self.groups_joined | groups) > MAX_SUBSCRIPTIONS:
+            await self.send_json({'type': 'error', 'detail': f'At most {MAX_SUBSCRIPTIONS} subscriptions.'})
+            return
+        for group in groups - self.groups_joined:
+            await self.channel_layer.group_add(group, self.channel_name)
+        self.groups_joined |= groups
+        if books:
+            # Current counts, so nothing is missed between a read and subscribing
+            snapshot = [
+                {'id': row['id'], 'available': row['number_of_copies_available'], 'delta': None}
+                async for row in Book.objects.filter(pk__in=books).values('id', 'number_of_copies_available')
+            ]
+            await self.send_json({'type': 'availability', 'books': snapshot})
+
+    async def availability_update(self, event):
+        await self.send_json({'type': 'availability', 'books': event['books']})
+
+    async def hold_ready(self, event):
+        await self.send_json({
+            'type': 'hold_ready', 'hold': event['hold'], 'book': event['book'], 'expires_at': event['expires_at'],
+        })
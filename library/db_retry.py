@@ -0,0 +1,43 @@
+"""
+Bounded retries for write transactions that lose the SQLite lock.
+
+SQLite has one writer at a time. With the settings' busy timeout a
+writer queues for the lock, but a transaction can still give up with
+"database is locked" under a long burst. `retry_on_lock` re-runs the
+whole service call a few times with jittered backoff before letting the
+error through, so the caller sees a slower success instead of a 500.
+"""
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+LOCK_MESSAGES = ('database is locked', 'database table is locked')
+BACKOFF = 0.05
+
+
+def is_lock_error(exc):
+    return isinstance(exc, OperationalError) and any(message in str(exc) for message in LOCK_MESSAGES)
+
+
+def retry_on_lock(func):
+    """
+    Re-run `func` up to LIBRARY_DB_LOCK_RETRIES times when it fails on a
+    lock. `func` must own its transaction: inside an outer one the error
+    is raised at once, since only the outer transaction can be re-run.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                if (attempt >= settings.LIBRARY_DB_LOCK_RETRIES or not is_lock_error(exc)
+                        or transaction.get_connection().in_atomic_block):
+                    raise
+            time.sleep(BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+            attempt += 1
+    return wrapper
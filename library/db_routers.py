@@ -0,0 +1,98 @@
+"""
+Read/write splitting across the replicas in DATABASE_REPLICA_URLS.
+
+`ReplicaMiddleware` picks one replica per safe-method request (GET,
+HEAD, OPTIONS) and `ReplicaRouter` sends that request's reads to it.
+Writes, unsafe requests, reads inside a transaction, and everything
+outside a request (commands, WebSocket consumers) use the primary.
+
+A caller that just wrote is pinned to the primary for
+LIBRARY_REPLICA_PIN_SECONDS, so their next reads see their own writes
+despite replication lag. The pin is keyed on their Authorization header
+(or session cookie) in the Django cache; share the cache between
+workers, as for the catalog cache, for it to hold across them.
+"""
+import contextvars
+import hashlib
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+_replica = contextvars.ContextVar('library_replica', default=None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = _replica.get()
+        # Reads inside a transaction on the primary stay with it
+        if replica is None or connections['default'].in_atomic_block:
+            return 'default'
+        return replica
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        return db == 'default'
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _replica.set(self.choose(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _replica.reset(token)
+        self.pin(request)
+        return response
+
+    async def __acall__(self, request):
+        token = _replica.set(self.choose(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _replica.reset(token)
+        self.pin(request)
+        return response
+
+    @staticmethod
+    def pin_key(request):
+        credential = request.headers.get('Authorization') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if credential:
+            return f'library:db:pinned:{hashlib.sha256(credential.encode()).hexdigest()}'
+        return None
+
+    def choose(self, request):
+        """The replica this request reads from, or None for the primary."""
+        if not settings.DATABASE_REPLICAS or request.method not in SAFE_METHODS:
+            return None
+        key = self.pin_key(request)
+        if key is not None and cache.get(key):
+            return None
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def pin(self, request):
+        if not settings.DATABASE_REPLICAS or request.method in SAFE_METHODS:
+            return
+        key = self.pin_key(request)
+        if key is not None:
+            cache.set(key, True, timeout=settings.LIBRARY_REPLICA_PIN_SECONDS)
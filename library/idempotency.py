@@ -0,0 +1,123 @@
+"""
+`Idempotency-Key` support for mutating endpoints.
+
+A client that may retry a POST, PUT, PATCH or DELETE sends a unique
+`Idempotency-Key` header with it. The first request with a key runs as
+usual and its rendered response is kept in the Django cache for
+LIBRARY_IDEMPOTENCY_TTL seconds. A repeat of the key by the same user is
+answered from there with `Idempotent-Replayed: true`, without running
+the view again.
+
+The key is claimed with `cache.add` before the view runs, so of two
+concurrent duplicates only one executes; the other gets 409 until the
+first has finished. This needs a backend whose `add` is atomic (local
+memory, database, Redis or Memcached; not the file backend). A key sent
+again with a different method, path or body gets 422. Server errors
+release the key so the request can be retried.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+RUNNING = 'running'
+
+
+class _Answered(Exception):
+    """Raised from `initial` to answer a request without running its view."""
+
+    def __init__(self, response):
+        self.response = response
+
+
+def fingerprint(request):
+    digest = hashlib.sha256(f'{request.method} {request.get_full_path()}\n'.encode())
+    # Multipart uploads are not read into memory just to be compared
+    if not request.content_type.startswith('multipart/'):
+        digest.update(request.body)
+    return digest.hexdigest()
+
+
+def replay(entry):
+    if entry['content'] is None:
+        response = Response({"detail": "Already processed; the response was too large to keep."},
+                            status=entry['status'])
+    else:
+        response = HttpResponse(entry['content'], status=entry['status'], content_type=entry['content_type'])
+    for name, value in entry['headers'].items():
+        response[name] = value
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+class IdempotencyMixin:
+    """Honour `Idempotency-Key` on every unsafe method of the viewset."""
+    idempotency_key = None
+    replayed_headers = ('Location',)
+
+    def initial(self, request, *args, **kwargs):
+        self.idempotency_key = None
+        super().initial(request, *args, **kwargs)
+        key = request.headers.get(HEADER)
+        if key is None or request.method in SAFE_METHODS or not request.user.is_authenticated:
+            return
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise _Answered(Response({"error": f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters"},
+                                     status=status.HTTP_400_BAD_REQUEST))
+
+        cache_key = f'library:idempotency:{request.user.pk}:{hashlib.sha256(key.encode()).hexdigest()}'
+        self.request_fingerprint = fingerprint(request._request)
+        claim = {'state': RUNNING, 'fingerprint': self.request_fingerprint}
+        if cache.add(cache_key, claim, timeout=settings.LIBRARY_IDEMPOTENCY_LOCK_TIMEOUT):
+            self.idempotency_key = cache_key
+            return
+
+        entry = cache.get(cache_key)
+        if entry is not None and entry['fingerprint'] != self.request_fingerprint:
+            raise _Answered(Response({"error": f"{HEADER} was already used for a different request"},
+                                     status=status.HTTP_422_UNPROCESSABLE_ENTITY))
+        if entry is None or entry['state'] == RUNNING:
+            raise _Answered(Response({"error": f"A request with this {HEADER} is still in progress"},
+                                     status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'}))
+        raise _Answered(replay(entry))
+
+    def handle_exception(self, exc):
+        if isinstance(exc, _Answered):
+            return exc.response
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            self.release_key()
+            raise
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.idempotency_key is not None:
+            if response.status_code >= 500:
+                self.release_key()
+            else:
+                # Kept once rendered, so a replay is byte for byte the original
+                response.add_post_render_callback(self.store_response)
+        return response
+
+    def store_response(self, response):
+        content = response.content
+        cache.set(self.idempotency_key, {
+            'state': 'done',
+            'fingerprint': self.request_fingerprint,
+            'status': response.status_code,
+            'content': content if len(content) <= settings.LIBRARY_IDEMPOTENCY_MAX_BYTES else None,
+            'content_type': response['Content-Type'],
+            'headers': {name: response[name] for name in self.replayed_headers if name in response},
+        }, timeout=settings.LIBRARY_IDEMPOTENCY_TTL)
+
+    def release_key(self):
+        if self.idempotency_key is not None:
+            cache.delete(self.idempotency_key)
+            self.idempotency_key = None
@@ -0,0 +1,179 @@
+"""
+Streaming bulk import of the book catalog from CSV or NDJSON.
+
+Rows are read lazily and validated a chunk at a time: field validation
+runs without touching the database, ISBN uniqueness is checked with one
+`isbn__in` lookup per chunk, and each chunk is written in one
+transaction: a `bulk_create` for new books and, when upserting, one
+`bulk_update` per set of columns the rows provide, so columns a row
+leaves out keep their stored values. Memory stays bounded by the chunk
+size.
+"""
+import csv
+import io
+import json
+from collections import defaultdict
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from . import services
+from .caching import bump_catalog_version
+from .models import Book, Hold, Loan
+from .serializers import BookSerializer
+
+FORMATS = ('csv', 'ndjson')
+MAX_REPORTED_ERRORS = 1000
+
+
+class BookImportSerializer(BookSerializer):
+    """BookSerializer minus the per-row uniqueness queries; checked per chunk instead."""
+
+    class Meta(BookSerializer.Meta):
+        extra_kwargs = {'isbn': {'validators': []}}
+
+    def validate_isbn(self, value):
+        return value
+
+
+def guess_format(filename):
+    return 'csv' if filename.lower().endswith('.csv') else 'ndjson'
+
+
+def iter_rows(fileobj, fmt):
+    """Yield dicts from a binary or text file object, one line at a time."""
+    if isinstance(fileobj.read(0), bytes):
+        fileobj = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        yield from csv.DictReader(fileobj)
+        return
+    for line in fileobj:
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield {'__invalid__': line}
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+        self.warnings = []
+
+    def add_error(self, row_number, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'errors': errors})
+
+    def add_warning(self, row_number, warning):
+        if len(self.warnings) < MAX_REPORTED_ERRORS:
+            self.warnings.append({'row': row_number, 'warning': warning})
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.error_count,
+            'errors': self.errors,
+            'warnings': self.warnings,
+        }
+
+
+def import_books(rows, batch_size=1000, upsert=False, report=None):
+    """
+    Validate and insert `rows` (an iterable of dicts) in chunks of
+    `batch_size`. With `upsert`, books whose ISBN already exists are
+    updated in place (only the columns the row provides, and never the
+    copy count of a book on loan); otherwise they are reported as errors.
+    A chunk the database rejects is rolled back and reported row by row.
+    """
+    report = report or ImportReport()
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            # bulk_create skips the post_save signal
+            bump_catalog_version()
+            return report
+        _import_chunk(chunk, report.rows + 1, upsert, report)
+        report.rows += len(chunk)
+
+
+def _import_chunk(chunk, first_row, upsert, report):
+    # One serializer for the whole chunk; building its fields per row
+    # costs more than validating the row.
+    serializer = BookImportSerializer()
+    valid = {}
+    for row_number, row in enumerate(chunk, start=first_row):
+        if '__invalid__' in row:
+            report.add_error(row_number, {'non_field_errors': ['Invalid JSON.']})
+            continue
+        try:
+            data = serializer.run_validation(row)
+        except ValidationError as exc:
+            report.add_error(row_number, exc.detail)
+            continue
+        if data['isbn'] in valid:
+            report.add_error(row_number, {'isbn': ['Duplicate ISBN in this upload.']})
+            continue
+        valid[data['isbn']] = (row_number, data)
+
+    existing = dict(Book.objects.filter(isbn__in=list(valid)).values_list('isbn', 'pk'))
+    if not upsert:
+        for isbn in existing:
+            row_number, _ = valid.pop(isbn)
+            report.add_error(row_number, {'isbn': ['A book with this ISBN already exists.']})
+
+    created = [Book(**data) for isbn, (_, data) in valid.items() if isbn not in existing]
+    updates, added = _updates(valid, existing, report) if upsert else ({}, [])
+    try:
+        with transaction.atomic():
+            Book.objects.bulk_create(created)
+            for fields, books in updates.items():
+                Book.objects.bulk_update(books, fields)
+            for book, count in added:
+                services.copies_added(book, count)
+    except IntegrityError as exc:
+        # e.g. a concurrent import of the same ISBN; earlier chunks stay committed
+        for row_number, _ in valid.values():
+            report.add_error(row_number, {'non_field_errors': [f"Not saved: {exc}"]})
+        return
+    report.updated += len(valid) - len(created)
+    report.created += len(created)
+
+
+def _updates(valid, existing, report):
+    """
+    Group the rows for existing books by the columns they set: {fields: [Book]}.
+    Also returns [(Book, copies)] for rows that add copies to a book with
+    waiting holds, which are handed to the queue after the update.
+    """
+    on_loan = set(Loan.objects.filter(book__in=existing.values(), returned=False).values_list('book', flat=True))
+    queued = dict(
+        Book.objects.filter(pk__in=existing.values(), holds__status=Hold.Status.WAITING)
+        .values_list('pk', 'number_of_copies_available').distinct()
+    )
+    now = timezone.now()
+    updates = defaultdict(list)
+    added = []
+    for isbn, pk in existing.items():
+        row_number, data = valid[isbn]
+        data = {name: value for name, value in data.items() if name != 'isbn'}
+        if pk in on_loan and data.pop('number_of_copies_available', None) is not None:
+            # The live count already accounts for the copies out on loan
+            report.add_warning(row_number, "Copy count not changed: the book has open loans.")
+        # bulk_update does not apply auto_now
+        data['updated_at'] = now
+        book = Book(pk=pk, **data)
+        if pk in queued and 'number_of_copies_available' in data:
+            added.append((book, data['number_of_copies_available'] - queued[pk]))
+        updates[tuple(sorted(data))].append(book)
+    return updates, added
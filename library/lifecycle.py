@@ -0,0 +1,109 @@
+"""
+Chunked batch jobs over the loan tables, used by `manage.py sweep_loans`.
+
+Each job walks its rows in primary key order and changes one chunk per
+set-based UPDATE, committed on its own, so no lock is held for longer
+than one chunk and live borrows and returns only ever wait for that
+long. Jobs yield after every chunk with the last primary key handled,
+which is all a checkpoint needs to resume.
+
+The archive jobs move closed history into ArchivedLoan the same way, so
+the live loan table only holds open and recent loans.
+"""
+from datetime import datetime, time
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedLoan, BorrowRecord, Loan
+
+
+def _chunks(queryset, chunk_size, after):
+    """Yield (first_pk_exclusive, last_pk, rows) windows of `queryset` in pk order."""
+    while True:
+        pks = list(queryset.filter(pk__gt=after).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return
+        yield after, pks[-1], len(pks)
+        after = pks[-1]
+
+
+def flag_overdue(cutoff, chunk_size=5000, after=0, dry_run=False):
+    """
+    Flag open loans made before `cutoff` as overdue.
+    Yields (last_pk, scanned, changed) per chunk.
+    """
+    open_loans = Loan.objects.filter(returned=False)
+    for start, end, scanned in _chunks(open_loans, chunk_size, after):
+        # Conditions are re-checked here: a loan returned since the
+        # chunk was read is left alone
+        due = open_loans.filter(pk__gt=start, pk__lte=end, overdue=False, loan_date__lt=cutoff)
+        yield end, scanned, due.count() if dry_run else due.update(overdue=True)
+
+
+def close_stale_borrow_records(before, closed_on, chunk_size=5000, after=0, dry_run=False):
+    """
+    Close legacy BorrowRecord rows still open since before `before`,
+    dating their return `closed_on`. Yields (last_pk, scanned, changed).
+    """
+    open_records = BorrowRecord.objects.filter(return_date__isnull=True)
+    for start, end, scanned in _chunks(open_records, chunk_size, after):
+        stale = open_records.filter(pk__gt=start, pk__lte=end, borrow_date__lt=before)
+        yield end, scanned, stale.count() if dry_run else stale.update(return_date=closed_on)
+
+
+def _archive(queryset, fields, chunk_size, after, dry_run, to_archive):
+    """
+    Move the rows of `queryset` into ArchivedLoan, one transaction per
+    chunk; `to_archive` builds the archive entry from a `.values(*fields)` row.
+    """
+    for start, end, scanned in _chunks(queryset, chunk_size, after):
+        chunk = queryset.filter(pk__gt=start, pk__lte=end)
+        if dry_run:
+            yield end, scanned, chunk.count()
+            continue
+        with transaction.atomic():
+            rows = list(chunk.values('pk', *fields))
+            ArchivedLoan.objects.bulk_create([to_archive(row) for row in rows])
+            # The same conditions as the rows just read; closed history is never reopened
+            chunk.delete()
+        yield end, scanned, len(rows)
+
+
+def _archived_loan(row):
+    return ArchivedLoan(
+        source=ArchivedLoan.Source.LOAN, source_id=row['pk'], user_id=row['user_id'], book_id=row['book_id'],
+        loan_date=row['loan_date'], return_date=row['return_date'], overdue=row['overdue'],
+    )
+
+
+def archive_returned_loans(before, chunk_size=5000, after=0, dry_run=False):
+    """
+    Move loans returned before `before` into the archive.
+    Yields (last_pk, scanned, moved) per chunk.
+    """
+    returned = Loan.objects.filter(returned=True, return_date__lt=before)
+    fields = ('user_id', 'book_id', 'loan_date', 'return_date', 'overdue')
+    return _archive(returned, fields, chunk_size, after, dry_run, _archived_loan)
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _archived_borrow_record(row):
+    return ArchivedLoan(
+        source=ArchivedLoan.Source.BORROW_RECORD, source_id=row['pk'], user_id=row['user_id'],
+        book_id=row['book_id'], loan_date=_start_of_day(row['borrow_date']),
+        return_date=_start_of_day(row['return_date']),
+    )
+
+
+def archive_borrow_records(before, chunk_size=5000, after=0, dry_run=False):
+    """
+    Move legacy BorrowRecord rows returned before the date `before` into
+    the archive, dated from the start of their borrow and return days.
+    """
+    closed = BorrowRecord.objects.filter(return_date__lt=before)
+    fields = ('user_id', 'book_id', 'borrow_date', 'return_date')
+    return _archive(closed, fields, chunk_size, after, dry_run, _archived_borrow_record)
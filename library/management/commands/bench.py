@@ -0,0 +1,187 @@
+import json
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from library.benchmarks import percentile, seed_books, seed_loans, seed_users
+from library.models import Book, Loan
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a reproducible dataset and benchmark every API endpoint, reporting "
+        "p50/p95/p99 latency, throughput and SQL queries per request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--books', type=int, default=10_000)
+        parser.add_argument('--loans', type=int, default=100_000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint.")
+        parser.add_argument('--base-url', help="Drive a running server (e.g. local gunicorn) instead of the test client.")
+        parser.add_argument('--cold-cache', action='store_true',
+                            help="Clear the Django cache before every request to measure uncached responses.")
+        parser.add_argument('--output', help="Write results as JSON to this path.")
+        parser.add_argument('--compare', help="Previous JSON results to diff against.")
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help="Relative p95 slowdown reported as a regression (default 0.2 = 20%%).")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Seeding dataset...")
+        user_ids = seed_users(options['users'])
+        book_ids = seed_books(options['books'], options['seed'])
+        seed_loans(options['loans'], user_ids, book_ids, options['seed'])
+
+        staff, _ = get_user_model().objects.get_or_create(username='bench-staff', defaults={'is_staff': True})
+        token, _ = Token.objects.get_or_create(user=staff)
+        # Free any copies a previous interrupted run left borrowed
+        Loan.objects.filter(user=staff, returned=False).update(returned=True, return_date=timezone.now())
+        # Queries can only be counted when requests run in this process
+        self.count_queries = not options['base_url']
+        if options['base_url']:
+            self.send = self.http_sender(options['base_url'], token.key)
+        else:
+            self.send = self.client_sender(token.key, options['cold_cache'])
+
+        n = options['requests']
+        books = list(Book.objects.filter(number_of_copies_available__gt=0).order_by('pk')[:n])
+        if len(books) < n:
+            raise CommandError(f"Need {n} books with free copies to benchmark borrow/return.")
+        book = books[0]
+        loan_id = Loan.objects.order_by('-pk').values_list('pk', flat=True).first()
+
+        endpoints = {
+            'book-list': [('get', '/api/books/', {})] * n,
+            'book-list-search': [('get', '/api/books/', {'search': 'silver storm'})] * n,
+            'book-list-filter': [('get', '/api/books/', {'author': book.author})] * n,
+            'book-list-cursor': [('get', '/api/books/', {'cursor': ''})] * n,
+            'book-detail': [('get', f'/api/books/{book.pk}/', {})] * n,
+            'book-borrow': [('post', f'/api/books/{b.pk}/borrow/', {}) for b in books],
+            'book-return': [('post', f'/api/books/{b.pk}/return_book/', {}) for b in books],
+            'loan-list': [('get', '/api/loans/', {})] * n,
+            'loan-detail': [('get', f'/api/loans/{loan_id}/', {})] * n,
+            'user-list': [('get', '/api/users/', {})] * n,
+        }
+
+        results = {}
+        for name, calls in endpoints.items():
+            results[name] = self.run_endpoint(calls)
+            self.report(name, results[name])
+
+        payload = {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'vendor': connection.vendor,
+                'target': options['base_url'] or 'test-client',
+                'cold_cache': options['cold_cache'],
+                'users': options['users'],
+                'books': options['books'],
+                'loans': options['loans'],
+                'requests': n,
+            },
+            'endpoints': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as fileobj:
+                json.dump(payload, fileobj, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+        if options['compare']:
+            self.compare(options['compare'], results, options['threshold'])
+
+    def client_sender(self, token_key, cold_cache=False):
+        client = APIClient(SERVER_NAME='localhost')
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token_key}')
+
+        def send(method, path, params):
+            if cold_cache:
+                cache.clear()
+            response = client.get(path, params) if method == 'get' else client.post(path, params)
+            return response.status_code
+        return send
+
+    def http_sender(self, base_url, token_key):
+        def send(method, path, params):
+            url = base_url.rstrip('/') + path
+            if method == 'get' and params:
+                url += '?' + urlencode(params)
+            data = urlencode(params).encode() if method == 'post' else None
+            request = urllib.request.Request(url, data=data, method=method.upper(),
+                                             headers={'Authorization': f'Token {token_key}'})
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+                    return response.status
+            except urllib.error.HTTPError as exc:
+                return exc.code
+        return send
+
+    def run_endpoint(self, calls):
+        latencies, errors, queries = [], 0, []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(count):
+            for method, path, params in calls:
+                call_started = time.perf_counter()
+                status_code = self.send(method, path, params)
+                latencies.append(time.perf_counter() - call_started)
+                if status_code >= 400:
+                    errors += 1
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            'requests': len(calls),
+            'errors': errors,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+            'rps': round(len(calls) / elapsed, 1),
+            'queries_per_request': round(len(queries) / len(calls), 2) if self.count_queries else None,
+        }
+
+    def report(self, name, result):
+        queries = result['queries_per_request']
+        self.stdout.write(
+            f"{name:<18} p50 {result['p50_ms']:>8.2f} ms  p95 {result['p95_ms']:>8.2f} ms  "
+            f"p99 {result['p99_ms']:>8.2f} ms  {result['rps']:>8.1f} req/s  "
+            f"{'-' if queries is None else queries:>6} q/req  {result['errors']} errors"
+        )
+
+    def compare(self, path, results, threshold):
+        with open(path) as fileobj:
+            previous = json.load(fileobj)['endpoints']
+        regressions = []
+        self.stdout.write(f"\nCompared with {path}:")
+        for name, current in results.items():
+            before = previous.get(name)
+            if not before:
+                continue
+            ratio = current['p95_ms'] / before['p95_ms'] if before['p95_ms'] else 1.0
+            more_queries = (
+                current['queries_per_request'] is not None and before['queries_per_request'] is not None
+                and current['queries_per_request'] > before['queries_per_request']
+            )
+            line = f"{name:<18} p95 {before['p95_ms']:.2f} -> {current['p95_ms']:.2f} ms ({ratio - 1:+.0%})"
+            if more_queries:
+                line += f", queries {before['queries_per_request']} -> {current['queries_per_request']}"
+            if ratio > 1 + threshold or more_queries:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+        if regressions:
+            raise CommandError(f"Regressions: {', '.join(regressions)}")
@@ -0,0 +1,86 @@
+import time
+from contextlib import contextmanager
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from library.benchmarks import seed_books, seed_loans, seed_users
+from library.models import Book, Loan
+
+CHANGELISTS = {
+    'loans': (Loan, '/admin/library/loan/', ('user__username', 'book__title', 'book__author')),
+    'books': (Book, '/admin/library/book/', ('title', 'author', 'isbn')),
+}
+SCENARIOS = {
+    'plain': {},
+    'filtered': {'returned__exact': '0'},
+    'searched': {'q': 'silver'},
+    'user search': {'q': 'bench-user-12'},
+}
+
+
+@contextmanager
+def stock_admin(model, search_fields):
+    """Put a registered ModelAdmin back on Django's defaults: exact counts and icontains search."""
+    model_admin = admin.site._registry[model]
+    model_admin.paginator = Paginator
+    model_admin.show_full_result_count = True
+    model_admin.search_fields = search_fields
+    model_admin.get_search_results = admin.ModelAdmin.get_search_results.__get__(model_admin)
+    try:
+        yield
+    finally:
+        for name in ('paginator', 'show_full_result_count', 'search_fields', 'get_search_results'):
+            del model_admin.__dict__[name]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time admin changelists (plain, filtered and searched) with Django's stock counting and "
+        "icontains search against the indexed configuration in library/admin.py."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loans', type=int, default=1_000_000)
+        parser.add_argument('--books', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=3, help="Timed requests per measurement.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Seeding up to {options['loans']} loans and {options['books']} books...")
+        user_ids = seed_users(1000)
+        book_ids = seed_books(options['books'], options['seed'])
+        seed_loans(options['loans'], user_ids, book_ids, options['seed'], open_ratio=0.01)
+
+        superuser, _ = get_user_model().objects.get_or_create(
+            username='bench-admin', defaults={'is_staff': True, 'is_superuser': True},
+        )
+        client = Client(SERVER_NAME='localhost')
+        client.force_login(superuser)
+
+        self.stdout.write(f"{'changelist':<24}{'stock':>20}{'indexed':>20}")
+        for name, (model, path, search_fields) in CHANGELISTS.items():
+            for scenario, params in SCENARIOS.items():
+                if scenario == 'filtered' and model is not Loan:
+                    continue
+                with stock_admin(model, search_fields):
+                    stock = self.time(client, path, params, options['repeat'])
+                indexed = self.time(client, path, params, options['repeat'])
+                self.stdout.write(
+                    f"{f'{name} {scenario}':<24}"
+                    f"{stock[0]:>10.1f} ms {stock[1]:>2} q{indexed[0]:>10.1f} ms {indexed[1]:>2} q"
+                )
+
+    def time(self, client, path, params, repeat):
+        """Mean latency in ms and the queries of one request."""
+        started = time.perf_counter()
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(path, params)
+            assert response.status_code == 200, response.status_code
+        return (time.perf_counter() - started) / repeat * 1000, len(queries)
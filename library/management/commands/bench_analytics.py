@@ -0,0 +1,70 @@
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from library import analytics
+from library.benchmarks import percentile, seed_books, seed_loans, seed_users
+from library.models import Loan
+
+
+class Command(BaseCommand):
+    help = "Latency of the analytics endpoints served from rollups vs. the same GROUP BY over the loan table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loans', type=int, default=1_000_000)
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Seeding up to {options['loans']} loans...")
+        seed_loans(options['loans'], seed_users(1000), seed_books(10_000, options['seed']), options['seed'])
+
+        started = time.perf_counter()
+        loans = sum(count for _, count in analytics.rebuild())
+        self.stdout.write(f"Rebuilt rollups from {loans} loans in {time.perf_counter() - started:.1f} s\n")
+
+        staff, _ = get_user_model().objects.get_or_create(username='bench-staff', defaults={'is_staff': True})
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(user=staff)
+        since = timezone.now() - timedelta(days=30)
+
+        cases = {
+            'top-books (30 days)': (
+                lambda: client.get('/api/analytics/top-books/', {'days': 30}),
+                lambda: list(Loan.objects.filter(loan_date__gte=since).values('book_id', 'book__title')
+                             .annotate(n=Count('id')).order_by('-n')[:10]),
+            ),
+            'daily (30 days)': (
+                lambda: client.get('/api/analytics/daily/'),
+                lambda: list(Loan.objects.filter(loan_date__gte=since).annotate(day=TruncDate('loan_date'))
+                             .values('day').annotate(n=Count('id')).order_by('day')),
+            ),
+            'top-users': (
+                lambda: client.get('/api/analytics/top-users/'),
+                lambda: list(Loan.objects.values('user_id').annotate(
+                    n=Count('id'), r=Count('id', filter=Q(returned=True))).order_by('-n')[:10]),
+            ),
+        }
+        for name, (rollup, group_by) in cases.items():
+            cache.clear()
+            cold = self.time(rollup, 1)
+            self.stdout.write(
+                f"{name:<22} rollup endpoint first {cold:>8.2f} ms, p50 {self.time(rollup, options['requests']):>8.2f} ms   "
+                f"GROUP BY loans p50 {self.time(group_by, max(3, options['requests'] // 10)):>9.2f} ms"
+            )
+
+    def time(self, fn, n):
+        samples = []
+        for _ in range(n):
+            started = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - started)
+        samples.sort()
+        return percentile(samples, 50) * 1000
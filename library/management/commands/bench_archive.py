@@ -0,0 +1,84 @@
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from library.benchmarks import percentile, seed_books, seed_loans, seed_users
+from library.lifecycle import archive_returned_loans
+from library.models import ArchivedLoan, Book, Loan
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the loan endpoints and a borrow/return cycle against a live loan table holding all "
+        "history, then again after archiving loans returned more than --archive-days ago."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loans', type=int, default=1_000_000)
+        parser.add_argument('--archive-days', type=int, default=90)
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=20, help="Timed requests per measurement.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Seeding up to {options['loans']} loans...")
+        user_ids = seed_users(1000)
+        book_ids = seed_books(10_000, options['seed'])
+        seed_loans(options['loans'], user_ids, book_ids, options['seed'], open_ratio=0.01)
+
+        User = get_user_model()
+        staff, _ = User.objects.get_or_create(username='bench-staff', defaults={'is_staff': True})
+        member = User.objects.get(pk=user_ids[0])
+        book, _ = Book.objects.get_or_create(isbn='bench-archive', defaults={'title': "Cycle", 'author': "Bench"})
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.repeat = options['repeat']
+
+        before, live_before = self.measure(staff, member, book)
+        started = time.perf_counter()
+        moved = sum(chunk_moved for *_, chunk_moved in archive_returned_loans(
+            timezone.now() - timedelta(days=options['archive_days']), options['chunk_size'],
+        ))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"Archived {moved} loans in {elapsed:.1f} s ({moved / elapsed if elapsed else 0:.0f} rows/s)")
+        after, live_after = self.measure(staff, member, book)
+
+        self.stdout.write(f"{'p50 latency':<34}{'all history':>14}{'archived':>14}")
+        for name in before:
+            self.stdout.write(f"{name:<34}{before[name]:>11.2f} ms{after[name]:>11.2f} ms")
+        self.stdout.write(
+            f"live loans: {live_before} -> {live_after}, archived: {ArchivedLoan.objects.count()}"
+        )
+
+    def measure(self, staff, member, book):
+        results = {
+            'staff loan list (exact count)': self.time(staff, 'get', '/api/loans/'),
+            'staff open loans (exact count)': self.time(staff, 'get', '/api/loans/', {'returned': 'false'}),
+            'member loan list': self.time(member, 'get', '/api/loans/'),
+            'borrow + return': self.cycle(member, book),
+        }
+        return results, Loan.objects.count()
+
+    def time(self, user, method, path, params=None):
+        self.client.force_authenticate(user=user)
+        samples = []
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            response = getattr(self.client, method)(path, params)
+            samples.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.content
+        return percentile(sorted(samples), 50) * 1000
+
+    def cycle(self, member, book):
+        self.client.force_authenticate(user=member)
+        samples = []
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            borrowed = self.client.post(f'/api/books/{book.pk}/borrow/')
+            returned = self.client.post(f'/api/books/{book.pk}/return_book/')
+            samples.append(time.perf_counter() - started)
+            assert borrowed.status_code == returned.status_code == 200, (borrowed.content, returned.content)
+        return percentile(sorted(samples), 50) * 1000
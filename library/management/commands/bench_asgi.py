@@ -0,0 +1,157 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from library.benchmarks import free_port, seed_books, seed_loans, seed_users, tree_rss_kb
+from library.models import Book
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare gunicorn sync workers serving the DRF views with uvicorn serving the async "
+        "views at high concurrency: requests per second and server memory per open connection."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Worker processes for each server.")
+        parser.add_argument('--concurrency', type=int, default=200, help="Simultaneous client connections.")
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds of load per server.")
+        parser.add_argument('--books', type=int, default=10_000)
+        parser.add_argument('--loans', type=int, default=20_000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if settings.DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3' and \
+                str(settings.DATABASES['default']['NAME']).startswith(':memory:'):
+            raise CommandError("The servers need a database file they can open.")
+
+        self.stdout.write("Seeding dataset...")
+        user_ids = seed_users(200)
+        book_ids = seed_books(options['books'], options['seed'])
+        seed_loans(options['loans'], user_ids, book_ids, options['seed'])
+        user, _ = get_user_model().objects.get_or_create(username='bench-asgi', defaults={'is_staff': True})
+        token, _ = Token.objects.get_or_create(user=user)
+        book_id = Book.objects.order_by('pk').values_list('pk', flat=True).first()
+
+        def paths(prefix):
+            return [
+                f'{prefix}books/?page=3',
+                f'{prefix}books/?search=silver',
+                f'{prefix}books/{book_id}/',
+                f'{prefix}loans/',
+            ]
+
+        port = free_port()
+        wsgi = [sys.executable, '-m', 'gunicorn', 'capstone_library_api.wsgi',
+                '-w', str(options['workers']), '-b', f'127.0.0.1:{port}', '--log-level', 'warning']
+        aport = free_port()
+        asgi = [sys.executable, '-m', 'uvicorn', 'capstone_library_api.asgi:application',
+                '--workers', str(options['workers']), '--port', str(aport), '--log-level', 'warning',
+                '--no-access-log']
+
+        self.stdout.write(
+            f"{options['concurrency']} connections, {options['workers']} workers, {options['duration']:.0f} s each\n"
+        )
+        for label, command, target_port, prefix in (
+            ('WSGI (gunicorn, sync)', wsgi, port, '/api/'),
+            ('ASGI (uvicorn, async)', asgi, aport, '/api/async/'),
+        ):
+            result = self.run_server(command, target_port, paths(prefix), token.key, options)
+            self.stdout.write(
+                f"{label:<24}{result['rps']:>9.0f} req/s  {result['errors']:>6} errors  "
+                f"RSS {result['idle_kb'] / 1024:>6.1f} -> {result['peak_kb'] / 1024:>6.1f} MB  "
+                f"{result['per_connection_kb']:>7.1f} KB/connection"
+            )
+
+    def run_server(self, command, port, paths, token_key, options):
+        # Response caching is off so both servers do the full request work
+        env = {**os.environ, 'LIBRARY_RESPONSE_CACHE_TTL': '0'}
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env)
+        try:
+            asyncio.run(self.wait_ready(port, paths[0], token_key))
+            idle_kb = tree_rss_kb(server.pid)
+            result = asyncio.run(self.load(port, paths, token_key, server.pid, options))
+            result['idle_kb'] = idle_kb
+            result['per_connection_kb'] = max(result['peak_kb'] - idle_kb, 0) / options['concurrency']
+            return result
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    async def wait_ready(self, port, path, token_key):
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            except OSError:
+                await asyncio.sleep(0.2)
+                continue
+            status, _ = await self.request(reader, writer, path, token_key)
+            writer.close()
+            if status != 200:
+                raise CommandError(f"Warm-up request to {path} returned {status}.")
+            return
+        raise CommandError(f"Server on port {port} did not start.")
+
+    async def request(self, reader, writer, path, token_key):
+        """Send one GET; return (status, keep_alive)."""
+        writer.write(
+            f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+            f'Authorization: Token {token_key}\r\n\r\n'.encode()
+        )
+        await writer.drain()
+        head = await reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        status = int(lines[0].split()[1])
+        headers = dict(line.lower().split(': ', 1) for line in lines[1:] if ': ' in line)
+        if 'content-length' in headers:
+            await reader.readexactly(int(headers['content-length']))
+            return status, headers.get('connection') != 'close'
+        await reader.read()
+        return status, False
+
+    async def load(self, port, paths, token_key, server_pid, options):
+        deadline = time.monotonic() + options['duration']
+        done = errors = 0
+        peak_kb = 0
+
+        async def client(offset):
+            nonlocal done, errors
+            writer = None
+            n = offset
+            while time.monotonic() < deadline:
+                try:
+                    if writer is None:
+                        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                    status, keep_alive = await self.request(reader, writer, paths[n % len(paths)], token_key)
+                    n += 1
+                    done += 1
+                    errors += status >= 400
+                    if not keep_alive:
+                        writer.close()
+                        writer = None
+                except (OSError, asyncio.IncompleteReadError, ValueError):
+                    errors += 1
+                    if writer is not None:
+                        writer.close()
+                    writer = None
+            if writer is not None:
+                writer.close()
+
+        async def sample_memory():
+            nonlocal peak_kb
+            while time.monotonic() < deadline:
+                peak_kb = max(peak_kb, await asyncio.to_thread(tree_rss_kb, server_pid))
+                await asyncio.sleep(0.25)
+
+        started = time.perf_counter()
+        await asyncio.gather(sample_memory(), *(client(i) for i in range(options['concurrency'])))
+        elapsed = time.perf_counter() - started
+        return {'rps': done / elapsed, 'errors': errors, 'peak_kb': peak_kb}
@@ -0,0 +1,48 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from library.authentication import CachedTokenAuthentication, token_cache
+from library.benchmarks import seed_books
+from library.models import Book
+from library.views import BookViewSet
+
+
+class Command(BaseCommand):
+    help = "Requests per second on an authenticated endpoint with stock vs. cached token authentication."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        seed_books(1)
+        book = Book.objects.order_by('pk').first()
+        user, _ = get_user_model().objects.get_or_create(username='bench-auth')
+        token, _ = Token.objects.get_or_create(user=user)
+        client = APIClient(SERVER_NAME='localhost')
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        url = f'/api/books/{book.pk}/'
+
+        original = BookViewSet.authentication_classes
+        try:
+            for auth_class in (TokenAuthentication, CachedTokenAuthentication):
+                BookViewSet.authentication_classes = [auth_class]
+                token_cache.clear()
+                client.get(url)  # warm the response cache and the token cache
+                queries = []
+                with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+                    started = time.perf_counter()
+                    for _ in range(options['requests']):
+                        client.get(url)
+                    elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{auth_class.__name__:<28}{options['requests'] / elapsed:>10.0f} req/s"
+                    f"{len(queries) / options['requests']:>8.2f} queries/req"
+                )
+        finally:
+            BookViewSet.authentication_classes = original
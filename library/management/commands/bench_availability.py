@@ -0,0 +1,106 @@
+import asyncio
+import random
+import time
+import tracemalloc
+
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from library import services
+from library.benchmarks import WebsocketClient, seed_books, seed_users
+from library.models import Book, Loan
+from library.routing import websocket_urlpatterns
+
+
+class Command(BaseCommand):
+    help = (
+        "Connect thousands of idle availability subscribers in-process, then borrow in a burst "
+        "and measure memory per subscriber, fan-out latency and messages per subscriber."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=5000)
+        parser.add_argument('--books', type=int, default=500, help="Books the subscribers are spread over.")
+        parser.add_argument('--burst-books', type=int, default=5, help="Books borrowed during the burst.")
+        parser.add_argument('--burst', type=int, default=20, help="Borrows per burst book.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        book_ids = seed_books(options['books'], options['seed'])[:options['books']]
+        burst_books = book_ids[:options['burst_books']]
+        readers = list(get_user_model().objects.filter(pk__in=seed_users(options['burst'], 'bench-reader')))
+        # Reset the burst books so every borrow succeeds
+        Loan.objects.filter(book_id__in=burst_books, returned=False).update(returned=True, return_date=timezone.now())
+        Book.objects.filter(pk__in=burst_books).update(number_of_copies_available=options['burst'])
+        asyncio.run(self.run(options, book_ids, burst_books, readers))
+
+    async def run(self, options, book_ids, burst_books, readers):
+        application = URLRouter(websocket_urlpatterns)
+        rng = random.Random(options['seed'])
+        n = options['subscribers']
+
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        clients, watching = [], []
+        for _ in range(n):
+            client = WebsocketClient(application, '/ws/availability/')
+            await client.connect()
+            book_id = rng.choice(book_ids)
+            await client.send_json_to({'action': 'subscribe', 'books': [book_id]})
+            await client.receive_json_from(timeout=10)  # current-count snapshot
+            clients.append(client)
+            watching.append(book_id)
+        connect_time = time.perf_counter() - started
+        per_subscriber = (tracemalloc.get_traced_memory()[0] - baseline) / n
+        tracemalloc.stop()
+        self.stdout.write(
+            f"{n} subscribers connected in {connect_time:.2f} s, "
+            f"{per_subscriber / 1024:.1f} KB Python heap each"
+        )
+
+        # Idle subscribers must cost nothing: wait a few ticks and expect silence
+        quiet = await asyncio.gather(*(client.receive_nothing(timeout=0.5) for client in clients))
+        self.stdout.write(f"Idle: {quiet.count(False)} unexpected messages")
+
+        def burst():
+            for book_id in burst_books:
+                book = Book(pk=book_id)
+                for reader in readers:
+                    services.borrow_book(reader, book)
+
+        started = time.perf_counter()
+        await sync_to_async(burst)()
+        borrowed = time.perf_counter()
+        burst_set = set(burst_books)
+        affected = [client for client, book_id in zip(clients, watching) if book_id in burst_set]
+
+        async def first_update(client):
+            message = await client.receive_json_from(timeout=10)
+            return time.perf_counter(), message
+
+        deliveries = await asyncio.gather(*(first_update(client) for client in affected))
+        extra = await asyncio.gather(*(client.receive_nothing(timeout=0.5) for client in clients))
+        last_delivery = max((at for at, _ in deliveries), default=borrowed)
+        total_borrows = len(burst_books) * len(readers)
+        self.stdout.write(
+            f"Burst: {total_borrows} borrows in {(borrowed - started) * 1000:.0f} ms, "
+            f"{len(deliveries)} subscribers updated, last {(last_delivery - borrowed) * 1000:.0f} ms after the last commit"
+        )
+        self.stdout.write(
+            f"Messages per affected subscriber: "
+            f"{(len(deliveries) + extra.count(False)) / len(deliveries) if deliveries else 0:.2f} "
+            f"(instead of {len(readers)} without coalescing)"
+        )
+
+        for client in clients:
+            await client.disconnect()
+
+        def give_back():
+            for book_id in burst_books:
+                for reader in readers:
+                    services.return_book(reader, Book(pk=book_id))
+        await sync_to_async(give_back)()
@@ -0,0 +1,56 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from library.benchmarks import percentile, seed_books
+from library.models import Book, Loan
+
+
+class Command(BaseCommand):
+    help = "Checkout desk: borrow and return a stack of books with one call per book vs. one batch call."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stack', type=int, default=20, help="Books scanned per checkout.")
+        parser.add_argument('--rounds', type=int, default=50)
+
+    def handle(self, *args, **options):
+        book_ids = seed_books(options['stack'])[:options['stack']]
+        Book.objects.filter(pk__in=book_ids).update(number_of_copies_available=1000)
+        member, _ = get_user_model().objects.get_or_create(username='bench-desk')
+        Loan.objects.filter(user=member, returned=False).update(returned=True)
+        token, _ = Token.objects.get_or_create(user=member)
+        client = APIClient(SERVER_NAME='localhost')
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        def single(kind):
+            for pk in book_ids:
+                response = client.post(f'/api/books/{pk}/{kind}/')
+                assert response.status_code == 200, response.data
+
+        def batch(kind):
+            response = client.post(f'/api/books/batch-{kind}/', {'books': book_ids}, format='json')
+            assert response.data['failed'] == 0, response.data
+
+        for name, borrow, give_back in (
+            (f"{options['stack']} single calls", lambda: single('borrow'), lambda: single('return_book')),
+            ("1 batch call", lambda: batch('borrow'), lambda: batch('return')),
+        ):
+            timings = {'borrow': [], 'return': []}
+            queries = []
+            with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+                for _ in range(options['rounds']):
+                    for kind, run in (('borrow', borrow), ('return', give_back)):
+                        started = time.perf_counter()
+                        run()
+                        timings[kind].append(time.perf_counter() - started)
+            for samples in timings.values():
+                samples.sort()
+            self.stdout.write(
+                f"{name:<18} borrow p50 {percentile(timings['borrow'], 50) * 1000:>7.1f} ms  "
+                f"return p50 {percentile(timings['return'], 50) * 1000:>7.1f} ms  "
+                f"{len(queries) / options['rounds']:>6.0f} queries per borrow + return"
+            )
@@ -0,0 +1,81 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from rest_framework.test import APIClient
+
+from library.benchmarks import percentile
+from library.models import Book, Loan
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire N concurrent borrows at a single book on the configured database "
+        "and report throughput, latency and whether any copies were oversold."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Number of borrow calls (one user each).")
+        parser.add_argument('--concurrency', type=int, default=16, help="Worker threads firing requests.")
+        parser.add_argument('--copies', type=int, default=50, help="Copies the benchmark book starts with.")
+        parser.add_argument('--keep', action='store_true', help="Keep the benchmark rows instead of deleting them.")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        run_id = uuid.uuid4().hex[:8]
+        copies = options['copies']
+
+        book = Book.objects.create(
+            title=f"Benchmark book {run_id}",
+            author="bench",
+            isbn=run_id,
+            number_of_copies_available=copies,
+        )
+        User.objects.bulk_create([
+            User(username=f"bench-{run_id}-{i}") for i in range(options['requests'])
+        ])
+        users = list(User.objects.filter(username__startswith=f"bench-{run_id}-"))
+        url = f"/api/books/{book.pk}/borrow/"
+
+        def borrow(user):
+            client = APIClient(SERVER_NAME='localhost')
+            client.force_authenticate(user=user)
+            started = time.perf_counter()
+            response = client.post(url)
+            elapsed = time.perf_counter() - started
+            close_old_connections()
+            return response.status_code, elapsed
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(borrow, users))
+        wall = time.perf_counter() - started
+
+        latencies = sorted(elapsed for _, elapsed in results)
+        succeeded = sum(1 for code, _ in results if code == 200)
+        rejected = sum(1 for code, _ in results if code == 400)
+        errors = len(results) - succeeded - rejected
+
+        book.refresh_from_db()
+        open_loans = Loan.objects.filter(book=book, returned=False).count()
+        oversold = open_loans + book.number_of_copies_available != copies or open_loans > copies
+
+        self.stdout.write(f"requests:     {len(results)} ({options['concurrency']} threads)")
+        self.stdout.write(f"succeeded:    {succeeded}")
+        self.stdout.write(f"rejected:     {rejected}")
+        self.stdout.write(f"errors:       {errors}")
+        self.stdout.write(f"throughput:   {len(results) / wall:.1f} req/s")
+        self.stdout.write(f"p50 latency:  {percentile(latencies, 50) * 1000:.1f} ms")
+        self.stdout.write(f"p99 latency:  {percentile(latencies, 99) * 1000:.1f} ms")
+        self.stdout.write(f"copies left:  {book.number_of_copies_available} / {copies}, open loans: {open_loans}")
+        if oversold:
+            self.stdout.write(self.style.ERROR("OVERSOLD: open loans and remaining copies do not add up."))
+        else:
+            self.stdout.write(self.style.SUCCESS("No copies were oversold."))
+
+        if not options['keep']:
+            book.delete()
+            User.objects.filter(username__startswith=f"bench-{run_id}-").delete()
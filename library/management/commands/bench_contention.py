@@ -0,0 +1,110 @@
+import argparse
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.test import APIClient
+
+from library.benchmarks import percentile, seed_books, seed_loans, seed_users
+from library.models import Book, Loan
+
+MODES = {
+    'sqlite': [
+        ("stock SQLite", {'LIBRARY_SQLITE_TUNED': 'False', 'LIBRARY_DB_LOCK_RETRIES': '0'}),
+        ("WAL + retries", {'LIBRARY_SQLITE_TUNED': 'True', 'LIBRARY_SQLITE_WAL': 'True'}),
+    ],
+    'postgresql': [
+        ("persistent", {'DATABASE_POOL': 'False'}),
+        ("pooled", {'DATABASE_POOL': 'True'}),
+    ],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Mixed read/write contention: --workers processes, like gunicorn sync workers, list loans "
+        "and borrow/return books for --seconds. Reports throughput and errors per database mode "
+        "(stock vs. tuned SQLite, or persistent vs. pooled PostgreSQL connections)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=10.0)
+        parser.add_argument('--writes', type=float, default=0.3, help="Fraction of requests that write.")
+        parser.add_argument('--loans', type=int, default=100_000)
+        parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['worker'] is not None:
+            return self.work(options)
+
+        seed_loans(options['loans'], seed_users(max(100, options['workers'])), seed_books(1000))
+        seed_users(options['workers'], 'bench-contend')
+        Book.objects.filter(isbn__startswith='978').update(number_of_copies_available=100)
+        vendor = connection.vendor
+        self.stdout.write(
+            f"{options['workers']} workers, {options['writes']:.0%} writes, {options['seconds']:.0f} s per mode"
+        )
+        for label, env in MODES[vendor]:
+            Loan.objects.filter(user__username__startswith='bench-contend-', returned=False).update(returned=True)
+            connection.close()
+            if vendor == 'sqlite':
+                # The journal mode is stored in the file; put back the one this mode starts from
+                with sqlite3.connect(settings.DATABASES['default']['NAME']) as db:
+                    db.execute('PRAGMA journal_mode=DELETE')
+            results = self.run_workers(options, env)
+            writes = sorted(sum((result['write_latencies'] for result in results), []))
+            total = {name: sum(result[name] for result in results) for name in ('reads', 'writes', 'errors')}
+            self.stdout.write(
+                f"{label:<16}{total['reads'] / options['seconds']:>8.0f} reads/s"
+                f"{total['writes'] / options['seconds']:>8.0f} writes/s"
+                f"{total['errors']:>8} errors   write p99 {percentile(writes, 99) * 1000:.0f} ms"
+            )
+
+    def run_workers(self, options, env):
+        command = [
+            sys.executable, sys.argv[0], 'bench_contention', '--seconds', str(options['seconds']),
+            '--writes', str(options['writes']),
+        ]
+        workers = [
+            subprocess.Popen(command + ['--worker', str(n)], stdout=subprocess.PIPE, env={**os.environ, **env})
+            for n in range(options['workers'])
+        ]
+        return [json.loads(worker.communicate()[0].decode().splitlines()[-1]) for worker in workers]
+
+    def work(self, options):
+        rng = random.Random(options['worker'])
+        member = get_user_model().objects.get(username=f"bench-contend-{options['worker']}")
+        book_ids = list(Book.objects.filter(isbn__startswith='978').values_list('pk', flat=True)[:500])
+        client = APIClient(SERVER_NAME='localhost', raise_request_exception=False)
+        client.force_authenticate(user=member)
+        counts = {'reads': 0, 'writes': 0, 'errors': 0, 'write_latencies': []}
+        borrowed = None
+        deadline = time.perf_counter() + options['seconds']
+        while time.perf_counter() < deadline:
+            if rng.random() >= options['writes']:
+                response = client.get('/api/loans/', {'page_size': 20})
+                kind = 'reads'
+            else:
+                started = time.perf_counter()
+                if borrowed is None:
+                    borrowed = rng.choice(book_ids)
+                    response = client.post(f'/api/books/{borrowed}/borrow/')
+                    if response.status_code != 200:
+                        borrowed = None
+                else:
+                    response = client.post(f'/api/books/{borrowed}/return_book/')
+                    borrowed = None
+                counts['write_latencies'].append(time.perf_counter() - started)
+                kind = 'writes'
+            counts[kind if response.status_code < 500 else 'errors'] += 1
+        self.stdout.write(json.dumps(counts))
+
@@ -0,0 +1,118 @@
+import http.client
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from library.benchmarks import free_port, seed_books, seed_loans, seed_users, tree_rss_kb
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure time-to-first-byte, throughput and peak memory of the streaming loan export, "
+        "in-process or (with --uvicorn) over HTTP from a uvicorn server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loans', type=int, default=5_000_000, help="Seed the loan table up to this many rows.")
+        parser.add_argument('--file-format', choices=['ndjson', 'csv'], default='ndjson')
+        parser.add_argument('--uvicorn', action='store_true',
+                            help="Stream from a uvicorn worker and sample its resident memory.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Seeding up to {options['loans']} loans...")
+        seed_loans(options['loans'], seed_users(1000), seed_books(10_000, options['seed']), options['seed'])
+
+        staff, _ = get_user_model().objects.get_or_create(username='bench-staff', defaults={'is_staff': True})
+        params = {'file_format': options['file_format']}
+        if options['uvicorn']:
+            return self.over_uvicorn(staff, params)
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(user=staff)
+
+        # Timed pass without tracing overhead
+        started = time.perf_counter()
+        response = client.get('/api/loans/export/', params)
+        stream = iter(response.streaming_content)
+        size = len(next(stream))
+        ttfb = time.perf_counter() - started
+        for chunk in stream:
+            size += len(chunk)
+        total = time.perf_counter() - started
+
+        # Second pass only to record the peak Python heap while streaming
+        tracemalloc.start()
+        for _ in client.get('/api/loans/export/', params).streaming_content:
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.stdout.write(f"time to first byte: {ttfb * 1000:.1f} ms")
+        self.stdout.write(f"total:              {total:.1f} s ({size / total / 2**20:.1f} MiB/s, {size / 2**20:.0f} MiB)")
+        self.stdout.write(f"peak heap:          {peak / 2**20:.1f} MiB")
+
+    def over_uvicorn(self, staff, params):
+        if str(settings.DATABASES['default']['NAME']).startswith(':memory:'):
+            raise CommandError("The server needs a database file it can open.")
+        token, _ = Token.objects.get_or_create(user=staff)
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'capstone_library_api.asgi:application',
+             '--port', str(port), '--log-level', 'warning', '--no-access-log'],
+            cwd=settings.BASE_DIR,
+        )
+        try:
+            self.wait_ready(port)
+            # Anonymous memory only: the memory-mapped database file grows RSS too
+            idle_kb = peak_kb = tree_rss_kb(server.pid, 'RssAnon')
+            done = threading.Event()
+
+            def sample_memory():
+                nonlocal peak_kb
+                while not done.wait(0.1):
+                    peak_kb = max(peak_kb, tree_rss_kb(server.pid, 'RssAnon'))
+
+            sampler = threading.Thread(target=sample_memory)
+            sampler.start()
+            try:
+                started = time.perf_counter()
+                connection = http.client.HTTPConnection('127.0.0.1', port)
+                connection.request('GET', f'/api/loans/export/?{urlencode(params)}',
+                                   headers={'Authorization': f'Token {token.key}'})
+                response = connection.getresponse()
+                if response.status != 200:
+                    raise CommandError(f"Export returned {response.status}.")
+                size = len(response.read1())
+                ttfb = time.perf_counter() - started
+                while chunk := response.read1():
+                    size += len(chunk)
+                total = time.perf_counter() - started
+            finally:
+                done.set()
+                sampler.join()
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+        self.stdout.write(f"time to first byte: {ttfb * 1000:.1f} ms")
+        self.stdout.write(f"total:              {total:.1f} s ({size / total / 2**20:.1f} MiB/s, {size / 2**20:.0f} MiB)")
+        self.stdout.write(f"server anon RSS:    {idle_kb / 1024:.1f} -> {peak_kb / 1024:.1f} MiB")
+
+    def wait_ready(self, port):
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                http.client.HTTPConnection('127.0.0.1', port, timeout=5).connect()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f"Server on port {port} did not start.")
@@ -0,0 +1,122 @@
+import asyncio
+import random
+import time
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from library.benchmarks import WebsocketClient, seed_users
+from library.models import Book, Hold, Loan
+from library.routing import websocket_urlpatterns
+
+MODES = {
+    'retry': "retry borrow every tick",
+    'poll': "place a hold, poll GET /api/holds/",
+    'push': "place a hold, wait for hold_ready on the WebSocket",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate a hot title wanted by many members and compare the requests generated when "
+        "clients retry borrow, poll their holds, or wait for the hold_ready push."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=100)
+        parser.add_argument('--copies', type=int, default=5)
+        parser.add_argument('--loan-ticks', type=int, default=3, help="Ticks a member keeps the book.")
+        parser.add_argument('--poll-every', type=int, default=1,
+                            help="Ticks between a queued member's checks of GET /api/holds/.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        members = list(get_user_model().objects.filter(pk__in=seed_users(options['members'], 'bench-hot')))
+        tokens = {member: Token.objects.get_or_create(user=member)[0].key for member in members}
+        book, _ = Book.objects.get_or_create(isbn='bench-hot', defaults={'title': "Hot Title", 'author': "Bench"})
+        self.client = APIClient(SERVER_NAME='localhost')
+
+        for mode, description in MODES.items():
+            # Same starting state for every run
+            Loan.objects.filter(book=book, returned=False).update(returned=True, return_date=timezone.now())
+            Hold.objects.filter(book=book, status__in=Hold.ACTIVE).update(status=Hold.Status.CANCELLED)
+            Book.objects.filter(pk=book.pk).update(number_of_copies_available=options['copies'])
+
+            rng = random.Random(options['seed'])
+            ticks, requests, elapsed = asyncio.run(self.simulate(mode, book, members[:], tokens, rng, options))
+            borrow_failed = requests['borrow failed']
+            self.stdout.write(
+                f"{mode:<5} ({description}): served {len(members)} members in {ticks} ticks; "
+                f"{requests['borrow'] + borrow_failed} borrows ({borrow_failed} failed), "
+                f"{requests['hold']} holds, {requests['poll']} hold checks, {requests['return']} returns; "
+                f"{sum(requests.values())} requests, {elapsed * 1000:.0f} ms server time"
+            )
+
+    def call(self, method, user, path, requests, kind, params=None):
+        self.client.force_authenticate(user=user)
+        started = time.perf_counter()
+        response = getattr(self.client, method)(path, params)
+        self.elapsed += time.perf_counter() - started
+        requests[kind if response.status_code < 400 else f'{kind} failed'] += 1
+        return response
+
+    async def simulate(self, mode, book, waiting, tokens, rng, options):
+        call = sync_to_async(self.call)
+        requests, self.elapsed = Counter(), 0.0
+        borrow_url, hold_url = f'/api/books/{book.pk}/borrow/', f'/api/books/{book.pk}/hold/'
+        reading = {}  # member -> tick the book goes back
+        queued = {}  # member -> WebSocket client in push mode, else None
+        tick = 0
+        while waiting or reading or queued:
+            for member, due in list(reading.items()):
+                if due <= tick:
+                    del reading[member]
+                    await call('post', member, f'/api/books/{book.pk}/return_book/', requests, 'return')
+
+            rng.shuffle(waiting)
+            for member in waiting[:]:
+                response = await call('post', member, borrow_url, requests, 'borrow')
+                if response.status_code == 200:
+                    waiting.remove(member)
+                    reading[member] = tick + options['loan_ticks']
+                elif mode != 'retry':
+                    # One attempt, then queue up
+                    waiting.remove(member)
+                    socket = None
+                    if mode == 'push':
+                        socket = WebsocketClient(URLRouter(websocket_urlpatterns), '/ws/availability/',
+                                                 f'token={tokens[member]}')
+                        await socket.connect()
+                    await call('post', member, hold_url, requests, 'hold')
+                    queued[member] = socket
+
+            ready = []
+            if mode == 'poll' and tick % options['poll_every'] == 0:
+                for member in queued:
+                    response = await call('get', member, '/api/holds/', requests, 'poll',
+                                          {'status': Hold.Status.READY, 'book': book.pk})
+                    if response.data['count']:
+                        ready.append(member)
+            elif mode == 'push' and queued:
+                # Let the hub flush this tick's allocations, then read the pushes
+                await asyncio.sleep(settings.LIBRARY_AVAILABILITY_TICK * 2)
+                for member, socket in queued.items():
+                    if not await socket.receive_nothing(timeout=0):
+                        message = await socket.receive_json_from()
+                        if message['type'] == 'hold_ready':
+                            ready.append(member)
+            for member in ready:
+                await call('post', member, borrow_url, requests, 'borrow')
+                socket = queued.pop(member)
+                if socket is not None:
+                    await socket.disconnect()
+                reading[member] = tick + options['loan_ticks']
+            tick += 1
+        return tick, requests, self.elapsed
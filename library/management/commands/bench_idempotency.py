@@ -0,0 +1,54 @@
+import time
+import uuid
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from library.benchmarks import seed_users
+from library.models import Book, Loan
+
+
+class Command(BaseCommand):
+    help = (
+        "Retry storm: every member borrows and returns a book, and each request is re-sent "
+        "--retries times as a flaky mobile client would. Compares retries without a key "
+        "(re-run by the server) with retries carrying an Idempotency-Key (replayed)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=200)
+        parser.add_argument('--retries', type=int, default=3, help="Extra copies of each request.")
+
+    def handle(self, *args, **options):
+        members = list(get_user_model().objects.filter(pk__in=seed_users(options['members'], 'bench-retry')))
+        book, _ = Book.objects.get_or_create(isbn='bench-retry', defaults={'title': "Retry", 'author': "Bench"})
+        self.client = APIClient(SERVER_NAME='localhost')
+
+        self.stdout.write(f"{'mode':<16}{'retry ms':>10}{'retry queries':>15}  retry responses")
+        for mode in ('no key', 'idempotency key'):
+            Loan.objects.filter(book=book, returned=False).update(returned=True, return_date=timezone.now())
+            Book.objects.filter(pk=book.pk).update(number_of_copies_available=len(members))
+            elapsed, queries, outcomes = 0.0, 0, Counter()
+            for member in members:
+                self.client.force_authenticate(user=member)
+                for verb in ('borrow', 'return_book'):
+                    headers = {'HTTP_IDEMPOTENCY_KEY': str(uuid.uuid4())} if mode != 'no key' else {}
+                    path = f'/api/books/{book.pk}/{verb}/'
+                    self.client.post(path, **headers)
+                    for _ in range(options['retries']):
+                        started = time.perf_counter()
+                        with CaptureQueriesContext(connection) as captured:
+                            response = self.client.post(path, **headers)
+                        elapsed += time.perf_counter() - started
+                        queries += len(captured)
+                        replayed = response.get('Idempotent-Replayed') == 'true'
+                        outcomes[f"{response.status_code}{' replayed' if replayed else ''}"] += 1
+            self.stdout.write(
+                f"{mode:<16}{elapsed * 1000:>10.0f}{queries:>15}  "
+                + ', '.join(f"{count} x {outcome}" for outcome, count in sorted(outcomes.items()))
+            )
@@ -0,0 +1,58 @@
+import random
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from library.benchmarks import seed_books
+from library.models import Book
+
+
+class Command(BaseCommand):
+    help = (
+        "Availability of --isbns ISBNs as one `/api/books/?isbn=` request per ISBN vs. one bulk "
+        "`/api/books/availability/` call (POST body and compact GET), with a cold and a warm cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10_000)
+        parser.add_argument('--isbns', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        seed_books(options['books'], options['seed'])
+        isbns = random.Random(options['seed']).sample(
+            list(Book.objects.values_list('isbn', flat=True)), min(options['isbns'], options['books'])
+        )
+        # A few ISBNs the catalog does not have, as partner lists always contain
+        isbns[:10] = [f"missing-{n}" for n in range(10)]
+        self.client = APIClient(SERVER_NAME='localhost')
+
+        runs = {
+            'per-ISBN GET': self.per_isbn,
+            'bulk POST': lambda isbns: self.client.post('/api/books/availability/', {'isbns': isbns}, format='json'),
+            'bulk GET ?isbns=': lambda isbns: self.client.get('/api/books/availability/', {'isbns': ','.join(isbns)}),
+        }
+        self.stdout.write(f"{len(isbns)} ISBNs")
+        self.stdout.write(f"{'mode':<20}{'cold ms':>10}{'queries':>9}{'warm ms':>10}{'queries':>9}")
+        for name, run in runs.items():
+            cache.clear()
+            cold = self.measure(run, isbns)
+            warm = self.measure(run, isbns)
+            self.stdout.write(f"{name:<20}{cold[0]:>10.1f}{cold[1]:>9}{warm[0]:>10.1f}{warm[1]:>9}")
+
+    def per_isbn(self, isbns):
+        for isbn in isbns:
+            response = self.client.get('/api/books/', {'isbn': isbn})
+            assert response.status_code == 200, response.content
+
+    def measure(self, run, isbns):
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as captured:
+            response = run(isbns)
+        elapsed = time.perf_counter() - started
+        assert response is None or response.status_code == 200, response.content
+        return elapsed * 1000, len(captured)
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from library.benchmarks import seed_books, seed_loans, seed_users
+from library.models import Loan
+from library.serializers import LoanSerializer, flat_loan, loan_values
+
+
+class Command(BaseCommand):
+    help = "Time loan serialization per 1,000 rows: nested LoanSerializer vs. the flat .values() path."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loans', type=int, default=1000, help="Rows serialized per run.")
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        count = options['loans']
+        seed_loans(count, seed_users(200), seed_books(2000, options['seed']), options['seed'])
+        loans = Loan.objects.order_by('-loan_date', '-id')
+
+        paths = {
+            'serializer (N+1)': lambda: LoanSerializer(loans[:count], many=True).data,
+            'serializer (select_related)': lambda: LoanSerializer(
+                loans.select_related('user', 'book')[:count], many=True
+            ).data,
+            'flat .values()': lambda: [flat_loan(row) for row in loan_values(loans)[:count]],
+        }
+        for name, run in paths.items():
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                run()
+            per_thousand = (time.perf_counter() - started) / options['repeat'] * 1000 * 1000 / count
+            self.stdout.write(f"{name:<30}{per_thousand:>10.2f} ms / 1,000 loans")
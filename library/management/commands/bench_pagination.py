@@ -0,0 +1,58 @@
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from rest_framework.pagination import Cursor
+from rest_framework.test import APIClient
+
+from library.benchmarks import seed_books, seed_loans, seed_users
+from library.models import Loan
+from library.pagination import LoanKeysetPagination
+
+
+class Command(BaseCommand):
+    help = "Compare page-number and keyset pagination latency on /api/loans/ at a shallow and a deep page."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, nargs='+', default=[1, 10_000], help="Page numbers to time.")
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=10, help="Timed requests per measurement.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        target = max(options['pages']) * page_size + page_size
+        self.stdout.write(f"Seeding up to {target} loans...")
+        user_ids = seed_users(200)
+        book_ids = seed_books(2000, options['seed'])
+        seed_loans(target, user_ids, book_ids, options['seed'])
+
+        staff, _ = get_user_model().objects.get_or_create(username='bench-staff', defaults={'is_staff': True})
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(user=staff)
+
+        self.stdout.write(f"{'page':>8}{'page-number':>16}{'keyset':>16}")
+        for page in options['pages']:
+            cursor = self.cursor_for_page(page, page_size)
+            numbered = self.time(client, {'page': page, 'page_size': page_size}, options['repeat'])
+            keyset = self.time(client, {'cursor': cursor, 'page_size': page_size}, options['repeat'])
+            self.stdout.write(f"{page:>8}{numbered:>13.2f} ms{keyset:>13.2f} ms")
+
+    def cursor_for_page(self, page, page_size):
+        """The cursor a client would hold after walking to `page`."""
+        if page == 1:
+            return ''
+        previous = Loan.objects.order_by('-loan_date', '-id')[(page - 1) * page_size - 1]
+        paginator = LoanKeysetPagination()
+        paginator.base_url = '/api/loans/'
+        position = paginator._get_position_from_instance(previous, paginator.ordering)
+        url = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+        return parse_qs(urlsplit(url).query)['cursor'][0]
+
+    def time(self, client, params, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            response = client.get('/api/loans/', params)
+            assert response.status_code == 200, response.content
+        return (time.perf_counter() - started) / repeat * 1000
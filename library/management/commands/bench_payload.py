@@ -0,0 +1,53 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from library.benchmarks import seed_books, seed_loans, seed_users
+from library.renderers import ORJSONRenderer, orjson
+
+CASES = [
+    ('books, full', '/api/books/', {}),
+    ('books, fields=id,title', '/api/books/', {'fields': 'id,title'}),
+    ('loans, full', '/api/loans/', {}),
+    ('loans, expand=', '/api/loans/', {'expand': ''}),
+    ('loans, fields=id,loan_date,book.title', '/api/loans/', {'fields': 'id,loan_date,book.title'}),
+]
+
+
+class Command(BaseCommand):
+    help = "Bytes on the wire and server CPU for a 100-row page, full vs. ?fields=/?expand=, stock JSON vs. orjson."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--page-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING("orjson is not installed; the orjson rows use the stock encoder."))
+        seed_loans(options['page_size'] * 10, seed_users(100), seed_books(options['page_size'] * 10))
+        staff, _ = get_user_model().objects.get_or_create(username='bench-staff', defaults={'is_staff': True})
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(user=staff)
+
+        self.stdout.write(f"{'':<48}{'bytes':>9}{'request CPU':>14}{'render CPU':>13}")
+        for name, url, params in CASES:
+            params = {**params, 'page_size': options['page_size']}
+            for renderer, accept in ((JSONRenderer(), 'application/json'), (ORJSONRenderer(), ORJSONRenderer.media_type)):
+                cpu = 0.0
+                for _ in range(options['requests']):
+                    cache.clear()  # measure serialization, not the catalog response cache
+                    started = time.process_time()
+                    response = client.get(url, params, HTTP_ACCEPT=accept)
+                    cpu += time.process_time() - started
+                started = time.process_time()
+                for _ in range(options['requests']):
+                    renderer.render(response.data)
+                render = time.process_time() - started
+                self.stdout.write(
+                    f"{name + ' [' + renderer.format + ']':<48}{len(response.content):>9}"
+                    f"{cpu / options['requests'] * 1000:>11.2f} ms{render / options['requests'] * 1000:>10.2f} ms"
+                )
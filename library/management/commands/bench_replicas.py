@@ -0,0 +1,107 @@
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from library import services
+from library.benchmarks import percentile, seed_books, seed_loans, seed_users
+from library.models import Book
+
+
+class Command(BaseCommand):
+    help = (
+        "Read throughput and latency of GET /api/loans/ under concurrent borrows and returns, "
+        "with every read on the primary vs. spread over DATABASE_REPLICA_URLS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--loans', type=int, default=50_000)
+        parser.add_argument('--sync', action='store_true',
+                            help="Copy the primary into the replicas first (SQLite files only).")
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("Set DATABASE_REPLICA_URLS, e.g. sqlite:////tmp/replica1.sqlite3,sqlite:////tmp/replica2.sqlite3")
+        user_ids = seed_users(max(100, options['writers']))
+        seed_loans(options['loans'], user_ids, seed_books(1000))
+        if options['sync']:
+            self.sync_replicas()
+
+        for label, replicas in (("primary only", []), (f"{len(settings.DATABASE_REPLICAS)} replicas", settings.DATABASE_REPLICAS)):
+            with override_settings(DATABASE_REPLICAS=replicas):
+                reads, writes, queries = self.run(options)
+            reads.sort()
+            self.stdout.write(
+                f"{label:<14} {len(reads) / options['seconds']:>7.0f} reads/s  p50 {percentile(reads, 50) * 1000:>6.1f} ms  "
+                f"p99 {percentile(reads, 99) * 1000:>7.1f} ms  {writes / options['seconds']:>6.0f} writes/s  "
+                f"read queries: {', '.join(f'{alias} {count}' for alias, count in sorted(queries.items()))}"
+            )
+
+    def sync_replicas(self):
+        source = settings.DATABASES['default']
+        if 'sqlite' not in source['ENGINE']:
+            raise CommandError("--sync only copies SQLite files; let PostgreSQL replication fill the replicas.")
+        with sqlite3.connect(source['NAME']) as primary:
+            for alias in settings.DATABASE_REPLICAS:
+                replica = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+                primary.backup(replica)
+                replica.close()
+        self.stdout.write(f"Copied the primary into {', '.join(settings.DATABASE_REPLICAS)}")
+
+    def run(self, options):
+        staff, _ = get_user_model().objects.get_or_create(username='bench-staff', defaults={'is_staff': True})
+        members = list(get_user_model().objects.filter(pk__in=seed_users(options['writers'], 'bench-writer')))
+        books = list(Book.objects.order_by('pk')[:options['writers']])
+        Book.objects.filter(pk__in=[book.pk for book in books]).update(number_of_copies_available=10)
+        deadline = time.perf_counter() + options['seconds']
+        reads, writes, queries, lock = [], [0], Counter(), threading.Lock()
+
+        def reader():
+            client = APIClient(SERVER_NAME='localhost')
+            client.force_authenticate(user=staff)
+            samples, used = [], Counter()
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(
+                        lambda execute, *args, alias=alias: used.update([alias]) or execute(*args)
+                    ))
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    client.get('/api/loans/', {'page_size': 50, 'returned': 'true'})
+                    samples.append(time.perf_counter() - started)
+            with lock:
+                reads.extend(samples)
+                queries.update(used)
+            connections.close_all()
+
+        def writer(member, book):
+            done = 0
+            while time.perf_counter() < deadline:
+                try:
+                    services.borrow_book(member, book)
+                    services.return_book(member, book)
+                    done += 2
+                except services.LoanError:
+                    close_old_connections()
+            with lock:
+                writes[0] += done
+            connections.close_all()
+
+        threads = [threading.Thread(target=reader) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=writer, args=pair) for pair in zip(members, books)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return reads, writes[0], queries
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from library.benchmarks import seed_books
+from library.models import Book
+from library.search import get_search_backend
+from library.views import BookViewSet
+
+
+class Command(BaseCommand):
+    help = "Compare the indexed catalog search backend against the icontains SearchFilter path."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=100_000, help="Seed the catalog up to this many books.")
+        parser.add_argument('--repeat', type=int, default=20, help="Timed runs per query and backend.")
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Seeding the catalog up to {options['books']} books...")
+        seed_books(options['books'], options['seed'])
+        factory = APIRequestFactory()
+        view = BookViewSet()
+        queries = ['river', 'silver storm', 'kowalski', 'mem', '97800000123']
+
+        backends = [get_search_backend('icontains'), get_search_backend()]
+        self.stdout.write(f"{'query':<16}" + ''.join(f"{b.name:>22}" for b in backends))
+        for text in queries:
+            request = Request(factory.get('/api/books/', {'search': text}))
+            row = f"{text:<16}"
+            for backend in backends:
+                started = time.perf_counter()
+                for _ in range(options['repeat']):
+                    # Mirror what the paginated endpoint does: count, then one page
+                    results = backend.search(Book.objects.all(), text, view, request)
+                    results.count()
+                    list(results[:options['page_size']])
+                row += f"{(time.perf_counter() - started) / options['repeat'] * 1000:>19.2f} ms"
+            self.stdout.write(row)
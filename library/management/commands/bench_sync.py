@@ -0,0 +1,89 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from library.benchmarks import seed_books
+from library.models import Book
+
+
+class Command(BaseCommand):
+    help = (
+        "Nightly kiosk sync after a day with --churn of the catalog changed: paging through "
+        "/api/books/ vs. a full and a delta download from /api/books/changes/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=20_000)
+        parser.add_argument('--churn', type=float, default=0.01, help="Fraction of books changed during the day.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        seed_books(options['books'], options['seed'])
+        kiosk, _ = get_user_model().objects.get_or_create(username='bench-kiosk')
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(user=kiosk)
+
+        # Yesterday's state, synced
+        Book.objects.update(updated_at=timezone.now() - timedelta(days=1))
+        _, _, _, cursor = self.changes(None)
+
+        changed = self.churn(options)
+        self.stdout.write(f"{Book.objects.count()} books, {changed} changed during the day")
+        for name, (requests, size, elapsed) in (
+            ("full download, /api/books/", self.page_through()),
+            ("full download, /changes/", self.changes(None)[:3]),
+            ("delta sync, /changes/", self.changes(cursor)[:3]),
+        ):
+            self.stdout.write(
+                f"{name:<28}{requests:>6} requests{size / 1024:>10.0f} KiB{elapsed * 1000:>10.0f} ms"
+            )
+
+    def churn(self, options):
+        rng = random.Random(options['seed'])
+        ids = list(Book.objects.filter(loans__isnull=True).values_list('pk', flat=True))
+        picked = rng.sample(ids, max(4, int(len(ids) * options['churn'])))
+        edits, deletes, creates = len(picked) // 5, len(picked) // 20, len(picked) // 20
+        # Most of a day's changes are copy counts moved by borrows and returns
+        counts = picked[edits + deletes:]
+        Book.objects.filter(pk__in=counts).update(
+            number_of_copies_available=F('number_of_copies_available') + 1, updated_at=timezone.now()
+        )
+        for book in Book.objects.filter(pk__in=picked[:edits]):
+            book.title += " (2nd ed.)"
+            book.save()
+        for book in Book.objects.filter(pk__in=picked[edits:edits + deletes]):
+            book.delete()
+        stamp = int(time.time())
+        for n in range(creates):
+            Book.objects.create(title=f"New Arrival {n}", author="Bench", isbn=f"9{stamp % 10**8:08d}{n:04d}")
+        return len(counts) + edits + deletes + creates
+
+    def page_through(self):
+        cache.clear()
+        requests = size = 0
+        started = time.perf_counter()
+        url, params = '/api/books/', {'page_size': 100}
+        while url:
+            response = self.client.get(url, params)
+            requests += 1
+            size += len(response.content)
+            url, params = response.data['next'], None
+        return requests, size, time.perf_counter() - started
+
+    def changes(self, cursor):
+        requests = size = 0
+        started = time.perf_counter()
+        while True:
+            response = self.client.get('/api/books/changes/', {'since': cursor or '', 'limit': 10_000})
+            requests += 1
+            size += len(response.content)
+            cursor = response.data['cursor']
+            if not response.data['has_more']:
+                return requests, size, time.perf_counter() - started, cursor
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from library.services import expire_holds
+
+
+class Command(BaseCommand):
+    help = "Expire holds whose set-aside copy was not borrowed in time and pass the copies on. Run from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Holds expired per transaction.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        expired, shelved = expire_holds(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Expired {expired} holds in {elapsed:.2f} s ({expired / elapsed if elapsed else 0:.0f}/s); "
+            f"{expired - shelved} copies passed to the next hold, {shelved} shelved."
+        ))
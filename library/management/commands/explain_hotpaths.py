@@ -0,0 +1,72 @@
+import re
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from library.models import Book, Hold, Loan
+from library.search import get_search_backend
+from library.views import BookViewSet
+
+# Plan lines that mean a full table scan on SQLite / PostgreSQL. SQLite's
+# "SCAN t USING INDEX" is an ordered index walk and is not matched.
+FULL_SCAN_RE = re.compile(r'(\bSCAN library_\w+\s*$|Seq Scan on library_)', re.MULTILINE)
+# An unordered LIMIT stops reading after one page, so a scan is expected
+EXPECTED_SCANS = {'book-list (page)'}
+
+
+class Command(BaseCommand):
+    help = "Print the query plan of each API hot path on the configured database and flag full scans."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true', help="EXPLAIN ANALYZE (PostgreSQL only).")
+
+    def handle(self, *args, **options):
+        user_id = get_user_model().objects.values_list('pk', flat=True).first() or 1
+        book = Book.objects.first() or Book(pk=1, author='', isbn='', title='')
+        search_request = Request(APIRequestFactory().get('/api/books/', {'search': 'history'}))
+
+        loans = Loan.objects.select_related('user', 'book').order_by('-loan_date', '-id')
+
+        hot_paths = {
+            'book-list (page)': Book.objects.all()[:10],
+            'book-list (cursor)': Book.objects.order_by('title', 'id')[:10],
+            'book-list ?author=': Book.objects.filter(author=book.author)[:10],
+            'book-list ?isbn=': Book.objects.filter(isbn=book.isbn)[:10],
+            'book-list ?search=': get_search_backend().search(
+                Book.objects.all(), 'history', BookViewSet(), search_request
+            )[:10],
+            'book-detail': Book.objects.filter(pk=book.pk),
+            'book-borrow (take copy)': Book.objects.filter(pk=book.pk, number_of_copies_available__gt=0),
+            'book-borrow/return (open loan)': Loan.objects.filter(user_id=user_id, book_id=book.pk, returned=False),
+            'book open loans': Loan.objects.filter(book_id=book.pk, returned=False),
+            'loan-list (member)': loans.filter(user_id=user_id)[:10],
+            'loan-list (staff)': loans[:10],
+            'loan-export ?since=': loans.filter(loan_date__gte=timezone.now() - timedelta(days=30)),
+            'book-return (next hold)': Hold.objects.filter(
+                book_id=book.pk, status=Hold.Status.WAITING
+            ).order_by('created_at', 'id')[:1],
+            'sweep_loans (open loans by id)': Loan.objects.filter(returned=False, pk__gt=0).order_by('pk')[:5000],
+            'expire_holds': Hold.objects.filter(
+                status=Hold.Status.READY, expires_at__lte=timezone.now()
+            ).order_by('expires_at', 'id')[:1000],
+        }
+
+        explain_options = {'analyze': True} if options['analyze'] and connection.vendor == 'postgresql' else {}
+        full_scans = []
+        for name, queryset in hot_paths.items():
+            plan = queryset.explain(**explain_options)
+            self.stdout.write(self.style.MIGRATE_HEADING(f"== {name}"))
+            self.stdout.write(plan)
+            if FULL_SCAN_RE.search(plan) and name not in EXPECTED_SCANS:
+                full_scans.append(name)
+
+        self.stdout.write('')
+        if full_scans:
+            self.stdout.write(self.style.WARNING(f"Full table scans: {', '.join(full_scans)}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Every hot path uses an index."))
@@ -0,0 +1,42 @@
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.importers import FORMATS, ImportReport, guess_format, import_books, iter_rows
+
+
+class Command(BaseCommand):
+    help = "Stream a CSV or NDJSON catalog file into the book table in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or NDJSON file; '-' reads NDJSON from stdin.")
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--upsert', action='store_true', help="Update books whose ISBN already exists.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or guess_format(path)
+        report = ImportReport()
+        started = time.perf_counter()
+
+        try:
+            if path == '-':
+                import_books(iter_rows(sys.stdin, fmt), options['batch_size'], options['upsert'], report)
+            else:
+                with open(path, encoding='utf-8-sig', newline='') as fileobj:
+                    import_books(iter_rows(fileobj, fmt), options['batch_size'], options['upsert'], report)
+        except OSError as exc:
+            raise CommandError(exc)
+
+        for error in report.errors:
+            self.stderr.write(f"row {error['row']}: {json.dumps(error['errors'])}")
+        for warning in report.warnings:
+            self.stderr.write(f"row {warning['row']}: {warning['warning']}")
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{report.rows} rows in {elapsed:.1f}s ({report.rows / max(elapsed, 1e-9):.0f} rows/s): "
+            f"{report.created} created, {report.updated} updated, {report.error_count} failed."
+        ))
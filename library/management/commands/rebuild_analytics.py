@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from library import analytics
+
+
+class Command(BaseCommand):
+    help = "Rebuild the circulation rollup tables from loan history, one chunk of loans per transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=20_000)
+
+    def handle(self, *args, **options):
+        started = last_report = time.perf_counter()
+        total = 0
+        for last_pk, loans in analytics.rebuild(options['chunk_size']):
+            total += loans
+            now = time.perf_counter()
+            if now - last_report >= 1:
+                last_report = now
+                self.stdout.write(f"  {total} loans, {total / (now - started):.0f} loans/s, at id {last_pk}")
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt rollups from {total} loans in {elapsed:.2f} s ({total / elapsed if elapsed else 0:.0f} loans/s)."
+        ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from library.search import FTS_TABLE, PG_INDEX
+
+
+class Command(BaseCommand):
+    help = "Rebuild the catalog full-text search index from the book table."
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+            elif connection.vendor == 'postgresql':
+                cursor.execute(f"REINDEX INDEX {PG_INDEX}")
+            else:
+                self.stdout.write(self.style.WARNING(
+                    f"No search index for the '{connection.vendor}' backend; nothing to do."
+                ))
+                return
+
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
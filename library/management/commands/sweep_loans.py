@@ -0,0 +1,132 @@
+import json
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from library.lifecycle import (
+    archive_borrow_records, archive_returned_loans, close_stale_borrow_records, flag_overdue,
+)
+from library.models import BorrowRecord, Loan
+from library.pagination import refresh_row_estimates
+
+
+class Command(BaseCommand):
+    help = (
+        "Flag overdue loans, close stale legacy borrow records and archive old returned loans "
+        "in primary-key chunks, one short transaction per chunk. Resumable with --checkpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loan-days', type=int, default=settings.LIBRARY_LOAN_PERIOD_DAYS,
+                            help="Days a loan may stay open before it is overdue.")
+        parser.add_argument('--stale-record-days', type=int,
+                            help="Also close BorrowRecord rows open for longer than this many days.")
+        parser.add_argument('--archive-days', type=int,
+                            help="Also move loans and borrow records returned more than this many days ago "
+                                 "into the archive.")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--pause', type=float, default=0.0, help="Seconds to sleep between chunks.")
+        parser.add_argument('--checkpoint', help="JSON file to resume from and record progress in.")
+        parser.add_argument('--dry-run', action='store_true', help="Count what would change without writing.")
+
+    def handle(self, *args, **options):
+        state = self.load_checkpoint(options)
+        cutoff = parse_datetime(state['cutoff'])
+        jobs = [('overdue loans', lambda after: flag_overdue(
+            cutoff, options['chunk_size'], after, options['dry_run'],
+        ))]
+        if state['record_before']:
+            before, today = parse_date(state['record_before']), parse_date(state['today'])
+            jobs.append(('stale borrow records', lambda after: close_stale_borrow_records(
+                before, today, options['chunk_size'], after, options['dry_run'],
+            )))
+        if state.get('archive_before'):
+            archive_before = parse_datetime(state['archive_before'])
+            jobs.append(('archived loans', lambda after: archive_returned_loans(
+                archive_before, options['chunk_size'], after, options['dry_run'],
+            )))
+            jobs.append(('archived borrow records', lambda after: archive_borrow_records(
+                archive_before.date(), options['chunk_size'], after, options['dry_run'],
+            )))
+
+        verb = "would change" if options['dry_run'] else "changed"
+        for name, job in jobs:
+            if name in state['done']:
+                continue
+            after = state['after'] if state['job'] == name else 0
+            if after:
+                self.stdout.write(f"Resuming {name} after id {after}")
+            scanned = changed = 0
+            slowest = 0.0
+            started = last_report = time.perf_counter()
+            chunk_started = started
+            for after, chunk_scanned, chunk_changed in job(after):
+                now = time.perf_counter()
+                slowest = max(slowest, now - chunk_started)
+                scanned += chunk_scanned
+                changed += chunk_changed
+                if not options['dry_run']:
+                    self.save_checkpoint(options, state, job=name, after=after)
+                if now - last_report >= 1:
+                    last_report = now
+                    self.stdout.write(
+                        f"  {name}: {scanned} scanned, {changed} {verb}, "
+                        f"{scanned / (now - started):.0f} rows/s, at id {after}"
+                    )
+                if options['pause']:
+                    time.sleep(options['pause'])
+                chunk_started = time.perf_counter()
+            elapsed = time.perf_counter() - started
+            state['done'].append(name)
+            if not options['dry_run']:
+                self.save_checkpoint(options, state, job=None, after=0)
+            self.stdout.write(self.style.SUCCESS(
+                f"{name}: {scanned} scanned, {changed} {verb} in {elapsed:.2f} s "
+                f"({scanned / elapsed if elapsed else 0:.0f} rows/s, slowest chunk {slowest * 1000:.0f} ms)"
+            ))
+
+        if state.get('archive_before') and not options['dry_run']:
+            # The paginators' row estimates would otherwise still count the moved rows
+            refresh_row_estimates(Loan, BorrowRecord)
+
+        if options['checkpoint'] and not options['dry_run'] and os.path.exists(options['checkpoint']):
+            os.remove(options['checkpoint'])
+
+    def load_checkpoint(self, options):
+        path = options['checkpoint']
+        if path and os.path.exists(path):
+            with open(path) as fileobj:
+                try:
+                    state = json.load(fileobj)
+                except ValueError:
+                    raise CommandError(f"{path} is not a sweep_loans checkpoint; remove it to start over.")
+            # The cutoffs of the interrupted run are kept so both halves agree
+            self.stdout.write(f"Resuming from {path} (cutoff {state['cutoff']})")
+            return state
+
+        now = timezone.now()
+        days, archive_days = options['stale_record_days'], options['archive_days']
+        return {
+            'cutoff': (now - timedelta(days=options['loan_days'])).isoformat(),
+            'record_before': (now - timedelta(days=days)).date().isoformat() if days is not None else None,
+            'archive_before': (now - timedelta(days=archive_days)).isoformat() if archive_days is not None else None,
+            'today': now.date().isoformat(),
+            'job': None,
+            'after': 0,
+            'done': [],
+        }
+
+    def save_checkpoint(self, options, state, job, after):
+        state.update(job=job, after=after)
+        path = options['checkpoint']
+        if not path:
+            return
+        # Write then rename, so an interrupted write never leaves a torn file
+        with open(f'{path}.tmp', 'w') as fileobj:
+            json.dump(state, fileobj)
+        os.replace(f'{path}.tmp', path)
@@ -0,0 +1,241 @@
+"""
+Per-route request instrumentation and a Prometheus text endpoint.
+
+`MetricsMiddleware` times every request and, per DRF route name (for
+example `book-list` or `book-borrow`), records wall time, time spent in
+the database, the number of queries and time spent in serializers. The
+samples go into in-process histograms that `/metrics` renders in the
+Prometheus text format; each gunicorn worker reports its own series.
+
+Route names, timings and cache counters reveal traffic patterns, so
+`/metrics` is not public: it answers scrapers presenting
+LIBRARY_METRICS_TOKEN as a bearer token, clients whose address is in
+LIBRARY_METRICS_ALLOWED_IPS (loopback by default, for a sidecar scraper)
+and signed-in staff; everyone else gets 403.
+
+With LIBRARY_SLOW_REQUEST_MS set, requests slower than that are logged
+to `library.slow_requests` together with the SQL they ran.
+"""
+import contextvars
+import hmac
+import logging
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+from threading import Lock
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+from . import caching
+
+logger = logging.getLogger('library.slow_requests')
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+# Any other verb a client sends is labelled 'other', so the series stay bounded
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+_current = contextvars.ContextVar('library_request_stats', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        # Caller holds the registry lock
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    """Histograms keyed by (metric, route, method)."""
+
+    metrics = {
+        'library_request_duration_seconds': ('Wall time per request.', SECONDS_BUCKETS),
+        'library_request_db_duration_seconds': ('Database time per request.', SECONDS_BUCKETS),
+        'library_request_db_queries': ('SQL queries per request.', QUERY_BUCKETS),
+        'library_request_serialization_duration_seconds': ('Serializer time per request.', SECONDS_BUCKETS),
+    }
+
+    def __init__(self):
+        self._lock = Lock()
+        self._histograms = {}
+
+    def observe(self, route, method, samples):
+        with self._lock:
+            for metric, value in samples.items():
+                key = (metric, route, method)
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram(self.metrics[metric][1])
+                histogram.observe(value)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for metric, (help_text, buckets) in self.metrics.items():
+                lines.append(f'# HELP {metric} {help_text}')
+                lines.append(f'# TYPE {metric} histogram')
+                for (name, route, method), histogram in sorted(self._histograms.items()):
+                    if name != metric:
+                        continue
+                    labels = f'route="{route}",method="{method}"'
+                    cumulative = 0
+                    for bound, count in zip(buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f'{metric}_sum{{{labels}}} {histogram.total}')
+                    lines.append(f'{metric}_count{{{labels}}} {histogram.count}')
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+registry = Registry()
+
+
+class RequestStats:
+    __slots__ = ('db_time', 'queries', 'serialization_time', 'serializer_depth', 'sql')
+
+    def __init__(self, capture_sql):
+        self.db_time = 0.0
+        self.queries = 0
+        self.serialization_time = 0.0
+        self.serializer_depth = 0
+        self.sql = [] if capture_sql else None
+
+
+class SerializationTimer:
+    """
+    Context manager used by serializers; only the outermost serializer
+    on the stack is timed so nested serializers are not counted twice.
+    """
+    __slots__ = ('stats', 'started')
+
+    def __enter__(self):
+        self.stats = _current.get()
+        if self.stats is not None:
+            self.stats.serializer_depth += 1
+            if self.stats.serializer_depth == 1:
+                self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.stats is not None:
+            if self.stats.serializer_depth == 1:
+                self.stats.serialization_time += time.perf_counter() - self.started
+            self.stats.serializer_depth -= 1
+
+
+def _db_wrapper(stats):
+    def wrapper(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            stats.db_time += elapsed
+            stats.queries += 1
+            if stats.sql is not None:
+                stats.sql.append((elapsed, sql))
+    return wrapper
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_ms = settings.LIBRARY_SLOW_REQUEST_MS
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token, started = self.start()
+        try:
+            with self.db_wrappers(stats):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, stats, started)
+        return response
+
+    async def __acall__(self, request):
+        stats, token, started = self.start()
+        try:
+            with self.db_wrappers(stats):
+                response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, stats, started)
+        return response
+
+    def start(self):
+        stats = RequestStats(capture_sql=self.slow_ms is not None)
+        return stats, _current.set(stats), time.perf_counter()
+
+    @staticmethod
+    def db_wrappers(stats):
+        stack = ExitStack()
+        wrapper = _db_wrapper(stats)
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(wrapper))
+        return stack
+
+    def finish(self, request, stats, started):
+        elapsed = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        route = match.url_name if match and match.url_name else 'unmatched'
+        method = request.method if request.method in METHODS else 'other'
+        registry.observe(route, method, {
+            'library_request_duration_seconds': elapsed,
+            'library_request_db_duration_seconds': stats.db_time,
+            'library_request_db_queries': stats.queries,
+            'library_request_serialization_duration_seconds': stats.serialization_time,
+        })
+        if self.slow_ms is not None and elapsed * 1000 >= self.slow_ms:
+            self.log_slow_request(request, route, elapsed, stats)
+
+    def log_slow_request(self, request, route, elapsed, stats):
+        statements = '\n'.join(f'  [{duration * 1000:.1f} ms] {sql}' for duration, sql in stats.sql)
+        logger.warning(
+            "Slow request %s %s (%s): %.1f ms total, %.1f ms in %d queries, %.1f ms serializing\n%s",
+            request.method, request.path, route, elapsed * 1000, stats.db_time * 1000,
+            stats.queries, stats.serialization_time * 1000, statements,
+        )
+
+
+def metrics_allowed(request):
+    token = settings.LIBRARY_METRICS_TOKEN
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    if not settings.LIBRARY_BEHIND_PROXY and request.META.get('REMOTE_ADDR') in settings.LIBRARY_METRICS_ALLOWED_IPS:
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_staff)
+
+
+def metrics_view(request):
+    """Prometheus text exposition of this worker's request histograms."""
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+
+    lines = registry.render()
+    cache_stats = caching.stats.as_dict()
+    lines.append('# HELP library_catalog_cache_total Catalog response cache lookups by outcome.')
+    lines.append('# TYPE library_catalog_cache_total counter')
+    for outcome in ('hits', 'misses', 'not_modified'):
+        lines.append(f'library_catalog_cache_total{{outcome="{outcome}"}} {cache_stats[outcome]}')
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
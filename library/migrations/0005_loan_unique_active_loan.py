@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 19:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0004_borrowrecord'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='loan',
+            constraint=models.UniqueConstraint(condition=models.Q(('returned', False)), fields=('user', 'book'), name='unique_active_loan'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+from django.db import migrations
+
+from library.search import FTS_TABLE, PG_INDEX, pg_search_vector
+
+SQLITE_FORWARD = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        title, author, isbn, content='library_book', content_rowid='id'
+    )
+    """,
+    f"""
+    CREATE TRIGGER library_book_fts_ai AFTER INSERT ON library_book BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, author, isbn)
+        VALUES (new.id, new.title, new.author, new.isbn);
+    END
+    """,
+    f"""
+    CREATE TRIGGER library_book_fts_ad AFTER DELETE ON library_book BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, isbn)
+        VALUES ('delete', old.id, old.title, old.author, old.isbn);
+    END
+    """,
+    f"""
+    CREATE TRIGGER library_book_fts_au AFTER UPDATE OF title, author, isbn ON library_book BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, isbn)
+        VALUES ('delete', old.id, old.title, old.author, old.isbn);
+        INSERT INTO {FTS_TABLE}(rowid, title, author, isbn)
+        VALUES (new.id, new.title, new.author, new.isbn);
+    END
+    """,
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS library_book_fts_ai",
+    "DROP TRIGGER IF EXISTS library_book_fts_ad",
+    "DROP TRIGGER IF EXISTS library_book_fts_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def pg_index():
+    from django.contrib.postgres.indexes import GinIndex
+    return GinIndex(pg_search_vector(), name=PG_INDEX)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for statement in SQLITE_FORWARD:
+            schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        schema_editor.add_index(apps.get_model('library', 'Book'), pg_index())
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for statement in SQLITE_REVERSE:
+            schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        schema_editor.remove_index(apps.get_model('library', 'Book'), pg_index())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0005_loan_unique_active_loan'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 20:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0008_hotpath_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Hold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('waiting', 'Waiting'), ('ready', 'Ready'), ('fulfilled', 'Fulfilled'), ('cancelled', 'Cancelled'), ('expired', 'Expired')], default='waiting', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('ready_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='library.book')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('status', 'waiting')), fields=['book', 'created_at', 'id'], name='hold_queue_idx'), models.Index(condition=models.Q(('status', 'ready')), fields=['expires_at', 'id'], name='hold_expiry_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['waiting', 'ready'])), fields=('user', 'book'), name='unique_active_hold')],
+            },
+        ),
+    ]
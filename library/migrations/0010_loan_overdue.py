@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2026-10-18 20:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0009_hold'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='overdue',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(condition=models.Q(('returned', False)), fields=['id'], name='loan_open_id_idx'),
+        ),
+    ]
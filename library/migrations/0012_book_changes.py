@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-18 20:54
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0011_circulation_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('book_id', models.PositiveIntegerField()),
+                ('isbn', models.CharField(max_length=13)),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['updated_at', 'id'], name='book_updated_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booktombstone',
+            index=models.Index(fields=['deleted_at', 'book_id'], name='tombstone_deleted_idx'),
+        ),
+    ]
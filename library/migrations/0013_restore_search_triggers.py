@@ -0,0 +1,30 @@
+from importlib import import_module
+
+from django.db import migrations
+
+search_index = import_module('library.migrations.0006_book_search_index')
+
+# 0012 added a column to library_book, which SQLite applies by rebuilding
+# the table; the rebuild drops the triggers that keep the FTS index in sync.
+TRIGGERS = ('library_book_fts_ai', 'library_book_fts_ad', 'library_book_fts_au')
+
+
+def restore_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in TRIGGERS:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+    # The trigger statements, then a rebuild for books written without them
+    for statement in search_index.SQLITE_FORWARD[1:]:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0012_book_changes'),
+    ]
+
+    operations = [
+        migrations.RunPython(restore_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('library', '0013_restore_search_triggers'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['published_date'], name='book_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowrecord',
+            index=models.Index(fields=['borrow_date', 'id'], name='borrow_record_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(condition=models.Q(('returned', False)), fields=['loan_date', 'id'], name='loan_open_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['email'], name='user_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['date_of_membership'], name='user_joined_idx'),
+        ),
+    ]
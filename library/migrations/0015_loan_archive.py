@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0014_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedLoan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('loan', 'Loan'), ('borrow_record', 'Borrow Record')], max_length=13)),
+                ('source_id', models.PositiveIntegerField()),
+                ('loan_date', models.DateTimeField()),
+                ('return_date', models.DateTimeField()),
+                ('overdue', models.BooleanField(default=False)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_loans', to='library.book')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_loans', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['loan_date', 'id'], name='archive_date_id_idx'), models.Index(fields=['user', 'loan_date', 'id'], name='archive_user_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('source', 'source_id'), name='unique_archived_source')],
+            },
+        ),
+    ]
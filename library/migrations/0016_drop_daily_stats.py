@@ -0,0 +1,16 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:39
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0015_loan_archive'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='DailyStats',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0016_drop_daily_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivedloan',
+            name='source_id',
+            field=models.PositiveBigIntegerField(),
+        ),
+    ]
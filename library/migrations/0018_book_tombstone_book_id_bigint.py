@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0017_archived_loan_source_id_bigint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='booktombstone',
+            name='book_id',
+            field=models.PositiveBigIntegerField(),
+        ),
+    ]
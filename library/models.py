@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 from django.conf import settings
@@ -9,6 +9,13 @@ class User(AbstractUser):
     date_of_membership = models.DateField(auto_now_add=True)
     active_status = models.BooleanField(default=True)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Admin prefix search and date filter
+            models.Index(fields=['email'], name='user_email_idx'),
+            models.Index(fields=['date_of_membership'], name='user_joined_idx'),
+        ]
+
     def __str__(self):
         return self.username
 
@@ -20,15 +27,55 @@ class Book(models.Model):
     isbn = models.CharField(max_length=13, unique=True)
     published_date = models.DateField(default=timezone.now)
     number_of_copies_available = models.PositiveIntegerField(default=1)
+    # Also set by every queryset .update() of a book (copy counts), which
+    # auto_now does not cover; read by /api/books/changes/
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Backs keyset pagination of the catalog
+            models.Index(fields=['title', 'id'], name='book_title_id_idx'),
+            # ?author= filter
+            models.Index(fields=['author'], name='book_author_idx'),
+            # Delta sync, walked in (updated_at, id) order
+            models.Index(fields=['updated_at', 'id'], name='book_updated_id_idx'),
+            # Admin date filter
+            models.Index(fields=['published_date'], name='book_published_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} by {self.author}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        book = super().from_db(db, field_names, values)
+        # The stored count, so that a save can tell how many copies it adds
+        book._loaded_copies = book.__dict__.get('number_of_copies_available')
+        return book
+
+    def save(self, *args, **kwargs):
+        # post_save hands added copies to waiting holds in the same transaction
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
     @property
     def available(self):
         return self.number_of_copies_available > 0
 
 
+class BookTombstone(models.Model):
+    """Left behind by a deleted book so delta-syncing clients can drop it."""
+    # Wide enough for any Book id (a BigAutoField)
+    book_id = models.PositiveBigIntegerField()
+    isbn = models.CharField(max_length=13)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'book_id'], name='tombstone_deleted_idx'),
+        ]
+
+
 # Loan / Borrow record
 class Loan(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='loans')
@@ -36,15 +83,145 @@ class Loan(models.Model):
     loan_date = models.DateTimeField(auto_now_add=True)
     return_date = models.DateTimeField(null=True, blank=True)
     returned = models.BooleanField(default=False)
+    # Set by `manage.py sweep_loans` once an open loan passes its due period
+    overdue = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # Backs keyset pagination of the loan history
+            models.Index(fields=['loan_date', 'id'], name='loan_date_id_idx'),
+            # A member's own history, newest first
+            models.Index(fields=['user', 'loan_date', 'id'], name='loan_user_date_idx'),
+            # Open loans of a book; the unique_active_loan index below
+            # already covers open loans by user and by (user, book)
+            models.Index(fields=['book'], condition=models.Q(returned=False), name='loan_open_book_idx'),
+            # Open loans in primary key order, walked by sweep_loans
+            models.Index(fields=['id'], condition=models.Q(returned=False), name='loan_open_id_idx'),
+            # The admin's "not returned" filter, newest first
+            models.Index(fields=['loan_date', 'id'], condition=models.Q(returned=False), name='loan_open_date_idx'),
+        ]
+        constraints = [
+            # A user can only hold one open loan per book; enforced by the
+            # database so concurrent borrows cannot slip past the check.
+            models.UniqueConstraint(
+                fields=['user', 'book'],
+                condition=models.Q(returned=False),
+                name='unique_active_loan',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} borrowed {self.book.title}"
 
+
+class ArchivedLoan(models.Model):
+    """
+    Append-only history: returned loans and closed legacy borrow records
+    moved out of the live tables by `manage.py sweep_loans --archive-days`.
+    """
+    class Source(models.TextChoices):
+        LOAN = 'loan'
+        BORROW_RECORD = 'borrow_record'
+
+    source = models.CharField(max_length=13, choices=Source.choices)
+    # Primary key of the row in its live table (a BigAutoField), kept as the public id
+    source_id = models.PositiveBigIntegerField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_loans')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='archived_loans')
+    loan_date = models.DateTimeField()
+    return_date = models.DateTimeField()
+    overdue = models.BooleanField(default=False)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of /api/loans/archived/, all or one member's
+            models.Index(fields=['loan_date', 'id'], name='archive_date_id_idx'),
+            models.Index(fields=['user', 'loan_date', 'id'], name='archive_user_date_idx'),
+        ]
+        constraints = [
+            # A live row is archived at most once
+            models.UniqueConstraint(fields=['source', 'source_id'], name='unique_archived_source'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} borrowed {self.book.title} (archived)"
+
+# Hold / waitlist entry
+class Hold(models.Model):
+    class Status(models.TextChoices):
+        WAITING = 'waiting'
+        READY = 'ready'  # a copy is set aside for the user until expires_at
+        FULFILLED = 'fulfilled'
+        CANCELLED = 'cancelled'
+        EXPIRED = 'expired'
+
+    ACTIVE = (Status.WAITING, Status.READY)
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='holds')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='holds')
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.WAITING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    ready_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The FIFO queue of a book
+            models.Index(fields=['book', 'created_at', 'id'], condition=models.Q(status='waiting'),
+                         name='hold_queue_idx'),
+            # Expired allocations, for the sweep
+            models.Index(fields=['expires_at', 'id'], condition=models.Q(status='ready'), name='hold_expiry_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'book'],
+                condition=models.Q(status__in=['waiting', 'ready']),
+                name='unique_active_hold',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} holds {self.book.title} ({self.status})"
+
+# Circulation rollups, kept current by analytics.record_borrow/record_return
+# and rebuilt from loan history by `manage.py rebuild_analytics`
+class BookDailyStats(models.Model):
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    borrows = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Top books over a date range, answered from the index alone
+            models.Index(fields=['day', 'book', 'borrows', 'returns'], name='book_stats_day_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'day'], name='unique_book_day_stats'),
+        ]
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    borrows = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    last_borrowed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['borrows'], name='user_stats_borrows_idx')]
+
 class BorrowRecord(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
     borrow_date = models.DateField(auto_now_add=True)
     return_date = models.DateField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Admin changelist order and date filter
+            models.Index(fields=['borrow_date', 'id'], name='borrow_record_date_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user} borrowed {self.book}"
\ No newline at end of file
@@ -1,6 +1,213 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connection
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+
+# Tables up to this size are counted exactly; beyond it statistics are used
+ESTIMATE_THRESHOLD = 10_000
+
+
+def table_row_estimate(table):
+    """
+    Row count of `table` from the planner statistics kept by ANALYZE, or
+    None when there are none.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+            row = cursor.fetchone()
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor != 'sqlite':
+            return None
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+        if cursor.fetchone() is None:
+            return None
+        # One row per index, led by the rows it covers; partial indexes cover fewer
+        cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s", [table])
+        counts = [int(stat.split()[0]) for stat, in cursor.fetchall() if stat]
+    return max(counts) if counts else None
+
+
+def refresh_row_estimates(*models):
+    """Re-run ANALYZE after bulk deletes, so estimates do not overstate."""
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    with connection.cursor() as cursor:
+        for model in models:
+            cursor.execute(f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
+
+
+def estimate_count(queryset):
+    """
+    Cheap row count for paginators.
+    Filtered querysets and tables of up to ESTIMATE_THRESHOLD rows are
+    counted exactly; larger tables use ANALYZE statistics (kept current by
+    autovacuum on PostgreSQL, and on SQLite refreshed by `sweep_loans`
+    after archiving). Without statistics the count is exact.
+    """
+    if queryset.query.has_filters():
+        return queryset.count()
+    bounded = queryset.order_by()[:ESTIMATE_THRESHOLD + 1].count()
+    if bounded <= ESTIMATE_THRESHOLD:
+        return bounded
+    estimate = table_row_estimate(queryset.model._meta.db_table)
+    if estimate is None:
+        return queryset.count()
+    return max(estimate, bounded)
+
+
+class EstimatedPage(Page):
+    def __init__(self, object_list, number, paginator, more):
+        super().__init__(object_list, number, paginator)
+        self.more = more
+
+    def has_next(self):
+        return self.more
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Reports an estimated `count`, but never trusts it to find pages: a
+    page is fetched with one extra row, which decides whether there is a
+    next page, and only a page past the last row is out of range.
+    """
+
+    @cached_property
+    def count(self):
+        return estimate_count(self.object_list)
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger("That page number is not an integer")
+        if number < 1:
+            raise EmptyPage("That page number is less than 1")
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage("That page contains no results")
+        return EstimatedPage(rows[:self.per_page], number, self, more=len(rows) > self.per_page)
+
+
+class ChangelistPaginator(Paginator):
+    """
+    For admin changelists: unfiltered tables are estimated, filtered or
+    searched ones counted only up to `count_limit` rows, or one page past
+    `page_number` when that is further, so a broad filter on a large
+    table never runs a full COUNT(*) yet every row stays reachable.
+    `truncated` tells the changelist to show the count as "10,000+".
+    """
+    count_limit = 10_000
+
+    def __init__(self, *args, page_number=1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.page_number = page_number
+        self.truncated = False
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.has_filters():
+            return estimate_count(self.object_list)
+        limit = max(self.count_limit, (self.page_number + 1) * self.per_page)
+        counted = self.object_list.order_by()[:limit + 1].count()
+        self.truncated = counted > limit
+        return min(counted, limit)
+
 
 class CustomPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 100
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # ?count=estimate swaps the exact COUNT(*) for a cheap estimate
+        if request.query_params.get(self.count_query_param) == 'estimate':
+            self.django_paginator_class = EstimatedCountPaginator
+        return super().paginate_queryset(queryset, request, view)
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over a fixed, indexed ordering.
+    The total is left out unless asked for with ?count=exact or ?count=estimate.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    count_query_param = 'count'
+
+    def get_ordering(self, request, queryset, view):
+        # The ordering must match the backing index, so ?ordering= is ignored
+        return self.ordering
+
+    def decode_cursor(self, request):
+        # An empty ?cursor= asks for the first page in keyset mode
+        if not request.query_params.get(self.cursor_query_param):
+            return None
+        return super().decode_cursor(request)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        mode = request.query_params.get(self.count_query_param)
+        if mode == 'exact':
+            self.count = queryset.count()
+        elif mode == 'estimate':
+            self.count = estimate_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        payload = {'next': self.get_next_link(), 'previous': self.get_previous_link(), 'results': data}
+        if self.count is not None:
+            payload = {'count': self.count, **payload}
+        return Response(payload)
+
+
+class BookKeysetPagination(KeysetPagination):
+    ordering = ('title', 'id')
+
+
+class LoanKeysetPagination(KeysetPagination):
+    ordering = ('-loan_date', '-id')
+
+
+class OptInCursorPagination(CustomPagination):
+    """
+    Page numbers by default; a request carrying ?cursor= switches to the
+    keyset paginator in `cursor_class`. Views opt in by subclassing.
+    """
+    cursor_class = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.cursor_class is not None and 'cursor' in request.query_params:
+            self.keyset = self.cursor_class()
+            page = self.keyset.paginate_queryset(queryset, request, view)
+            self.display_page_controls = self.keyset.display_page_controls
+            return page
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.keyset is not None:
+            return self.keyset.to_html()
+        return super().to_html()
+
+
+class BookPagination(OptInCursorPagination):
+    cursor_class = BookKeysetPagination
+
+
+class LoanPagination(OptInCursorPagination):
+    cursor_class = LoanKeysetPagination
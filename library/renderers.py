@@ -0,0 +1,56 @@
+"""
+Opt-in JSON rendering through orjson.
+
+Clients ask for it with `Accept: application/json; engine=orjson` or
+`?format=orjson` and get the same bytes as the stock JSON renderer,
+produced several times faster. Everyone else, including `*/*`, keeps
+DRF's renderer. orjson is in requirements.txt; an install without it
+falls back to the stock encoder for both.
+"""
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.mediatypes import _MediaType, media_type_matches
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    media_type = 'application/json; engine=orjson'
+    format = 'orjson'
+    opt_in = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Indented output is left to the stock renderer
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        # UTC as "Z" and the two line separators escaped, like JSONRenderer
+        content = orjson.dumps(
+            data, default=self.encoder_class().default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS,
+        )
+        return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class OptInContentNegotiation(DefaultContentNegotiation):
+    """
+    Renderers flagged `opt_in` are only chosen when named: by `?format=`
+    or by an Accept entry carrying their media type parameters.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        fmt = format_suffix or request.query_params.get(self.settings.URL_FORMAT_OVERRIDE)
+        for renderer in renderers:
+            if getattr(renderer, 'opt_in', False) and (renderer.format == fmt or self.named(request, renderer)):
+                return renderer, renderer.media_type
+        renderers = [renderer for renderer in renderers if not getattr(renderer, 'opt_in', False)]
+        return super().select_renderer(request, renderers, format_suffix)
+
+    def named(self, request, renderer):
+        return any(
+            _MediaType(accepted).params.keys() - {'q'} and media_type_matches(accepted, renderer.media_type)
+            for accepted in self.get_accept_list(request)
+        )
@@ -0,0 +1,140 @@
+"""
+Catalog search backends for `/api/books/?search=`.
+
+DRF's SearchFilter ORs `icontains` lookups together, which cannot use an
+index. The backends here push the search into an index instead: an FTS5
+table on SQLite and a GIN expression index on PostgreSQL. Both are
+kept in sync by the database itself (see migration 0006), so bulk
+inserts and queryset updates are covered too.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+from .models import Book
+
+FTS_TABLE = 'library_book_fts'
+PG_INDEX = 'library_book_search_idx'
+PG_CONFIG = 'simple'
+SEARCH_FIELDS = ('title', 'author', 'isbn')
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def search_tokens(text):
+    """Split user input into plain word tokens, dropping query syntax."""
+    return TOKEN_RE.findall(text.lower())
+
+
+def pg_search_vector():
+    # Shared by the query and migration 0006 so the planner can match the
+    # WHERE clause against the index expression.
+    from django.contrib.postgres.search import SearchVector
+    return SearchVector(*SEARCH_FIELDS, config=PG_CONFIG)
+
+
+class IcontainsSearchBackend:
+    """The stock DRF behaviour; works everywhere, scans the whole table."""
+    name = 'icontains'
+
+    def search(self, queryset, text, view, request):
+        return SearchFilter().filter_queryset(request, queryset, view)
+
+
+def fts_match(tokens):
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+class SQLiteFTSSearchBackend:
+    """FTS5 match with prefix terms, ranked by bm25."""
+    name = 'sqlite-fts5'
+
+    def search(self, queryset, text, view, request):
+        tokens = search_tokens(text)
+        if not tokens:
+            # Only query syntax (e.g. a lone quote): nothing can match
+            return queryset.none()
+        match = fts_match(tokens)
+        table = queryset.model._meta.db_table
+        # A join rather than a correlated subquery, so FTS5 evaluates the
+        # MATCH once and ranks every hit in the same pass.
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f"{FTS_TABLE}.rowid = {table}.id", f"{FTS_TABLE} MATCH %s"],
+            params=[match],
+            select={'search_rank': f"{FTS_TABLE}.rank"},
+        ).order_by('search_rank', 'pk')
+
+
+class PostgresSearchBackend:
+    """tsvector match against the GIN expression index, ranked by ts_rank."""
+    name = 'postgres-tsvector'
+
+    def search(self, queryset, text, view, request):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        tokens = search_tokens(text)
+        if not tokens:
+            return queryset.none()
+        query = SearchQuery(' & '.join(f'{token}:*' for token in tokens), config=PG_CONFIG, search_type='raw')
+        return (
+            queryset.annotate(search_document=pg_search_vector())
+            .filter(search_document=query)
+            .annotate(search_rank=SearchRank(pg_search_vector(), query))
+            .order_by('-search_rank', 'pk')
+        )
+
+
+BACKENDS = {
+    'icontains': IcontainsSearchBackend,
+    'sqlite': SQLiteFTSSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend(name=None):
+    """
+    Resolve a backend from `LIBRARY_SEARCH_BACKEND`.
+    'auto' picks the indexed backend for the current database vendor.
+    """
+    name = name or getattr(settings, 'LIBRARY_SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        name = connection.vendor if connection.vendor in BACKENDS else 'icontains'
+    return BACKENDS[name]()
+
+
+def matching_book_ids(text):
+    """
+    Primary keys of books matching `text` through the configured backend,
+    as a subquery for `__in` lookups (the admin searches).
+    """
+    backend = get_search_backend()
+    if backend.name == 'icontains':
+        match = Q()
+        for field in SEARCH_FIELDS:
+            match |= Q(**{f'{field}__icontains': text})
+        return Book.objects.filter(match).values('pk')
+    if backend.name == 'sqlite-fts5':
+        # The FTS rowids are the book ids; no need to touch the book table
+        tokens = search_tokens(text)
+        if not tokens:
+            return Book.objects.none().values('pk')
+        return RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [fts_match(tokens)])
+    return backend.search(Book.objects.all(), text, None, None).order_by().values('pk')
+
+
+class CatalogSearchFilter(SearchFilter):
+    """
+    Drop-in replacement for SearchFilter that delegates to the
+    configured catalog search backend.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '')
+        if not text.strip() or not self.get_search_fields(view, request):
+            return queryset
+        return get_search_backend().search(queryset, text, view, request)
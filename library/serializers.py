@@ -1,14 +1,112 @@
-from rest_framework import serializers
-from .models import Book, Loan, User
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import permissions, serializers
+from .metrics import SerializationTimer
+from .models import Book, Hold, Loan, User
 
 
-class UserSerializer(serializers.ModelSerializer):
+class TimedModelSerializer(serializers.ModelSerializer):
+    """Reports time spent building representations to the metrics middleware."""
+
+    def to_representation(self, instance):
+        with SerializationTimer():
+            return super().to_representation(instance)
+
+
+def parse_fields(value):
+    """'id,book.title' -> {'id': None, 'book': {'title': None}}; None means every field."""
+    tree = {}
+    for path in filter(None, (part.strip() for part in value.split(','))):
+        *parents, leaf = path.split('.')
+        node = tree
+        for name in parents:
+            if name in node and node[name] is None:
+                break  # the whole object was already asked for
+            node = node.setdefault(name, {})
+        else:
+            node[leaf] = None
+    return tree
+
+
+class SelectableFieldsMixin:
+    """
+    Sparse representations for read requests. `?fields=id,title` keeps
+    only the listed fields, and `book.title` reaches into an embedded
+    object. `?expand=user,book` picks which relations in `expandable`
+    are embedded (`default_expand` when absent); the rest render as ids.
+    """
+    expandable = {}
+    default_expand = ()
+
+    def __init__(self, *args, selection=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # (fields tree or None, relations to expand); nested serializers
+        # are handed theirs, the top-level one reads the query string
+        self._selection = selection
+
+    @property
+    def selection(self):
+        if self._selection is None:
+            request = self.context.get('request')
+            fields, expand = None, set(self.default_expand)
+            if request is not None and request.method in permissions.SAFE_METHODS:
+                params = request.query_params
+                if params.get('fields'):
+                    fields = parse_fields(params['fields'])
+                if 'expand' in params:
+                    expand = set(filter(None, params['expand'].split(',')))
+                if fields:
+                    expand |= {name for name, subtree in fields.items() if subtree}
+            self._selection = fields, expand
+        return self._selection
+
+    def get_fields(self):
+        fields = super().get_fields()
+        only, expand = self.selection
+        for name, serializer_class in self.expandable.items():
+            if name in expand:
+                fields[name] = serializer_class(read_only=True, selection=((only or {}).get(name), set()))
+        if only is not None:
+            fields = {name: field for name, field in fields.items() if name in only}
+        return fields
+
+
+def narrow_queryset(queryset, serializer, keep=()):
+    """
+    Load only the columns `serializer` renders, plus `keep`, and join the
+    relations it embeds. The queryset is returned unchanged if a field
+    reads anything other than a model field.
+    """
+    columns, related = list(keep), []
+
+    def collect(serializer, model, prefix):
+        for field in serializer.fields.values():
+            try:
+                model_field = model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                return False
+            if isinstance(field, serializers.BaseSerializer):
+                related.append(prefix + field.source)
+                if not collect(field, model_field.related_model, f'{prefix}{field.source}__'):
+                    return False
+            else:
+                columns.append(prefix + field.source)
+        return True
+
+    if not collect(serializer, queryset.model, ''):
+        return queryset
+    queryset = queryset.select_related(None)
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.only(*columns)
+
+
+class UserSerializer(SelectableFieldsMixin, TimedModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'is_staff']
 
 
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(SelectableFieldsMixin, TimedModelSerializer):
     class Meta:
         model = Book
         fields = '__all__'
@@ -26,10 +124,72 @@ class BookSerializer(serializers.ModelSerializer):
         return value
 
 
-class LoanSerializer(serializers.ModelSerializer):
-    user = UserSerializer(read_only=True)
-    book = BookSerializer(read_only=True)
+class LoanSerializer(SelectableFieldsMixin, TimedModelSerializer):
+    expandable = {'user': UserSerializer, 'book': BookSerializer}
+    default_expand = ('user', 'book')
 
     class Meta:
         model = Loan
-        fields = ['id', 'user', 'book', 'loan_date', 'return_date', 'returned']
+        fields = ['id', 'user', 'book', 'loan_date', 'return_date', 'returned', 'overdue']
+
+
+class HoldSerializer(SelectableFieldsMixin, TimedModelSerializer):
+    expandable = {'user': UserSerializer, 'book': BookSerializer}
+
+    class Meta:
+        model = Hold
+        fields = ['id', 'user', 'book', 'status', 'created_at', 'ready_at', 'expires_at']
+        read_only_fields = fields
+
+
+LOAN_USER_FIELDS = ['id', 'username', 'email', 'is_staff']
+LOAN_BOOK_FIELDS = ['id', 'title', 'author', 'isbn', 'published_date', 'number_of_copies_available', 'updated_at']
+
+
+def loan_values(queryset):
+    """
+    Narrow a Loan queryset to the flat columns `flat_loan` needs, fetched
+    in the same single joined query.
+    """
+    return queryset.values(
+        'id', 'loan_date', 'return_date', 'returned', 'overdue',
+        *(f'user__{name}' for name in LOAN_USER_FIELDS),
+        *(f'book__{name}' for name in LOAN_BOOK_FIELDS),
+    )
+
+
+def flat_loan(row):
+    """
+    Build the LoanSerializer representation straight from a `loan_values`
+    row, skipping per-field serializer overhead. Read-only.
+    """
+    return {
+        'id': row['id'],
+        'user': {name: row[f'user__{name}'] for name in LOAN_USER_FIELDS},
+        'book': {name: row[f'book__{name}'] for name in LOAN_BOOK_FIELDS},
+        'loan_date': row['loan_date'],
+        'return_date': row['return_date'],
+        'returned': row['returned'],
+        'overdue': row['overdue'],
+    }
+
+
+def archived_loan_values(queryset):
+    """`loan_values` for an ArchivedLoan queryset; rows go through `flat_archived_loan`."""
+    return queryset.values(
+        'source', 'source_id', 'loan_date', 'return_date', 'overdue',
+        *(f'user__{name}' for name in LOAN_USER_FIELDS),
+        *(f'book__{name}' for name in LOAN_BOOK_FIELDS),
+    )
+
+
+def as_loan_row(row):
+    """Rename an `archived_loan_values` row to the `loan_values` shape, with its source."""
+    row['id'] = row.pop('source_id')
+    row['returned'] = True
+    return row
+
+
+def flat_archived_loan(row):
+    """The `flat_loan` representation of an archived row, plus where it came from."""
+    return {**flat_loan(as_loan_row(row)), 'source': row['source']}
@@ -0,0 +1,319 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import analytics
+from .availability import availability_changed, holds_ready
+from .caching import bump_catalog_version
+from .db_retry import retry_on_lock
+from .models import Book, Hold, Loan
+
+
+class LoanError(Exception):
+    """
+    Raised when a borrow or return cannot be completed.
+    The message is safe to show to the API caller.
+    """
+
+
+@retry_on_lock
+def borrow_book(user, book):
+    """
+    Lend one copy of `book` to `user` in a single transaction.
+
+    A copy set aside by the user's ready hold is used first. Otherwise
+    the copy count is decremented with a conditional UPDATE, so two
+    workers racing for the last copy cannot both succeed, and the
+    `unique_active_loan` constraint rejects a second open loan.
+    """
+    try:
+        with transaction.atomic():
+            claimed = Hold.objects.filter(
+                user=user, book=book, status=Hold.Status.READY, expires_at__gt=timezone.now()
+            ).update(status=Hold.Status.FULFILLED)
+            if not claimed:
+                taken = Book.objects.filter(pk=book.pk, number_of_copies_available__gt=0).update(
+                    number_of_copies_available=F('number_of_copies_available') - 1, updated_at=timezone.now()
+                )
+                if not taken:
+                    raise LoanError("No copies available")
+            loan = Loan.objects.create(user=user, book=book)
+            analytics.record_borrow(user.pk, book.pk, loan.loan_date)
+            if not claimed:
+                # Borrowed off the shelf while queued: leave the queue
+                Hold.objects.filter(user=user, book=book, status=Hold.Status.WAITING).update(
+                    status=Hold.Status.FULFILLED
+                )
+                bump_catalog_version()
+                availability_changed(book.pk, -1)
+    except IntegrityError:
+        # The constraint fired, the decrement above was rolled back with it
+        raise LoanError("You already borrowed this book")
+    return loan
+
+
+@retry_on_lock
+def return_book(user, book):
+    """
+    Close the user's open loan for `book` and pass the copy to the next
+    hold in line, or put it back on the shelf.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        closed = Loan.objects.filter(user=user, book=book, returned=False).update(
+            returned=True, return_date=now
+        )
+        if not closed:
+            raise LoanError("You have not borrowed this book")
+        analytics.record_return(user.pk, book.pk, now)
+        release_copies(book.pk, 1)
+
+
+def lock_books(items):
+    """
+    Resolve `items` (book ids, or ISBN strings) to Book rows, locked in
+    primary key order so that two batches touching the same books always
+    queue up instead of deadlocking. Returns {item: Book}; items that
+    match nothing are left out. Must run inside a transaction.
+    """
+    ids = {item for item in items if isinstance(item, int)}
+    isbns = {item for item in items if isinstance(item, str)}
+    books = Book.objects.select_for_update().filter(Q(pk__in=ids) | Q(isbn__in=isbns)).order_by('pk')
+    found = {}
+    for book in books:
+        found[book.pk] = found[book.isbn] = book
+    return {item: found[item] for item in items if item in found}
+
+
+def _batch(items, found):
+    """Pair each item with its book, or with the reason it is skipped."""
+    seen = set()
+    for item in items:
+        book = found.get(item)
+        if book is None:
+            yield item, None, "Book not found"
+        elif book.pk in seen:
+            yield item, book, "Listed more than once"
+        else:
+            seen.add(book.pk)
+            yield item, book, None
+
+
+@retry_on_lock
+def borrow_books(user, items):
+    """
+    Lend one copy of each book in `items` (ids or ISBNs) to `user` in a
+    single transaction. Books that cannot be lent are reported and
+    skipped, the rest go through. Returns (item, book, error) per item,
+    in order; error is None for a book that was lent.
+    """
+    results = []
+    with transaction.atomic():
+        found = lock_books(items)
+        book_ids = [book.pk for book in found.values()]
+        now = timezone.now()
+        ready = set(Hold.objects.filter(
+            user=user, book_id__in=book_ids, status=Hold.Status.READY, expires_at__gt=now
+        ).values_list('book_id', flat=True))
+        borrowed = set(Loan.objects.filter(
+            user=user, book_id__in=book_ids, returned=False
+        ).values_list('book_id', flat=True))
+
+        claimed, taken = [], []
+        for item, book, error in _batch(items, found):
+            if error is None and book.pk in borrowed:
+                error = "You already borrowed this book"
+            elif error is None and book.pk in ready:
+                claimed.append(book.pk)
+            elif error is None and book.number_of_copies_available > 0:
+                taken.append(book.pk)
+            elif error is None:
+                error = "No copies available"
+            results.append((item, book, error))
+
+        if taken:
+            # Still conditional: where rows are not really locked (SQLite)
+            # a copy count read above may have dropped since
+            if Book.objects.filter(pk__in=taken, number_of_copies_available__gt=0).update(
+                number_of_copies_available=F('number_of_copies_available') - 1, updated_at=now
+            ) != len(taken):
+                raise LoanError("Copy counts changed during the batch, try again")
+        if claimed:
+            Hold.objects.filter(user=user, book_id__in=claimed, status=Hold.Status.READY).update(
+                status=Hold.Status.FULFILLED
+            )
+        lent = claimed + taken
+        try:
+            with transaction.atomic():
+                loans = Loan.objects.bulk_create(Loan(user=user, book_id=book_id) for book_id in lent)
+        except IntegrityError:
+            raise LoanError("A book in the batch was borrowed concurrently, try again")
+        if loans:
+            analytics.record_borrows(user.pk, lent, loans[0].loan_date)
+        if taken:
+            Hold.objects.filter(user=user, book_id__in=taken, status=Hold.Status.WAITING).update(
+                status=Hold.Status.FULFILLED
+            )
+            bump_catalog_version()
+            for book_id in taken:
+                availability_changed(book_id, -1)
+    return results
+
+
+@retry_on_lock
+def return_books(user, items):
+    """
+    Close the user's open loans for each book in `items` (ids or ISBNs)
+    in a single transaction, passing copies to waiting holds as
+    `return_book` does. Returns (item, book, error) per item, in order.
+    """
+    results = []
+    with transaction.atomic():
+        found = lock_books(items)
+        open_loans = set(Loan.objects.filter(
+            user=user, book_id__in=[book.pk for book in found.values()], returned=False
+        ).values_list('book_id', flat=True))
+        returned = []
+        for item, book, error in _batch(items, found):
+            if error is None and book.pk not in open_loans:
+                error = "You have not borrowed this book"
+            elif error is None:
+                returned.append(book.pk)
+            results.append((item, book, error))
+        if not returned:
+            return results
+
+        now = timezone.now()
+        Loan.objects.filter(user=user, book_id__in=returned, returned=False).update(returned=True, return_date=now)
+        analytics.record_returns(user.pk, returned, now)
+        queued = set(Hold.objects.filter(
+            book_id__in=returned, status=Hold.Status.WAITING
+        ).values_list('book_id', flat=True))
+        for book_id in queued:
+            release_copies(book_id, 1)
+        # Nobody waiting: straight back on the shelf, in one statement
+        shelved = [book_id for book_id in returned if book_id not in queued]
+        if shelved:
+            Book.objects.filter(pk__in=shelved).update(
+                number_of_copies_available=F('number_of_copies_available') + 1, updated_at=now
+            )
+            bump_catalog_version()
+            for book_id in shelved:
+                availability_changed(book_id, 1)
+    return results
+
+
+def release_copies(book_id, count):
+    """
+    Allocate `count` freed copies of a book to its oldest waiting holds
+    and shelve whatever is left. Must run inside the transaction that
+    freed the copies. Returns the number of copies shelved.
+    """
+    # Waits for a `place_hold` in progress, so its hold is in the queue
+    Book.objects.select_for_update().filter(pk=book_id).exists()
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=settings.LIBRARY_HOLD_TTL)
+    allocated = 0
+    while allocated < count:
+        queue = list(
+            Hold.objects.filter(book_id=book_id, status=Hold.Status.WAITING)
+            .order_by('created_at', 'id').values_list('pk', flat=True)[:count - allocated]
+        )
+        if not queue:
+            break
+        # Conditional, like the borrow decrement: a hold cancelled or
+        # allocated by a concurrent release is skipped, not taken twice
+        allocated += Hold.objects.filter(pk__in=queue, status=Hold.Status.WAITING).update(
+            status=Hold.Status.READY, ready_at=now, expires_at=expires_at
+        )
+        holds_ready(queue)
+
+    shelved = count - allocated
+    if shelved:
+        Book.objects.filter(pk=book_id).update(
+            number_of_copies_available=F('number_of_copies_available') + shelved, updated_at=now
+        )
+        bump_catalog_version()
+        availability_changed(book_id, shelved)
+    return shelved
+
+
+def copies_added(book, added):
+    """
+    Hand `added` copies, put on the shelf by an edit that sets the count
+    outright (admin, API, import), to the book's waiting holds first, as
+    a return would. Must run inside the transaction of that edit; `book`
+    is left with the count that stays on the shelf.
+    """
+    if added <= 0 or not Hold.objects.filter(book_id=book.pk, status=Hold.Status.WAITING).exists():
+        return
+    Book.objects.filter(pk=book.pk).update(number_of_copies_available=F('number_of_copies_available') - added)
+    shelved = release_copies(book.pk, added)
+    book.number_of_copies_available -= added - shelved
+
+
+@retry_on_lock
+def place_hold(user, book):
+    """
+    Queue `user` for the next free copy of `book`.
+
+    The checks and the insert share one transaction holding the book
+    row lock, as `release_copies` does, so a copy freed meanwhile is
+    either seen here or handed to the new hold, never left on the shelf.
+    """
+    try:
+        with transaction.atomic():
+            copies = Book.objects.select_for_update().values_list('number_of_copies_available', flat=True).get(
+                pk=book.pk
+            )
+            if copies > 0:
+                raise LoanError("Copies are available, borrow the book instead")
+            if Loan.objects.filter(user=user, book=book, returned=False).exists():
+                raise LoanError("You already borrowed this book")
+            return Hold.objects.create(user=user, book=book)
+    except IntegrityError:
+        raise LoanError("You already have a hold on this book")
+
+
+@retry_on_lock
+def cancel_hold(user, book):
+    """Leave the queue for `book`; a copy already set aside is passed on."""
+    with transaction.atomic():
+        hold = Hold.objects.filter(user=user, book=book, status__in=Hold.ACTIVE).first()
+        if hold is None or not Hold.objects.filter(pk=hold.pk, status=hold.status).update(
+            status=Hold.Status.CANCELLED
+        ):
+            raise LoanError("You have no hold on this book")
+        if hold.status == Hold.Status.READY:
+            release_copies(book.pk, 1)
+
+
+def expire_holds(batch_size=1000, now=None):
+    """
+    Expire ready holds whose pickup window has passed and pass each
+    copy on, one transaction per batch. Returns (expired, shelved).
+    """
+    now = now or timezone.now()
+    expired = shelved = 0
+    while True:
+        batch = list(
+            Hold.objects.filter(status=Hold.Status.READY, expires_at__lte=now)
+            .order_by('expires_at', 'id').values_list('pk', 'book_id')[:batch_size]
+        )
+        if not batch:
+            return expired, shelved
+        books = defaultdict(list)
+        for pk, book_id in batch:
+            books[book_id].append(pk)
+        with transaction.atomic():
+            for book_id, pks in books.items():
+                # Conditional again: a hold cancelled meanwhile has
+                # already passed its copy on
+                count = Hold.objects.filter(pk__in=pks, status=Hold.Status.READY).update(status=Hold.Status.EXPIRED)
+                expired += count
+                if count:
+                    shelved += release_copies(book_id, count)
@@ -0,0 +1,42 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import services
+from .authentication import INVALIDATING_FIELDS, invalidate_tokens
+from .availability import availability_changed
+from .caching import bump_catalog_version
+from .models import Book, BookTombstone, User
+
+
+@receiver([post_save, post_delete], sender=Book)
+def book_changed(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, created, **kwargs):
+    loaded = getattr(instance, '_loaded_copies', None)
+    if not created and loaded is not None:
+        services.copies_added(instance, instance.number_of_copies_available - loaded)
+    instance._loaded_copies = instance.number_of_copies_available
+    # Admin and API edits set the count outright, so no delta is pushed
+    availability_changed(instance.pk)
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    BookTombstone.objects.create(book_id=instance.pk, isbn=instance.isbn)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields=None, **kwargs):
+    # Saves that only touch e.g. last_login cannot revoke access
+    if created or (update_fields is not None and not INVALIDATING_FIELDS & set(update_fields)):
+        return
+    invalidate_tokens(Token.objects.filter(user=instance).values_list('key', flat=True), instance.pk)
@@ -1,3 +1,986 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, connections, router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.http import parse_http_date
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import analytics, importers, lifecycle, services
+from .admin import LoanAdmin
+from .authentication import token_cache
+from .benchmarks import WebsocketClient
+from .caching import stats as catalog_cache_stats
+from .checks import check_shared_backends
+from .db_retry import retry_on_lock
+from .db_routers import ReplicaMiddleware
+from .metrics import Histogram, registry
+from .models import ArchivedLoan, Book, BookDailyStats, BorrowRecord, Hold, Loan, User, UserStats
+from .pagination import ChangelistPaginator, estimate_count, refresh_row_estimates
+from .routing import websocket_urlpatterns
+from .search import FTS_TABLE
+
+
+class LoanListQueryCountTests(TestCase):
+    """The loan endpoints must not fire a query per row."""
+
+    def setUp(self):
+        self.staff = User.objects.create(username='staff', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.staff)
+
+    def create_loans(self, count):
+        books = Book.objects.bulk_create(
+            Book(title=f"Book {n}", author="Author", isbn=f"isbn-{n}") for n in range(count)
+        )
+        users = User.objects.bulk_create(User(username=f"member-{n}") for n in range(count))
+        Loan.objects.bulk_create(Loan(user=user, book=book) for user, book in zip(users, books))
+
+    def test_list_query_count_is_constant(self):
+        self.create_loans(100)
+        for page_size in (5, 100):
+            # COUNT(*) for the paginator, then one joined page query
+            with self.assertNumQueries(2):
+                response = self.client.get('/api/loans/', {'page_size': page_size})
+            self.assertEqual(len(response.data['results']), page_size)
+
+    def test_detail_query_count(self):
+        self.create_loans(1)
+        loan = Loan.objects.get()
+        with self.assertNumQueries(1):
+            self.client.get(f'/api/loans/{loan.pk}/')
+
+    def test_flat_path_matches_serializer_output(self):
+        self.create_loans(20)
+        params = {'page_size': 20}
+        regular = self.client.get('/api/loans/', params)
+        with self.assertNumQueries(2):
+            flat = self.client.get('/api/loans/', {**params, 'flat': 'true'})
+        self.assertEqual(json.loads(flat.content), json.loads(regular.content))
+        for params in ({'fields': 'id'}, {'expand': ''}):
+            response = self.client.get('/api/loans/', {**params, 'flat': 'true'})
+            self.assertEqual(response.status_code, 400)
+
+
+class BorrowReturnTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title="Dune", author="F", isbn="isbn-1", number_of_copies_available=1)
+        self.alice = User.objects.create(username='alice')
+        self.bob = User.objects.create(username='bob')
+
+    def copies(self):
+        self.book.refresh_from_db()
+        return self.book.number_of_copies_available
+
+    def test_last_copy_goes_to_one_borrower_only(self):
+        services.borrow_book(self.alice, self.book)
+        with self.assertRaisesMessage(services.LoanError, "No copies available"):
+            services.borrow_book(self.bob, self.book)
+        self.assertEqual(self.copies(), 0)
+        self.assertEqual(Loan.objects.filter(book=self.book).count(), 1)
+
+    def test_borrowing_with_no_copies_is_refused(self):
+        Book.objects.filter(pk=self.book.pk).update(number_of_copies_available=0)
+        client = APIClient()
+        client.force_authenticate(user=self.alice)
+        response = client.post(f'/api/books/{self.book.pk}/borrow/')
+        self.assertEqual((response.status_code, response.data), (400, {"error": "No copies available"}))
+        self.assertEqual(self.copies(), 0)
+        self.assertFalse(Loan.objects.exists())
+
+    def test_second_active_loan_is_rejected_and_rolled_back(self):
+        Book.objects.filter(pk=self.book.pk).update(number_of_copies_available=2)
+        services.borrow_book(self.alice, self.book)
+        with self.assertRaisesMessage(services.LoanError, "You already borrowed this book"):
+            services.borrow_book(self.alice, self.book)
+        self.assertEqual(self.copies(), 1)
+        self.assertEqual(Loan.objects.filter(user=self.alice, returned=False).count(), 1)
+
+    def test_return_puts_the_copy_back(self):
+        services.borrow_book(self.alice, self.book)
+        services.return_book(self.alice, self.book)
+        self.assertEqual(self.copies(), 1)
+        self.assertTrue(Loan.objects.get().returned)
+        with self.assertRaisesMessage(services.LoanError, "You have not borrowed this book"):
+            services.return_book(self.alice, self.book)
+        self.assertEqual(self.copies(), 1)
+        # Returned loans no longer count as active
+        services.borrow_book(self.alice, self.book)
+        self.assertEqual(self.copies(), 0)
+
+
+class CatalogSearchTests(TestCase):
+    def search(self, text):
+        # Bypass the response cache: these tests are about the index
+        cache.clear()
+        response = APIClient().get('/api/books/', {'search': text})
+        self.assertEqual(response.status_code, 200)
+        return [book['title'] for book in response.data['results']]
+
+    def test_matches_are_ranked(self):
+        Book.objects.create(title="Children of Dune, the third novel in the desert planet saga", author="F",
+                            isbn="isbn-1")
+        Book.objects.create(title="Dune", author="Frank Herbert", isbn="isbn-2")
+        Book.objects.create(title="Emma", author="Jane Austen", isbn="isbn-3")
+        self.assertEqual(self.search("dune")[0], "Dune")
+        self.assertEqual(len(self.search("dune")), 2)
+        self.assertEqual(self.search("herb du"), ["Dune"])
+
+    def test_index_follows_saves_updates_and_deletes(self):
+        book = Book.objects.create(title="Dune", author="Frank Herbert", isbn="isbn-1")
+        book.title = "Arrakis"
+        book.save()
+        self.assertEqual((self.search("dune"), self.search("arrakis")), ([], ["Arrakis"]))
+        Book.objects.filter(pk=book.pk).update(author="Brian Herbert")
+        self.assertEqual((self.search("frank"), self.search("brian")), ([], ["Arrakis"]))
+        book.delete()
+        self.assertEqual(self.search("arrakis"), [])
+
+    def test_query_without_words_matches_nothing(self):
+        Book.objects.create(title="Dune", author="Frank Herbert", isbn="isbn-1")
+        self.assertEqual(self.search('"'), [])
+        self.assertEqual(self.search('* -'), [])
+
+    def test_rebuild_restores_a_stale_index(self):
+        Book.objects.create(title="Dune", author="Frank Herbert", isbn="isbn-1")
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')")
+        self.assertEqual(self.search("dune"), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search("dune"), ["Dune"])
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.book = Book.objects.create(title="Dune", author="F", isbn="isbn-1", number_of_copies_available=2)
+        self.client = APIClient()
+        self.detail = f'/api/books/{self.book.pk}/'
+
+    def test_miss_then_hit_with_validators(self):
+        first = self.client.get(self.detail)
+        self.assertEqual((first.status_code, first['X-Cache']), (200, 'MISS'))
+        self.assertTrue(first['ETag'] and first['Last-Modified'])
+        second = self.client.get(self.detail)
+        self.assertEqual((second['X-Cache'], second['ETag'], second.data), ('HIT', first['ETag'], first.data))
+        # Other query strings are cached separately
+        self.assertEqual(self.client.get('/api/books/')['X-Cache'], 'MISS')
+
+    def test_conditional_requests_get_304(self):
+        first = self.client.get(self.detail)
+        with self.assertNumQueries(0):
+            revalidated = self.client.get(self.detail, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(self.client.get(self.detail, HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 304)
+        self.assertEqual(self.client.get(self.detail, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_writes_invalidate(self):
+        member = User.objects.create(username='reader')
+        self.client.force_authenticate(user=member)
+        writes = [
+            ('save', lambda: Book.objects.filter(pk=self.book.pk).first().save()),
+            ('borrow', lambda: self.client.post(f'{self.detail}borrow/')),
+            ('return', lambda: self.client.post(f'{self.detail}return_book/')),
+        ]
+        previous = self.client.get(self.detail)
+        for name, write in writes:
+            with self.subTest(name), self.captureOnCommitCallbacks(execute=True):
+                write()
+            current = self.client.get(self.detail, HTTP_IF_NONE_MATCH=previous['ETag'])
+            self.assertEqual((current.status_code, current['X-Cache']), (200, 'MISS'), name)
+            self.assertNotEqual(current['ETag'], previous['ETag'])
+            self.assertGreater(parse_http_date(current['Last-Modified']), parse_http_date(previous['Last-Modified']))
+            previous = current
+        self.assertEqual(previous.data['number_of_copies_available'], 2)
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        Book.objects.bulk_create(Book(title=f"Book {n:03d}", author="A", isbn=f"isbn-{n}") for n in range(120))
+        self.client = APIClient()
+
+    def test_page_size_is_capped(self):
+        self.assertEqual(len(self.client.get('/api/books/', {'page_size': 3}).data['results']), 3)
+        self.assertEqual(len(self.client.get('/api/books/', {'page_size': 1000}).data['results']), 100)
+
+    def test_cursor_pages_walk_the_catalog_in_order(self):
+        titles, params = [], {'cursor': '', 'page_size': 50}
+        response = self.client.get('/api/books/', params)
+        self.assertNotIn('count', response.data)
+        while True:
+            titles += [book['title'] for book in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(titles, [f"Book {n:03d}" for n in range(120)])
+        counted = self.client.get('/api/books/', {**params, 'count': 'exact'})
+        self.assertEqual(counted.data['count'], 120)
+
+    def test_estimates_do_not_count_deleted_rows(self):
+        Book.objects.filter(title__gte="Book 060").delete()
+        with mock.patch('library.pagination.ESTIMATE_THRESHOLD', 10):
+            # No statistics yet: counted exactly
+            self.assertEqual(estimate_count(Book.objects.all()), 60)
+            self.assertEqual(self.client.get('/api/books/', {'count': 'estimate'}).data['count'], 60)
+            refresh_row_estimates(Book)
+            Book.objects.filter(title__gte="Book 030").delete()
+            self.assertEqual(estimate_count(Book.objects.all()), 60)
+            refresh_row_estimates(Book)
+            self.assertEqual(estimate_count(Book.objects.all()), 30)
+            Book.objects.filter(title__gte="Book 005").delete()
+            self.assertEqual(estimate_count(Book.objects.all()), 5)
+        self.assertEqual(estimate_count(Book.objects.filter(title="Book 001")), 1)
+
+    def test_pages_do_not_depend_on_a_wrong_estimate(self):
+        params = {'count': 'estimate', 'page_size': 10}
+        with mock.patch('library.pagination.estimate_count', return_value=5):
+            response = self.client.get('/api/books/', {**params, 'page': 5})
+            self.assertEqual((response.status_code, response.data['count']), (200, 5))
+            self.assertEqual(response.data['results'][0]['title'], "Book 040")
+            self.assertIsNotNone(response.data['next'])
+        with mock.patch('library.pagination.estimate_count', return_value=1000):
+            last = self.client.get('/api/books/', {**params, 'page': 12})
+            self.assertEqual((len(last.data['results']), last.data['next']), (10, None))
+            self.assertEqual(self.client.get('/api/books/', {**params, 'page': 13}).status_code, 404)
+
+
+class BookImportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=User.objects.create(username='staff', is_staff=True))
+        self.dune = Book.objects.create(title="Dune", author="F", isbn="isbn-1", published_date='1965-08-01',
+                                        number_of_copies_available=7)
+
+    def upload(self, name, content, **data):
+        upload = SimpleUploadedFile(name, content.encode())
+        response = self.client.post('/api/books/import/', {'file': upload, **data}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_csv_import_creates_and_reports_bad_rows(self):
+        report = self.upload('books.csv', "isbn,title,author,number_of_copies_available\n"
+                                          "isbn-2,Emma,Jane Austen,3\n"
+                                          "isbn-3,,Nobody,1\n"
+                                          "isbn-1,Dune,F,1\n")
+        self.assertEqual((report['rows'], report['created'], report['updated'], report['failed']), (3, 1, 0, 2))
+        self.assertEqual([error['row'] for error in report['errors']], [2, 3])
+        self.assertEqual(Book.objects.get(isbn="isbn-2").number_of_copies_available, 3)
+        self.assertEqual(Book.objects.get(isbn="isbn-1").number_of_copies_available, 7)
+
+    def test_upsert_changes_only_the_columns_given(self):
+        report = self.upload('books.ndjson', '{"isbn": "isbn-1", "title": "Dune (1st ed.)", "author": "F"}\n',
+                             upsert='true')
+        self.assertEqual((report['created'], report['updated']), (0, 1))
+        self.dune.refresh_from_db()
+        self.assertEqual(self.dune.title, "Dune (1st ed.)")
+        self.assertEqual((str(self.dune.published_date), self.dune.number_of_copies_available), ('1965-08-01', 7))
+
+    def test_upsert_keeps_the_copy_count_of_books_on_loan(self):
+        Loan.objects.create(user=User.objects.create(username='reader'), book=self.dune)
+        report = self.upload('books.ndjson', '{"isbn": "isbn-1", "title": "Dune", "author": "F", '
+                                             '"number_of_copies_available": 1}\n', upsert='true')
+        self.assertEqual(report['warnings'], [{'row': 1, 'warning': "Copy count not changed: the book has open loans."}])
+        self.dune.refresh_from_db()
+        self.assertEqual(self.dune.number_of_copies_available, 7)
+
+    def test_rejected_chunk_is_reported_and_later_chunks_still_load(self):
+        bulk_create = Book.objects.bulk_create
+
+        def fail_on_isbn_2(books, *args, **kwargs):
+            if any(book.isbn == "isbn-2" for book in books):
+                raise IntegrityError("UNIQUE constraint failed: library_book.isbn")
+            return bulk_create(books, *args, **kwargs)
+
+        rows = ''.join(f'{{"isbn": "isbn-{n}", "title": "T{n}", "author": "A"}}\n' for n in (2, 3))
+        with mock.patch.object(Book.objects, 'bulk_create', side_effect=fail_on_isbn_2):
+            report = self.upload('books.ndjson', rows, batch_size='1')
+        self.assertEqual((report['created'], report['failed']), (1, 1))
+        self.assertEqual(report['errors'][0]['row'], 1)
+        self.assertEqual(set(Book.objects.values_list('isbn', flat=True)), {"isbn-1", "isbn-3"})
+
+    def test_management_command_upserts_a_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as fileobj:
+            fileobj.write("isbn,title,author\nisbn-1,Dune Messiah,F\nisbn-4,Beloved,Toni Morrison\n")
+        self.addCleanup(os.remove, fileobj.name)
+        out = StringIO()
+        call_command('import_books', fileobj.name, '--upsert', stdout=out, stderr=StringIO())
+        self.assertIn("1 created, 1 updated, 0 failed", out.getvalue())
+        self.assertEqual(Book.objects.get(isbn="isbn-1").title, "Dune Messiah")
+        self.assertEqual(Book.objects.get(isbn="isbn-1").number_of_copies_available, 7)
+        self.assertTrue(Book.objects.filter(isbn="isbn-4").exists())
+
+
+class SparseFieldsTests(TestCase):
+    def test_fields_and_expand_narrow_payload_and_query(self):
+        staff = User.objects.create(username='staff', is_staff=True)
+        book = Book.objects.create(title="Dune", author="Herbert", isbn="isbn-1")
+        services.borrow_book(staff, book)
+        client = APIClient()
+        client.force_authenticate(user=staff)
+
+        with self.assertNumQueries(2) as queries:
+            response = client.get('/api/loans/', {'fields': 'id,book.title'})
+        self.assertEqual(response.data['results'][0]['book'], {'title': "Dune"})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'book'})
+        self.assertNotIn('library_user', queries.captured_queries[-1]['sql'])
+
+        response = client.get('/api/loans/', {'expand': ''})
+        self.assertEqual(response.data['results'][0]['user'], staff.pk)
+        self.assertEqual(client.get('/api/books/', {'fields': 'id,title'}).data['results'], [
+            {'id': book.pk, 'title': "Dune"},
+        ])
+
+        # The orjson renderer is opt-in and byte-for-byte the same
+        plain = client.get('/api/loans/')
+        fast = client.get('/api/loans/', HTTP_ACCEPT='application/json; engine=orjson')
+        self.assertEqual(plain['Content-Type'], 'application/json')
+        self.assertEqual(fast['Content-Type'], 'application/json; engine=orjson')
+        self.assertEqual(fast.content, plain.content)
+
+
+class TokenCacheRevocationTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create(username='staff', is_staff=True)
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def assertCachedThenBlocked(self, revoke, path='/api/loans/', blocked=401):
+        self.assertEqual(self.client.get(path).status_code, 200)
+        self.assertIsNotNone(token_cache.get(self.token.key))
+        revoke()
+        self.assertEqual(self.client.get(path).status_code, blocked)
+
+    def test_deleting_the_token(self):
+        self.assertCachedThenBlocked(self.token.delete)
+
+    def test_deactivating_the_user(self):
+        def deactivate():
+            self.user.is_active = False
+            self.user.save()
+        self.assertCachedThenBlocked(deactivate)
+
+    def test_removing_staff_rights(self):
+        def demote():
+            self.user.is_staff = False
+            self.user.save(update_fields=['is_staff'])
+        self.assertCachedThenBlocked(demote, '/api/users/', blocked=403)
+
+    def test_active_status_drops_the_entry(self):
+        self.client.get('/api/loans/')
+        self.user.active_status = False
+        self.user.save(update_fields=['active_status'])
+        self.assertIsNone(token_cache.get(self.token.key))
+
+    def test_unrelated_saves_keep_the_entry(self):
+        self.client.get('/api/loans/')
+        self.user.save(update_fields=['last_login'])
+        self.assertIsNotNone(token_cache.get(self.token.key))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        cache.clear()
+
+    def test_histograms_count_requests_per_route(self):
+        Book.objects.create(title="Dune", author="F", isbn="isbn-1")
+        hits = catalog_cache_stats.hits
+        for _ in range(3):
+            self.client.get('/api/books/')
+        lines = self.client.get('/metrics').content.decode().splitlines()
+        self.assertIn('# TYPE library_request_duration_seconds histogram', lines)
+        labels = 'route="book-list",method="GET"'
+        self.assertIn(f'library_request_duration_seconds_count{{{labels}}} 3', lines)
+        self.assertIn(f'library_request_db_queries_bucket{{{labels},le="+Inf"}} 3', lines)
+        buckets = [int(line.rsplit(' ', 1)[1]) for line in lines
+                   if line.startswith(f'library_request_db_queries_bucket{{{labels},')]
+        self.assertEqual(buckets, sorted(buckets))
+        # The first request missed the catalog cache and queried; the others were hits
+        self.assertEqual(buckets[0], 2)
+        self.assertIn(f'library_catalog_cache_total{{outcome="hits"}} {hits + 2}', lines)
+
+    def test_unknown_methods_share_one_series(self):
+        for method in ('BREW', 'PROPFIND'):
+            self.client.generic(method, '/api/books/')
+        lines = self.client.get('/metrics').content.decode().splitlines()
+        self.assertIn('library_request_duration_seconds_count{route="book-list",method="other"} 2', lines)
+        self.assertFalse(any('BREW' in line or 'PROPFIND' in line for line in lines))
+
+    def test_histogram_buckets(self):
+        histogram = Histogram((1, 5))
+        for value in (0, 1, 3, 9):
+            histogram.observe(value)
+        self.assertEqual((histogram.counts, histogram.count, histogram.total), ([2, 1, 1], 4, 13))
+
+    @override_settings(LIBRARY_METRICS_ALLOWED_IPS=[], LIBRARY_METRICS_TOKEN='s3cret')
+    def test_only_staff_tokens_and_allowed_addresses(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+        with override_settings(LIBRARY_METRICS_ALLOWED_IPS=['10.0.0.5']):
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 200)
+            # Behind a proxy the address may come from a spoofed X-Forwarded-For
+            with override_settings(LIBRARY_BEHIND_PROXY=True):
+                self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 403)
+        self.client.force_login(User.objects.create(username='member'))
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+class SharedBackendCheckTests(SimpleTestCase):
+    def test_several_workers_need_shared_backends(self):
+        self.assertEqual(check_shared_backends(), [])
+        with override_settings(WEB_CONCURRENCY=4):
+            self.assertEqual([error.id for error in check_shared_backends()], ['library.E001', 'library.E001'])
+            with override_settings(
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                    'LOCATION': tempfile.gettempdir()}},
+                CHANNEL_LAYERS={'default': {'BACKEND': 'channels_redis.core.RedisChannelLayer'}},
+            ):
+                self.assertEqual(check_shared_backends(), [])
+
+
+class AsyncEndpointTests(TestCase):
+    """The async read endpoints return the same payloads as the viewsets."""
+
+    def setUp(self):
+        self.member = User.objects.create(username='member')
+        self.token = Token.objects.create(user=self.member)
+        books = Book.objects.bulk_create(
+            Book(title=f"Book {n}", author="Author", isbn=f"isbn-{n}") for n in range(15)
+        )
+        Loan.objects.bulk_create(Loan(user=self.member, book=book) for book in books[:12])
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    async def assertSamePayload(self, sync_path, async_path, params=None):
+        headers = {'Authorization': f'Token {self.token.key}'}
+        expected = await sync_to_async(self.client.get)(sync_path, params)
+        response = await self.async_client.get(async_path, params, headers=headers)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(
+            json.loads(response.content.replace(b'/api/async/', b'/api/')),
+            json.loads(expected.content),
+        )
+
+    async def test_payloads_match(self):
+        book = await Book.objects.afirst()
+        await self.assertSamePayload('/api/books/', '/api/async/books/', {'page': 2})
+        await self.assertSamePayload('/api/books/', '/api/async/books/', {'search': 'book', 'page_size': 5})
+        await self.assertSamePayload(f'/api/books/{book.pk}/', f'/api/async/books/{book.pk}/')
+        await self.assertSamePayload('/api/loans/', '/api/async/loans/', {'page_size': 5, 'page': 2})
+
+    async def test_loans_require_a_valid_token(self):
+        response = await self.async_client.get('/api/async/loans/')
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get('/api/async/loans/', headers={'Authorization': 'Token nope'})
+        self.assertEqual(response.status_code, 401)
+
+
+class AvailabilityPushTests(TestCase):
+    """Borrows are pushed to WebSocket subscribers, coalesced per tick."""
+
+    async def subscribe(self, message):
+        communicator = WebsocketClient(URLRouter(websocket_urlpatterns), '/ws/availability/')
+        self.assertTrue(await communicator.connect())
+        await communicator.send_json_to({'action': 'subscribe', **message})
+        return communicator
+
+    async def test_burst_of_borrows_is_one_update(self):
+        book = await Book.objects.acreate(title="Earthsea", author="Le Guin", isbn="isbn-1", number_of_copies_available=5)
+        readers = [await User.objects.acreate(username=f"reader-{n}") for n in range(3)]
+        by_book = await self.subscribe({'books': [book.pk]})
+        snapshot = await by_book.receive_json_from()
+        self.assertEqual(snapshot['books'], [{'id': book.pk, 'available': 5, 'delta': None}])
+        by_author = await self.subscribe({'author': 'le guin'})
+
+        def borrow_all():
+            with self.captureOnCommitCallbacks(execute=True):
+                for reader in readers:
+                    services.borrow_book(reader, book)
+        await sync_to_async(borrow_all)()
+
+        expected = {'type': 'availability', 'books': [{'id': book.pk, 'available': 2, 'delta': -3}]}
+        for communicator in (by_book, by_author):
+            self.assertEqual(await communicator.receive_json_from(timeout=2), expected)
+            self.assertTrue(await communicator.receive_nothing(timeout=0.3))
+            await communicator.disconnect()
+
+
+class HoldTests(TestCase):
+    """Returned copies go to the oldest hold; unclaimed ones move on."""
+
+    def setUp(self):
+        self.book = Book.objects.create(title="Dune", author="Herbert", isbn="isbn-1", number_of_copies_available=1)
+        self.borrower, self.first, self.second = (User.objects.create(username=name) for name in ('b', 'h1', 'h2'))
+        services.borrow_book(self.borrower, self.book)
+
+    def test_return_allocates_fifo_and_expiry_passes_it_on(self):
+        client = APIClient()
+        client.force_authenticate(user=self.first)
+        self.assertEqual(client.post(f'/api/books/{self.book.pk}/hold/').status_code, 201)
+        services.place_hold(self.second, self.book)
+
+        services.return_book(self.borrower, self.book)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.number_of_copies_available, 0)
+        first_hold = Hold.objects.get(user=self.first)
+        self.assertEqual(first_hold.status, Hold.Status.READY)
+        with self.assertRaisesMessage(services.LoanError, "No copies available"):
+            services.borrow_book(self.second, self.book)
+
+        self.assertEqual(services.expire_holds(now=first_hold.expires_at), (1, 0))
+        self.assertEqual(Hold.objects.get(user=self.second).status, Hold.Status.READY)
+        services.borrow_book(self.second, self.book)
+        self.assertEqual(Hold.objects.get(user=self.second).status, Hold.Status.FULFILLED)
+
+    def test_added_copies_go_to_the_queue_first(self):
+        services.place_hold(self.first, self.book)
+        staff = APIClient()
+        staff.force_authenticate(user=User.objects.create(username='staff', is_staff=True))
+        response = staff.patch(f'/api/books/{self.book.pk}/', {'number_of_copies_available': 1})
+        self.assertEqual(response.data['number_of_copies_available'], 0)
+        self.assertEqual(Hold.objects.get(user=self.first).status, Hold.Status.READY)
+        with self.assertRaisesMessage(services.LoanError, "No copies available"):
+            services.borrow_book(self.second, self.book)
+
+        # An upsert import too; this book has no open loans, so its count is imported
+        emma = Book.objects.create(title="Emma", author="Austen", isbn="isbn-2", number_of_copies_available=0)
+        services.place_hold(self.second, emma)
+        importers.import_books([{'isbn': 'isbn-2', 'title': 'Emma', 'author': 'Austen',
+                                 'number_of_copies_available': '2'}], upsert=True)
+        emma.refresh_from_db()
+        self.assertEqual(emma.number_of_copies_available, 1)
+        self.assertEqual(Hold.objects.get(user=self.second, book=emma).status, Hold.Status.READY)
+
+    async def test_holder_is_told_when_a_copy_is_set_aside(self):
+        token = await Token.objects.acreate(user=self.first)
+        socket = WebsocketClient(URLRouter(websocket_urlpatterns), '/ws/availability/', f'token={token.key}')
+        self.assertTrue(await socket.connect())
+
+        def queue_and_return():
+            with self.captureOnCommitCallbacks(execute=True):
+                services.place_hold(self.first, self.book)
+                services.return_book(self.borrower, self.book)
+        await sync_to_async(queue_and_return)()
+
+        message = await socket.receive_json_from(timeout=2)
+        self.assertEqual((message['type'], message['book']), ('hold_ready', self.book.pk))
+        await socket.disconnect()
+
+    def test_cancelling_a_ready_hold_shelves_the_copy(self):
+        services.place_hold(self.first, self.book)
+        services.return_book(self.borrower, self.book)
+        services.cancel_hold(self.first, self.book)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.number_of_copies_available, 1)
+
+
+class SweepTests(TestCase):
+    def test_flags_only_old_open_loans_and_resumes_by_pk(self):
+        member = User.objects.create(username='member')
+        books = Book.objects.bulk_create(Book(title=f"Book {n}", author="A", isbn=f"isbn-{n}") for n in range(4))
+        loans = [Loan.objects.create(user=member, book=book) for book in books]
+        Loan.objects.filter(pk__in=[loans[0].pk, loans[1].pk, loans[3].pk]).update(
+            loan_date=timezone.now() - timedelta(days=30)
+        )
+        Loan.objects.filter(pk=loans[1].pk).update(returned=True)
+        cutoff = timezone.now() - timedelta(days=14)
+
+        self.assertEqual(list(lifecycle.flag_overdue(cutoff, chunk_size=1, dry_run=True))[0], (loans[0].pk, 1, 1))
+        self.assertFalse(Loan.objects.filter(overdue=True).exists())
+        # Resume after the first loan, as from a checkpoint
+        self.assertEqual(sum(changed for *_, changed in lifecycle.flag_overdue(cutoff, 2, after=loans[0].pk)), 1)
+        self.assertEqual(list(Loan.objects.filter(overdue=True).values_list('pk', flat=True)), [loans[3].pk])
+
+
+class LoanExportTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create(username='alice')
+        self.bob = User.objects.create(username='bob')
+        self.staff = User.objects.create(username='staff', is_staff=True)
+        books = Book.objects.bulk_create(Book(title=f"Book {n}", author="A", isbn=f"isbn-{n}") for n in range(3))
+        now = timezone.now()
+        self.loans = {}
+        for name, user, book, days in (('a_old', self.alice, books[0], 30), ('a_new', self.alice, books[1], 1),
+                                       ('b_new', self.bob, books[2], 2)):
+            loan = Loan.objects.create(user=user, book=book)
+            Loan.objects.filter(pk=loan.pk).update(loan_date=now - timedelta(days=days))
+            self.loans[name] = loan.pk
+        self.client = APIClient()
+
+    def export(self, caller, **params):
+        self.client.force_authenticate(user=caller)
+        response = self.client.get('/api/loans/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.getvalue().decode()
+
+    def ndjson_ids(self, caller, **params):
+        return [json.loads(line)['id'] for line in self.export(caller, **params).splitlines()]
+
+    def test_members_export_only_their_own_loans(self):
+        self.assertEqual(self.ndjson_ids(self.alice), [self.loans['a_new'], self.loans['a_old']])
+        # A member cannot widen the scope with ?user=
+        self.assertEqual(self.ndjson_ids(self.bob, user=str(self.alice.pk)), [])
+        rows = list(csv.DictReader(StringIO(self.export(self.bob, file_format='csv'))))
+        self.assertEqual([(row['id'], row['user__username']) for row in rows], [(str(self.loans['b_new']), 'bob')])
+
+    def test_since_until_and_user_filters(self):
+        since = (timezone.now() - timedelta(days=7)).date().isoformat()
+        until = (timezone.now() - timedelta(days=1, hours=12)).isoformat()
+        self.assertEqual(self.ndjson_ids(self.staff, since=since), [self.loans['a_new'], self.loans['b_new']])
+        self.assertEqual(self.ndjson_ids(self.staff, since=since, until=until), [self.loans['b_new']])
+        self.assertEqual(self.ndjson_ids(self.staff, user=str(self.alice.pk)), [self.loans['a_new'], self.loans['a_old']])
+        rows = list(csv.DictReader(StringIO(self.export(self.staff, file_format='csv', until=until))))
+        self.assertEqual([int(row['id']) for row in rows], [self.loans['b_new'], self.loans['a_old']])
+        self.assertEqual(list(rows[0]), ['id', 'loan_date', 'return_date', 'returned', 'overdue', 'user__id',
+                                         'user__username', 'book__id', 'book__title', 'book__isbn'])
+
+        self.client.force_authenticate(user=self.staff)
+        for params in ({'since': 'yesterday'}, {'user': 'alice'}, {'file_format': 'xml'}):
+            self.assertEqual(self.client.get('/api/loans/export/', params).status_code, 400)
+
+    @override_settings(SERVE_ASGI=True)
+    async def test_asgi_streams_an_async_iterator(self):
+        token = await Token.objects.acreate(user=self.staff)
+        response = await self.async_client.get('/api/loans/export/', headers={'Authorization': f'Token {token.key}'})
+        # An async iterator is sent as it is read instead of being buffered first
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual([json.loads(line)['id'] for line in body.splitlines()],
+                         [self.loans['a_new'], self.loans['b_new'], self.loans['a_old']])
+
+
+class ArchiveTests(TestCase):
+    def test_old_history_moves_to_the_archive_and_stays_visible(self):
+        member = User.objects.create(username='member')
+        books = Book.objects.bulk_create(Book(title=f"Book {n}", author="A", isbn=f"isbn-{n}") for n in range(3))
+        now = timezone.now()
+        old, recent, still_open = [Loan.objects.create(user=member, book=book) for book in books]
+        Loan.objects.filter(pk=old.pk).update(
+            loan_date=now - timedelta(days=400), returned=True, return_date=now - timedelta(days=390),
+        )
+        Loan.objects.filter(pk=recent.pk).update(returned=True, return_date=now)
+        Loan.objects.filter(pk=still_open.pk).update(loan_date=now - timedelta(days=500))
+        record = BorrowRecord.objects.create(user=member, book=books[0])
+        BorrowRecord.objects.filter(pk=record.pk).update(
+            borrow_date=(now - timedelta(days=700)).date(), return_date=(now - timedelta(days=690)).date(),
+        )
+
+        cutoff = now - timedelta(days=365)
+        self.assertEqual(sum(moved for *_, moved in lifecycle.archive_returned_loans(cutoff, chunk_size=1)), 1)
+        self.assertEqual(sum(moved for *_, moved in lifecycle.archive_borrow_records(cutoff.date())), 1)
+        self.assertEqual(set(Loan.objects.values_list('pk', flat=True)), {recent.pk, still_open.pk})
+        self.assertFalse(BorrowRecord.objects.exists())
+        self.assertEqual(set(ArchivedLoan.objects.values_list('source', 'source_id')),
+                         {(ArchivedLoan.Source.LOAN, old.pk), (ArchivedLoan.Source.BORROW_RECORD, record.pk)})
+
+        client = APIClient()
+        client.force_authenticate(user=member)
+        archived = client.get('/api/loans/archived/').data['results']
+        self.assertEqual([(row['source'], row['id']) for row in archived],
+                         [('loan', old.pk), ('borrow_record', record.pk)])
+        lines = client.get('/api/loans/export/', {'archived': 'true'}).getvalue().decode().splitlines()
+        self.assertEqual([(row['source'], row['id']) for row in map(json.loads, lines)], [
+            ('loan', recent.pk), ('loan', old.pk), ('loan', still_open.pk), ('borrow_record', record.pk),
+        ])
+
+        list(analytics.rebuild())
+        self.assertEqual(UserStats.objects.get(user=member).borrows, 3)
+
+
+class BatchCheckoutTests(TestCase):
+    def test_batch_borrow_and_return_report_each_item(self):
+        staff, member = User.objects.create(username='desk', is_staff=True), User.objects.create(username='m')
+        books = Book.objects.bulk_create(
+            Book(title=f"Book {n}", author="A", isbn=f"isbn-{n}", number_of_copies_available=1) for n in range(3)
+        )
+        Book.objects.filter(pk=books[2].pk).update(number_of_copies_available=0)
+        client = APIClient()
+        client.force_authenticate(user=staff)
+
+        response = client.post('/api/books/batch-borrow/', {
+            'user': member.pk, 'books': [books[0].pk, 'isbn-1', books[2].pk, 'isbn-0', 'missing'],
+        }, format='json')
+        self.assertEqual((response.data['succeeded'], response.data['failed']), (2, 3))
+        self.assertEqual([row.get('error') for row in response.data['results']], [
+            None, None, "No copies available", "Listed more than once", "Book not found",
+        ])
+        self.assertEqual(set(Loan.objects.filter(user=member).values_list('book_id', flat=True)),
+                         {books[0].pk, books[1].pk})
+        self.assertEqual(UserStats.objects.get(user=member).borrows, 2)
+
+        services.place_hold(staff, books[0])
+        response = client.post('/api/books/batch-return/', {
+            'user': member.pk, 'books': [books[0].pk, books[1].pk, books[2].pk],
+        }, format='json')
+        self.assertEqual(response.data['succeeded'], 2)
+        self.assertEqual(Hold.objects.get(user=staff).status, Hold.Status.READY)
+        self.assertEqual(
+            list(Book.objects.order_by('pk').values_list('number_of_copies_available', flat=True)), [0, 1, 0]
+        )
+
+        client.force_authenticate(user=member)
+        response = client.post('/api/books/batch-borrow/', {'user': staff.pk, 'books': [books[1].pk]}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class IdempotencyTests(TestCase):
+    def test_retries_replay_the_first_response(self):
+        member = User.objects.create(username='member')
+        book = Book.objects.create(title="Dune", author="F", isbn="isbn-1", number_of_copies_available=2)
+        client = APIClient()
+        client.force_authenticate(user=member)
+        borrow = f'/api/books/{book.pk}/borrow/'
+
+        duplicates, original = [], services.borrow_book
+
+        def borrow_book(user, book):
+            # A retry arriving while the first attempt is still running
+            duplicates.append(client.post(borrow, HTTP_IDEMPOTENCY_KEY='k1'))
+            return original(user, book)
+
+        with mock.patch.object(services, 'borrow_book', side_effect=borrow_book):
+            first = client.post(borrow, HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual([response.status_code for response in duplicates], [409])
+
+        retry = client.post(borrow, HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual((retry.status_code, retry.content), (first.status_code, first.content))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Loan.objects.filter(user=member).count(), 1)
+        self.assertEqual(Book.objects.get(pk=book.pk).number_of_copies_available, 1)
+
+        # A key is bound to its request, and per user
+        self.assertEqual(client.post(f'/api/books/{book.pk}/return_book/', HTTP_IDEMPOTENCY_KEY='k1').status_code, 422)
+        client.force_authenticate(user=User.objects.create(username='other'))
+        self.assertNotIn('Idempotent-Replayed', client.post(borrow, HTTP_IDEMPOTENCY_KEY='k1'))
+
+
+@override_settings(LIBRARY_SYNC_OVERLAP=0)
+class DeltaSyncTests(TestCase):
+    def sync(self, client, cursor=None):
+        """Follow has_more to the end; returns (books by id, deleted ids, cursor)."""
+        books, deleted = {}, []
+        while True:
+            response = client.get('/api/books/changes/', {'since': cursor or '', 'limit': 2})
+            self.assertEqual(response.status_code, 200)
+            deleted += response.data['deleted']
+            books.update((row['id'], row) for row in response.data['books'])
+            cursor = response.data['cursor']
+            if not response.data['has_more']:
+                return books, deleted, cursor
+
+    def test_changes_since_cursor(self):
+        member = User.objects.create(username='kiosk')
+        client = APIClient()
+        client.force_authenticate(user=member)
+        dune, emma, _ = Book.objects.bulk_create(
+            Book(title=title, author="A", isbn=f"isbn-{n}") for n, title in enumerate(["Dune", "Emma", "Ulysses"])
+        )
+        books, deleted, cursor = self.sync(client)
+        self.assertEqual((len(books), deleted), (3, []))
+        self.assertEqual(self.sync(client, cursor)[:2], ({}, []))
+
+        client.post(f'/api/books/{dune.pk}/borrow/')
+        emma_id = emma.pk
+        emma.delete()
+        added = Book.objects.create(title="Beloved", author="M", isbn="isbn-9")
+        books, deleted, _ = self.sync(client, cursor)
+        self.assertEqual(set(books), {dune.pk, added.pk})
+        self.assertEqual(books[dune.pk]['number_of_copies_available'], 0)
+        self.assertEqual(deleted, [emma_id])
+        self.assertEqual(client.get('/api/books/changes/', {'since': 'bogus'}).status_code, 400)
+
+
+class AvailabilityLookupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_bulk_lookup_is_cached_until_a_borrow(self):
+        dune, emma = Book.objects.bulk_create([
+            Book(title="Dune", author="F", isbn="isbn-1", number_of_copies_available=2),
+            Book(title="Emma", author="J", isbn="isbn-2", number_of_copies_available=0),
+        ])
+        isbns = [f"isbn-{n}" for n in range(1, 1200)]
+        with override_settings(LIBRARY_AVAILABILITY_MAX_ISBNS=2000), self.assertNumQueries(3):
+            response = self.client.post('/api/books/availability/', {'isbns': isbns}, format='json')
+        self.assertEqual(len(response.data), 1199)
+        self.assertEqual((response.data['isbn-1'], response.data['isbn-2'], response.data['isbn-3']), (2, 0, None))
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/books/availability/', {'isbns': 'isbn-2, isbn-1,isbn-2,'})
+        self.assertEqual(response.data, {'isbn-2': 0, 'isbn-1': 2})
+
+        self.client.force_authenticate(user=User.objects.create(username='reader'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/books/{dune.pk}/borrow/')
+        self.assertEqual(self.client.get('/api/books/availability/', {'isbns': 'isbn-1'}).data, {'isbn-1': 1})
+
+    def test_rejects_bad_isbn_lists(self):
+        for body in ({}, {'isbns': []}, {'isbns': 'isbn-1'}, {'isbns': [1]}, {'isbns': ['a' * 14]},
+                     {'isbns': [f"isbn-{n}" for n in range(1001)]}):
+            self.assertEqual(self.client.post('/api/books/availability/', body, format='json').status_code, 400)
+        self.assertEqual(self.client.get('/api/books/availability/').status_code, 400)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRoutingTests(SimpleTestCase):
+    def test_reads_go_to_replicas_until_the_caller_writes(self):
+        factory = RequestFactory()
+        used = []
+        middleware = ReplicaMiddleware(lambda request: used.append(router.db_for_read(Book)) or HttpResponse())
+
+        def call(method, token):
+            middleware(getattr(factory, method)('/api/books/', HTTP_AUTHORIZATION=f'Token {token}'))
+            return used[-1]
+
+        self.assertEqual(call('get', 'a'), 'replica1')
+        self.assertEqual(call('post', 'a'), 'default')
+        # Read-your-writes: the writer is pinned, others are not
+        self.assertEqual(call('get', 'a'), 'default')
+        self.assertEqual(call('get', 'b'), 'replica1')
+        self.assertEqual(router.db_for_read(Book), 'default')
+        self.assertEqual(router.db_for_write(Book), 'default')
+
+
+# Outside a test transaction, so that reads are routed to the replica
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaCacheTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        # The replica is the primary's connection; lag is simulated by hand
+        connections['replica1'] = connections['default']
+        self.addCleanup(connections.__delitem__, 'replica1')
+        self.book = Book.objects.create(title="Dune", author="F", isbn="isbn-1", number_of_copies_available=2)
+        token = Token.objects.create(user=User.objects.create(username='writer'))
+        self.writer = APIClient()
+        self.writer.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def lagging_get(self, client, path, params=None):
+        """GET while the replica still has the copy count from before the borrow."""
+        Book.objects.filter(pk=self.book.pk).update(number_of_copies_available=2)
+        try:
+            return client.get(path, params)
+        finally:
+            Book.objects.filter(pk=self.book.pk).update(number_of_copies_available=1)
+
+    def test_stale_replica_reads_are_not_cached(self):
+        self.assertEqual(self.writer.post(f'/api/books/{self.book.pk}/borrow/').status_code, 200)
+        detail = f'/api/books/{self.book.pk}/'
+        stale = self.lagging_get(APIClient(), detail)
+        self.assertEqual(stale.data['number_of_copies_available'], 2)
+        availability = self.lagging_get(APIClient(), '/api/books/availability/', {'isbns': 'isbn-1'})
+        self.assertEqual(availability.data, {'isbn-1': 2})
+        # The writer is pinned to the primary and must not get the replica's answer
+        self.assertEqual(self.writer.get(detail).data['number_of_copies_available'], 1)
+        self.assertEqual(self.writer.get('/api/books/availability/', {'isbns': 'isbn-1'}).data, {'isbn-1': 1})
+
+
+@override_settings(LIBRARY_DB_LOCK_RETRIES=2)
+class LockRetryTests(SimpleTestCase):
+    def test_lock_errors_are_retried_a_bounded_number_of_times(self):
+        calls = []
+
+        @retry_on_lock
+        def write(failures, message='database is locked'):
+            calls.append(1)
+            if len(calls) <= failures:
+                raise OperationalError(message)
+            return 'done'
+
+        with mock.patch('library.db_retry.time.sleep'):
+            self.assertEqual(write(2), 'done')
+            self.assertEqual(len(calls), 3)
+            calls.clear()
+            self.assertRaises(OperationalError, write, 3)
+            self.assertEqual(len(calls), 3)
+            calls.clear()
+            self.assertRaises(OperationalError, write, 1, 'no such table: library_book')
+            self.assertEqual(len(calls), 1)
+
+
+class AnalyticsTests(TestCase):
+    def test_live_counters_match_a_rebuild(self):
+        members = [User.objects.create(username=f"member-{n}") for n in range(3)]
+        books = Book.objects.bulk_create(
+            Book(title=f"Book {n}", author="A", isbn=f"isbn-{n}", number_of_copies_available=5) for n in range(2)
+        )
+        for member in members:
+            services.borrow_book(member, books[0])
+        services.borrow_book(members[0], books[1])
+        services.return_book(members[1], books[0])
+
+        def snapshot():
+            return [
+                list(model.objects.order_by(*order).values(*fields))
+                for model, order, fields in (
+                    (BookDailyStats, ['book', 'day'], ['book', 'day', 'borrows', 'returns']),
+                    (UserStats, ['user'], ['user', 'borrows', 'returns', 'last_borrowed_at']),
+                )
+            ]
+        live = snapshot()
+        for _ in analytics.rebuild(chunk_size=2):
+            pass
+        self.assertEqual(snapshot(), live)
+
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create(username='staff', is_staff=True))
+        top = client.get('/api/analytics/top-books/', {'days': 7}).data
+        self.assertEqual([(row['book_id'], row['borrows']) for row in top], [(books[0].pk, 3), (books[1].pk, 1)])
+        daily = client.get('/api/analytics/daily/').data
+        self.assertEqual((len(daily), daily[-1]['borrows'], daily[-1]['returns']), (30, 4, 1))
+        for params in ({'since': 'last week'}, {'until': '2025-02-30'}, {'since': '2025-03-01', 'until': '2025-02-01'}):
+            self.assertEqual(client.get('/api/analytics/daily/', params).status_code, 400)
+
+
+class AdminChangelistTests(TestCase):
+    def test_searched_changelist_uses_indexed_lookups(self):
+        admin_user = User.objects.create(username='root', is_staff=True, is_superuser=True)
+        reader = User.objects.create(username='reader')
+        books = Book.objects.bulk_create(
+            Book(title=title, author="A", isbn=f"isbn-{n}") for n, title in enumerate(["Silver Storm", "Glass City"])
+        )
+        Loan.objects.create(user=reader, book=books[0])
+        Loan.objects.create(user=admin_user, book=books[1])
+        self.client.force_login(admin_user)
+
+        # Session, user, capped count, page: no full COUNT(*) and no icontains
+        with self.assertNumQueries(4):
+            response = self.client.get('/admin/library/loan/', {'q': 'silver'})
+        self.assertEqual([loan.book for loan in response.context['cl'].result_list], [books[0]])
+        response = self.client.get('/admin/library/loan/', {'q': 'rea', 'returned__exact': '0'})
+        self.assertEqual([loan.user for loan in response.context['cl'].result_list], [reader])
+
+    @mock.patch.object(LoanAdmin, 'list_per_page', 1)
+    @mock.patch.object(ChangelistPaginator, 'count_limit', 2)
+    def test_capped_count_keeps_every_page_reachable(self):
+        admin_user = User.objects.create(username='root', is_staff=True, is_superuser=True)
+        books = Book.objects.bulk_create(Book(title=f"Book {n}", author="A", isbn=f"isbn-{n}") for n in range(5))
+        Loan.objects.bulk_create(Loan(user=admin_user, book=book) for book in books)
+        self.client.force_login(admin_user)
+
+        for page, shown in ((1, '2+ loans'), (3, '4+ loans'), (5, '5 loans')):
+            response = self.client.get('/admin/library/loan/', {'returned__exact': '0', 'p': page})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.context['cl'].result_list), 1)
+            self.assertContains(response, shown)
+            if page < 5:
+                self.assertContains(response, f'?p={page + 1}&amp;returned__exact=0')
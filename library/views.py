@@ -1,17 +1,46 @@
-from rest_framework import viewsets, permissions, status
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_date
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
-from django.utils import timezone
 
-from .models import Book, User, Loan   # ✅ FIXED
-from .serializers import BookSerializer, UserSerializer, LoanSerializer
+from . import analytics, exports, importers, services, sync
+from .caching import CatalogCacheMixin, availability_by_isbn, stats as catalog_cache_stats
+from .idempotency import IdempotencyMixin
+from .models import ArchivedLoan, Book, Hold, User, Loan   # ✅ FIXED
+from .serializers import (
+    BookSerializer, HoldSerializer, UserSerializer, LoanSerializer, loan_values, flat_loan, narrow_queryset,
+    archived_loan_values, flat_archived_loan,
+)
+from .pagination import BookPagination, LoanPagination
 from .permissions import IsAdminOrReadOnly, IsAdmin, IsOwnerOrAdmin
+from .search import CatalogSearchFilter
+
+
+class SparseFieldsMixin:
+    """
+    List and detail requests load only the columns their `?fields=` and
+    `?expand=` selection renders, plus `keep_columns` (read by paging).
+    """
+    keep_columns = ()
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action in ('list', 'retrieve'):
+            queryset = narrow_queryset(queryset, self.get_serializer(), self.keep_columns)
+        return queryset
 
 
 # ---------------------------
 # User ViewSet
 # ---------------------------
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(IdempotencyMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
 
@@ -28,60 +57,341 @@ class UserViewSet(viewsets.ModelViewSet):
 # ---------------------------
 # Book ViewSet
 # ---------------------------
-class BookViewSet(viewsets.ModelViewSet):
+class BookViewSet(IdempotencyMixin, CatalogCacheMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
     permission_classes = [IsAdminOrReadOnly]
+    pagination_class = BookPagination
+    filter_backends = [DjangoFilterBackend, CatalogSearchFilter, filters.OrderingFilter]
     filterset_fields = ['author', 'isbn']
     search_fields = ['title', 'author', 'isbn']
+    keep_columns = ['title']
+    MAX_BATCH = 100
 
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def borrow(self, request, pk=None):
         book = self.get_object()
-        user = request.user
 
-        # Check availability
-        if book.copies_available <= 0:
-            return Response({"error": "No copies available"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            services.borrow_book(request.user, book)
+        except services.LoanError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Check if user already borrowed this book
-        if Loan.objects.filter(user=user, book=book, returned_at__isnull=True).exists():  # ✅ FIXED
-            return Response({"error": "You already borrowed this book"}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Borrow book
-        Loan.objects.create(user=user, book=book, loan_date=timezone.now())  # ✅ FIXED
-        book.copies_available -= 1
-        book.save()
         return Response({"message": f"You borrowed '{book.title}'"}, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def return_book(self, request, pk=None):
         book = self.get_object()
-        user = request.user
 
-        record = Loan.objects.filter(user=user, book=book, returned_at__isnull=True).first()  # ✅ FIXED
-        if not record:
-            return Response({"error": "You have not borrowed this book"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            services.return_book(request.user, book)
+        except services.LoanError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Return book
-        record.returned_at = timezone.now()  # ✅ FIXED
-        record.save()
-        book.copies_available += 1
-        book.save()
         return Response({"message": f"You returned '{book.title}'"}, status=status.HTTP_200_OK)
 
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def hold(self, request, pk=None):
+        """Join the waitlist; the next returned copy is set aside for you."""
+        book = self.get_object()
+
+        try:
+            hold = services.place_hold(request.user, book)
+        except services.LoanError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(HoldSerializer(hold).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def cancel_hold(self, request, pk=None):
+        book = self.get_object()
+
+        try:
+            services.cancel_hold(request.user, book)
+        except services.LoanError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"message": f"You cancelled your hold on '{book.title}'"}, status=status.HTTP_200_OK)
+
+    def run_batch(self, request, service, verb):
+        """
+        Shared by the desk batch actions. Body: {"books": [ids or ISBNs]},
+        plus "user" (an id) for staff acting on a member's behalf.
+        """
+        items = request.data.get('books')
+        if (not isinstance(items, list) or not items or len(items) > self.MAX_BATCH
+                or not all(isinstance(item, (int, str)) and not isinstance(item, bool) for item in items)):
+            return Response({"error": f"books must be a list of 1 to {self.MAX_BATCH} book ids or ISBNs"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        user = request.user
+        if request.data.get('user') is not None:
+            if not user.is_staff:
+                return Response({"error": "Only staff can act for another user"}, status=status.HTTP_403_FORBIDDEN)
+            user_id = request.data['user']
+            user = User.objects.filter(pk=user_id).first() if str(user_id).isdigit() else None
+            if user is None:
+                return Response({"error": "User not found"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            results = service(user, items)
+        except services.LoanError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = []
+        for item, book, error in results:
+            row = {"item": item, "book": book.pk if book else None}
+            if error is None:
+                row.update(ok=True, message=f"{verb} '{book.title}'")
+            else:
+                row.update(ok=False, error=error)
+            rows.append(row)
+        done = sum(row['ok'] for row in rows)
+        return Response({"succeeded": done, "failed": len(rows) - done, "results": rows}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='batch-borrow', permission_classes=[permissions.IsAuthenticated])
+    def batch_borrow(self, request):
+        """Borrow a stack of books in one transaction; each is reported on separately."""
+        return self.run_batch(request, services.borrow_books, "Borrowed")
+
+    @action(detail=False, methods=['post'], url_path='batch-return', permission_classes=[permissions.IsAuthenticated])
+    def batch_return(self, request):
+        """Return a stack of books in one transaction; each is reported on separately."""
+        return self.run_batch(request, services.return_books, "Returned")
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """
+        Books changed or deleted since `since` (a cursor from an earlier
+        call; omit it for a full download), up to `limit` rows (default
+        1000). Repeat with the returned cursor while `has_more` is true.
+        """
+        try:
+            limit = int(request.query_params.get('limit', 1000))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= 10_000:
+            return Response({"error": "limit must be between 1 and 10000"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            return Response(sync.changes_since(request.query_params.get('since') or None, limit))
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get', 'post'], permission_classes=[permissions.AllowAny])
+    def availability(self, request):
+        """
+        Copies available per ISBN: {"isbn": copies}, null for unknown ISBNs.
+        Send the ISBNs as `?isbns=a,b,c` or as a POST body {"isbns": [...]}.
+        """
+        if request.method == 'POST':
+            isbns = request.data.get('isbns')
+        else:
+            isbns = request.query_params.get('isbns', '').split(',')
+        limit = settings.LIBRARY_AVAILABILITY_MAX_ISBNS
+        if not isinstance(isbns, list) or not all(isinstance(isbn, str) for isbn in isbns):
+            isbns = []
+        isbns = [isbn for isbn in dict.fromkeys(isbn.strip() for isbn in isbns) if isbn]
+        if (not isbns or len(isbns) > limit
+                or not all(len(isbn) <= 13 and not any(char.isspace() for char in isbn) for isbn in isbns)):
+            return Response({"error": f"isbns must be a list of 1 to {limit} ISBNs"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(availability_by_isbn(isbns))
+
+    @action(detail=False, methods=['post'], url_path='import', permission_classes=[IsAdmin],
+            parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        """
+        Import a CSV or NDJSON catalog uploaded as `file`.
+        Optional fields: `file_format`, `batch_size`, `upsert`.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "Upload a CSV or NDJSON file as 'file'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        fmt = request.data.get('file_format') or importers.guess_format(upload.name)
+        if fmt not in importers.FORMATS:
+            return Response({"error": f"Unsupported format '{fmt}'"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            batch_size = max(1, int(request.data.get('batch_size', 1000)))
+        except ValueError:
+            return Response({"error": "batch_size must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        upsert = request.data.get('upsert') in ('1', 'true')
+
+        report = importers.import_books(importers.iter_rows(upload, fmt), batch_size=batch_size, upsert=upsert)
+        return Response(report.as_dict(), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='cache-stats', permission_classes=[IsAdmin])
+    def cache_stats(self, request):
+        """Hit rate of this worker's catalog response cache."""
+        return Response(catalog_cache_stats.as_dict())
+
+
+# ---------------------------
+# Hold ViewSet
+# ---------------------------
+class HoldViewSet(SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
+    serializer_class = HoldSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['status', 'book']
+
+    def get_queryset(self):
+        holds = Hold.objects.order_by('-created_at', '-id')
+        if self.request.user.is_staff:
+            return holds
+        return holds.filter(user=self.request.user)
+
 
 # ---------------------------
 # Loan ViewSet
 # ---------------------------
-class LoanViewSet(viewsets.ReadOnlyModelViewSet):  # ✅ Renamed for clarity
+class LoanViewSet(SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):  # ✅ Renamed for clarity
     serializer_class = LoanSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = LoanPagination
+    filterset_fields = ['returned', 'overdue']
+    keep_columns = ['loan_date']
 
     def get_queryset(self):
-        user = self.request.user
-        # Admins can see all records
-        if user.is_staff:
-            return Loan.objects.all()  # ✅ FIXED
-        # Members only see their own history
-        return Loan.objects.filter(user=user)  # ✅ FIXED
+        # Newest first, matching the (loan_date, id) index used for paging.
+        # The nested user and book come from the same query.
+        return self.scope(Loan.objects.select_related('user', 'book').order_by('-loan_date', '-id'))
+
+    def list(self, request, *args, **kwargs):
+        # ?flat=true serializes straight from .values() rows
+        if request.query_params.get('flat') not in ('1', 'true'):
+            return super().list(request, *args, **kwargs)
+        if 'fields' in request.query_params or 'expand' in request.query_params:
+            # The flat rows always carry the full nested shape
+            return Response({"error": "flat=true cannot be combined with fields or expand"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = loan_values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response([flat_loan(row) for row in page])
+        return Response([flat_loan(row) for row in queryset])
+
+    def scope(self, queryset):
+        # Admins can see all records, members only their own history
+        if self.request.user.is_staff:
+            return queryset
+        return queryset.filter(user=self.request.user)
+
+    @action(detail=False, methods=['get'])
+    def archived(self, request):
+        """
+        Loan history moved out of the live table by `sweep_loans --archive-days`,
+        newest first, paginated like the loan list. Each entry's `source` is
+        'loan' or 'borrow_record' and `id` is its id in that table.
+        """
+        queryset = archived_loan_values(self.scope(ArchivedLoan.objects.order_by('-loan_date', '-id')))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response([flat_archived_loan(row) for row in page])
+        return Response([flat_archived_loan(row) for row in queryset])
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream every visible loan as NDJSON (default) or CSV.
+        Query params: `file_format`, `since`, `until` (ISO dates),
+        `archived=true` to merge in archived history and, for admins, `user`.
+        """
+        fmt = request.query_params.get('file_format', 'ndjson')
+        if fmt not in exports.FORMATS:
+            return Response({"error": f"Unsupported format '{fmt}'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        filters = {}
+        for param, lookup in (('since', 'loan_date__gte'), ('until', 'loan_date__lt')):
+            value = request.query_params.get(param)
+            if value:
+                parsed = parse_datetime(value) or parse_date(value)
+                if parsed is None:
+                    return Response({"error": f"Invalid date for '{param}'"}, status=status.HTTP_400_BAD_REQUEST)
+                if not isinstance(parsed, datetime):
+                    parsed = datetime.combine(parsed, time.min)
+                # Dates and naive times are in the server's time zone
+                filters[lookup] = timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+        user_id = request.query_params.get('user')
+        if user_id:
+            if not user_id.isdigit():
+                return Response({"error": "user must be an id"}, status=status.HTTP_400_BAD_REQUEST)
+            # Members are already scoped to themselves
+            filters['user_id'] = user_id
+
+        queryset = self.get_queryset().filter(**filters)
+        archived = None
+        if request.query_params.get('archived') in ('1', 'true'):
+            archived = self.scope(ArchivedLoan.objects.order_by('-loan_date', '-id')).filter(**filters)
+        chunks = exports.iter_export(queryset, fmt, archived=archived)
+        if settings.SERVE_ASGI:
+            # A sync iterator would be read into memory whole before sending
+            chunks = exports.aiter_chunks(chunks)
+        response = StreamingHttpResponse(chunks, content_type=exports.FORMATS[fmt])
+        response['Content-Disposition'] = f'attachment; filename="loans.{fmt}"'
+        return response
+
+
+# ---------------------------
+# Analytics ViewSet
+# ---------------------------
+class AnalyticsViewSet(viewsets.ViewSet):
+    """Circulation statistics for staff, served from the rollup tables."""
+    permission_classes = [IsAdmin]
+    MAX_DAYS = 366
+
+    def int_param(self, name, default, maximum):
+        value = self.request.query_params.get(name, default)
+        if not str(value).isdigit() or not 1 <= int(value) <= maximum:
+            raise ValueError(f"{name} must be between 1 and {maximum}")
+        return int(value)
+
+    def date_param(self, name, default):
+        value = self.request.query_params.get(name)
+        if not value:
+            return default
+        try:
+            parsed = parse_date(value)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise ValueError(f"{name} must be a date (YYYY-MM-DD)")
+        return parsed
+
+    @action(detail=False, methods=['get'], url_path='top-books')
+    def top_books(self, request):
+        """Most borrowed books over the last `days` (default 30); `limit` rows (default 10)."""
+        try:
+            days = self.int_param('days', 30, self.MAX_DAYS)
+            limit = self.int_param('limit', 10, 100)
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(analytics.top_books(days, limit))
+
+    @action(detail=False, methods=['get'])
+    def daily(self, request):
+        """
+        Borrows and returns per day between `since` and `until` (ISO
+        dates, default the last 30 days), for all books or one `book`.
+        """
+        try:
+            until = self.date_param('until', timezone.localdate())
+            since = self.date_param('since', until - timedelta(days=29))
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if since > until or (until - since).days >= self.MAX_DAYS:
+            return Response({"error": f"since must be before until and at most {self.MAX_DAYS} days earlier"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        book_id = request.query_params.get('book')
+        if book_id and not book_id.isdigit():
+            return Response({"error": "book must be an id"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(analytics.daily_series(since, until, int(book_id) if book_id else None))
+
+    @action(detail=False, methods=['get'], url_path='top-users')
+    def top_users(self, request):
+        """Members with the most borrows overall; `limit` rows (default 10)."""
+        try:
+            limit = self.int_param('limit', 10, 100)
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(analytics.top_users(limit))